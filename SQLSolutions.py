@@ -1,182 +1,289 @@
 """This file contains my solutions about some SQL queries
-    using the famous painting database"""
-
-from sqlalchemy import create_engine, text
+using the famous painting database"""
+
+import argparse
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import pandas as pd
+from sqlalchemy import Integer, String, bindparam, text
+from sqlalchemy.dialects import mysql
+from sqlalchemy.types import TypeEngine
+import metrics
+from result_cache import (
+    ResultCache,
+    bump_versions,
+    dependent_tables,
+    normalize_sql,
+    referenced_tables,
+    table_versions,
+)
+from profiler import profile_queries, write_report
+from backends import DuckDBBackend, PandasBackend, bind_names
+from deduplication import deduplication_statements, tables_with_duplicates
+from vectorized import same_result
+from summaries import fresh_statements, refresh_summaries, summaries
+from prepared import execute_prepared
+from database import make_engine
 from configuration.config import (
-    DATABASE_USER,
-    DATABASE_PASSWORD,
-    DATABASE_HOST,
-    DATABASE_PORT,
-    DATABASE_NAME,
+    DATA_DIR,
+    DUCKDB_PATH,
+    QUERY_WORKERS,
 )
 
 
-# Create a database connection with SQLAlchemy (MySQL Server 8.0)
-engine = create_engine(
-    f"mysql+mysqlconnector://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
-)
-conn = engine.connect()  # Connection to the database
+@dataclass(frozen=True)
+class Param:
+    """A typed bind parameter of a solution (:name in its SQL) and its default value"""
+
+    name: str
+    type: TypeEngine
+    default: object
+
+
+@dataclass(frozen=True)
+class Query:
+    """A question about the famous painting database and my SQL solution.
+
+    read_only is False for the solutions which modify the database
+    (they are only run when explicitly allowed). The values the question
+    depends on (top N, country, ...) are bind parameters of the SQL, with
+    the values of the question as defaults.
+    """
+
+    id: int
+    question: str
+    sql: str
+    read_only: bool = True
+    params: tuple = ()
+
+    @property
+    def statements(self):
+        """The SQL statements of the solution, without the comment-only ones"""
+        statements = []
+        for statement in self.sql.split(";"):
+            code = [
+                line
+                for line in statement.strip().splitlines()
+                if not line.strip().startswith("#")
+            ]
+            if any(line.strip() for line in code):
+                statements.append(statement.strip())
+        return statements
+
+    def arguments(self, values=None):
+        """Return the values of the parameters: the defaults overridden by values.
+
+        The values can be strings (e.g. from a command line), they are
+        converted to the type of their parameter.
+        """
+        params = {param.name: param for param in self.params}
+        unknown = set(values or {}) - set(params)
+        if unknown:
+            raise KeyError(f"Query {self.id} has no parameters {sorted(unknown)}")
+        arguments = {name: param.default for name, param in params.items()}
+        for name, value in (values or {}).items():
+            arguments[name] = params[name].type.python_type(value)
+        return arguments
+
+    def bind(self, statement):
+        """Return a statement of the solution with its typed bind parameters"""
+        types = {param.name: param.type for param in self.params}
+        return text(statement).bindparams(
+            *[bindparam(name, type_=types[name]) for name in bind_names(statement)]
+        )
+
+    def inline(self, statement, values=None):
+        """Return a statement of the solution with the values of its parameters
+        written as literals (e.g. to explain it)"""
+        arguments = self.arguments(values)
+        bound = self.bind(statement).bindparams(
+            **{name: arguments[name] for name in bind_names(statement)}
+        )
+        return str(
+            bound.compile(
+                dialect=mysql.dialect(paramstyle="named"),
+                compile_kwargs={"literal_binds": True},
+            )
+        )
+
+
+# Registry of the solutions, by query id
+queries = {}
+
+
+def register(query):
+    """Add a query to the registry, refusing duplicated ids or SQL texts"""
+    if query.id in queries:
+        raise ValueError(f"Query {query.id} is defined twice")
+    for other in queries.values():
+        if normalize_sql(other.sql) == normalize_sql(query.sql):
+            raise ValueError(f"Query {query.id} has the same SQL as Query {other.id}")
+    queries[query.id] = query
+    return query
 
 
 # ------------- Query 1 -------------
-# Fetch all the paintings which are not displayed on any museums
-query1 = conn.execute(
-    text(
+register(
+    Query(
+        1,
+        "Fetch all the paintings which are not displayed on any museums",
         """
         select distinct name from work
         where museum_id is null;
-        """
+        """,
     )
 )
 
 # ------------- Query 2 -------------
-# Are there museums without any paintings ?
-query2 = conn.execute(
-    text(
-        """
-        select distinct museum_id from museum
-        where museum_id NOT IN (select distinct museum_id from work);
-        """
+# A NOT EXISTS anti-join: unlike NOT IN, it isn't emptied by the paintings
+# without a museum (a NULL museum_id)
+register(
+    Query(
+        2,
+        "Are there museums without any paintings ?",
+        """
+        select museum_id from museum
+        where not exists (select 1 from work where work.museum_id = museum.museum_id);
+        """,
     )
 )
 
 # ------------- Query 3 -------------
-# How many paintings have an asking price of more than their regular price ?
-query3 = conn.execute(
-    text(
+# sale_above_regular is generated by the server from the prices (see schema.py)
+register(
+    Query(
+        3,
+        "How many paintings have an asking price of more than their regular price ?",
         """
         select distinct work_id from product_size
-        where sale_price > regular_price;
-        """
+        where sale_above_regular = true;
+        """,
     )
 )
 
 # ------------- Query 4 -------------
-# Identify the paintings whose asking price is less than 50% of its regular price
-query4 = conn.execute(
-    text(
+# sale_below_half is generated by the server from the prices (see schema.py),
+# so the 50% of the question is part of the schema
+register(
+    Query(
+        4,
+        (
+            "Identify the paintings whose asking price is less than 50% of its "
+            "regular price"
+        ),
         """
         select distinct name from product_size as ps
         join work as w
         where (ps.work_id = w.work_id
-        and sale_price < 0.5*regular_price);
-        """
+        and ps.sale_below_half = true);
+        """,
     )
 )
 
 # ------------- Query 5 -------------
-# Which canva size costs the most ?
-query5 = conn.execute(
-    text(
+register(
+    Query(
+        5,
+        "Which canva size costs the most ?",
         """
         select distinct cs.size_id, sale_price from canvas_size as cs
         join product_size as ps
         where (cs.size_id = ps.size_id)
         order by sale_price desc
         limit 1;
-        """
+        """,
     )
 )
 
 
 # ------------- Query 6 -------------
-# Delete duplicate records from work, product_size,
-# subject and image_link tables
-
-# Here's my solution for the table product_size. The same logic applies to the other tables.
-# Of course, you'll need to check for duplicates.
-# This can be done by checking whether the following number is
-# greater than 0 or not (only if the table has no primary key !):
+# For each table, the distinct rows are written to a staging table in a single
+# pass (DISTINCT considers NULLs as equal, so rows with NULLs are handled too),
+# then the staging table replaces the table in one atomic RENAME TABLE.
+# See deduplication.py to deduplicate on a subset of columns, or while loading.
+# You can check for duplicates with the following query:
 # select (select count(*) as cnt from table_name) - (select count(*) cnt_distinct from (select distinct * from table_name) x) as diff;
-query6 = conn.execute(
-    text(
-        """
-        create table product_size_no_duplicate as
-
-            select ps1.work_id, ps1.size_id, ps1.sale_price, ps1.regular_price
-            from (select *, row_number() over (partition by work_id, size_id, sale_price, regular_price) as rn
-            from product_size) as ps1
-
-            join
-
-            (select *, row_number() over (partition by work_id, size_id, sale_price, regular_price)  as rn
-            from product_size) as ps2
-
-            on (ps1.work_id = ps2.work_id
-            and ps1.size_id = ps2.size_id
-            and ps1.sale_price = ps2.sale_price
-            and ps1.regular_price = ps2.regular_price
-            and (ps1.rn=1 and ps2.rn=1));
-
-        delete from product_size;
-
-        insert into product_size
-        select * from product_size_no_duplicate;
-
-        drop table product_size_no_duplicate;
-    """
+register(
+    Query(
+        6,
+        (
+            "Delete duplicate records from work, product_size, subject and "
+            "image_link tables"
+        ),
+        "\n".join(
+            f"{statement};"
+            for table in tables_with_duplicates
+            for statement in deduplication_statements(table)
+        ),
+        read_only=False,
     )
 )
 
-# NOTE:
-# If the code above doesn't give exactly the right number of rows,
-# it's because at least one column contains NULLs. Simply replace
-# them with another value, such as -99.
-
 
 # ------------- Query 7 -------------
-# Identify the museums with invalid city information in the given dataset
-
-# For this question, I used regular expressions to retrieve
-# lines containing numeric characters for the 'city' column
-query7 = conn.execute(
-    text(
-        """"
-        select * from museum
-         where regexp_like(city, '^[0-9]+$');  # '^[0-9]+$' means a string containing only numbers
-        """
+# For this question, the server flags the lines containing only numeric
+# characters in the 'city' column with a regular expression (invalid_city is
+# a generated column, see schema.py)
+register(
+    Query(
+        7,
+        "Identify the museums with invalid city information in the given dataset",
+        """
+        select museum_id, name, address, city, state, postal, country, phone, url
+        from museum
+        where invalid_city = true;  # city matches '^[0-9]+$' (a string containing only numbers)
+        """,
     )
 )
 
 # ------------- Query 8 -------------
-# Museum_Hours table has 1 invalid entry. Identify it and remove it.
-
-query8 = conn.execute(
-    text(
-        """"
+# The opening times are parsed by the loader (see normalization.py), and the
+# invalid ones flagged by the server (invalid_open_time is a generated column,
+# see schema.py)
+register(
+    Query(
+        8,
+        "Museum_Hours table has 1 invalid entry. Identify it and remove it.",
+        """
         delete from museum_hours
-        where open >= str_to_date('12:01:PM','%h:%i:%p');
-    """
+        where invalid_open_time = true;
+    """,
+        read_only=False,
     )
 )
 
 # ------------- Query 9 -------------
-# Fetch the top 10 most famous painting subject
-
-query9 = conn.execute(
-    text(
-        """"
+register(
+    Query(
+        9,
+        "Fetch the top 10 most famous painting subject",
+        """
         select subject, count(subject) as cnt_subject from subject
         group by subject
         order by cnt_subject desc
-        limit 10;
-    """
+        limit :n;
+    """,
+        params=(Param("n", Integer(), 10),),
     )
 )
 
 # ------------- Query 10 -------------
-# Identify the museums which are open on both Sunday and Monday
-# Display museum name, city
-
 # The idea is to create a column worth 1 when the museum is open
 # on Monday and/or Sunday (0 otherwise), and to group the data
 # by museum by summing this column
-query10 = conn.execute(
-    text(
+register(
+    Query(
+        10,
+        (
+            "Identify the museums which are open on both Sunday and Monday. Display "
+            "museum name, city"
+        ),
         """
         with
             museum_1 as (select museum_id,
-                case when day in ('Sunday', 'Monday') then 1
+                case when day_of_week in (:first_day, :second_day) then 1
                 else 0 end as top_sunday_monday
                 FROM museum_hours),
 
@@ -189,162 +296,86 @@ query10 = conn.execute(
         museum as m
         on (m2.museum_id=m.museum_id)
         where open_sunday_monday = 2;
-    """
+    """,
+        # Days of the week: 1 = Sunday, 2 = Monday, ... (see normalization.py)
+        params=(Param("first_day", Integer(), 1), Param("second_day", Integer(), 2)),
     )
 )
 
 # ------------- Query 11 -------------
-#  How many museums are open every single day ?
-
-query11 = conn.execute(
-    text(
+register(
+    Query(
+        11,
+        "How many museums are open every single day ?",
         """
         select count(*) as cnt_open_every_day from(
-            select museum_id, count(day) as cnt_day from museum_hours
+            select museum_id, count(day_of_week) as cnt_day from museum_hours
             group by museum_id
             having cnt_day = 7
         ) x;
-        """
+        """,
     )
 )
 
 # ------------- Query 12 -------------
-# Which are the top 5 most popular museum ? (Popularity is defined based on most
-# no of paintings in a museum)
-
-query12 = conn.execute(
-    text(
+# The paintings are counted by the loader (see summaries.py)
+register(
+    Query(
+        12,
+        (
+            "Which are the top 5 most popular museum ? (Popularity is defined based "
+            "on most no of paintings in a museum)"
+        ),
         """
         select top_5_museum.museum_id, top_5_museum.cnt_paintings, m.name,  m.city
 
-        from (select museum_id, count(name) as cnt_paintings from work
+        from (select museum_id, cnt_paintings from summary_work_by_museum
         where museum_id is not null
-        group by museum_id
         order by cnt_paintings desc
-        limit 5) as top_5_museum
+        limit :n) as top_5_museum
 
         join
 
         museum as m
 
         on (top_5_museum.museum_id = m.museum_id);
-        """
+        """,
+        params=(Param("n", Integer(), 5),),
     )
 )
 
 # ------------- Query 13 -------------
-# Who are the top 5 most popular artist ? (Popularity is defined based on most no of
-# paintings done by an artist)
-
-query13 = conn.execute(
-    text(
+# The paintings are counted by the loader (see summaries.py)
+register(
+    Query(
+        13,
+        (
+            "Who are the top 5 most popular artist ? (Popularity is defined based "
+            "on most no of paintings done by an artist)"
+        ),
         """
         select top_5_artist.artist_id, top_5_artist.cnt_paintings,
         a.full_name, a.nationality, a.style
 
-        from (select artist_id, count(name) as cnt_paintings from work
-        group by artist_id
+        from (select artist_id, cnt_paintings from summary_work_by_artist
         order by cnt_paintings desc
-        limit 5) as top_5_artist
+        limit :n) as top_5_artist
 
         join
 
         artist as a
 
         on (top_5_artist.artist_id = a.artist_id);
-        """
-    )
-)
-
-# ------------- Query 14 -------------
-# Display the 3 least popular canva sizes
-
-query14 = conn.execute(
-    text(
-        """
-        with count_work_by_size as (
-            select size_id, count(work_id) as cnt_work from product_size
-            where size_id = round(size_id)  # size_id has to be an integer
-            group by size_id),
-
-            count_rnk as (
-            select *, dense_rank() over(order by cnt_work asc) as rnk from count_work_by_size)
-
-        select * from count_rnk as cr
-        where cr.rnk <= 3;  # We keep only ranks below 3
-        """
-    )
-)
-
-
-# ------------- Query 15 -------------
-# Which museum is open for the longest during a day. Dispay museum name, state
-# and hours open and which day ?
-
-# We start by calculating how long each museum is open on different days
-# Then we create a column of rank to select the museum with the longest opening day
-query15 = conn.execute(
-    text(
-        """
-        with museum_hours_1 as (select museum_id, day, open, close,
-                         str_to_date(close,'%h:%i:%p') - str_to_date(open,'%h:%i:%p') as duration_in_hour
-                         from museum_hours),
-
-            museum_hours_2 as (select *,
-                         rank() over (order by duration_in_hour desc) as rnk
-                         from museum_hours_1)
-
-        select name, state as city, day, open, close,
-               duration_in_hour as 'duration_in_hour (hh mi ss)'
-        from museum_hours_2 as m2
-        join museum as m
-        on (m.museum_id = m2.museum_id)
-
-        where rnk = 1;  # We keep the longest day
-    """
-    )
-)
-
-# ------------- Query 16 -------------
-# Which museum has the most no of most popular painting style ?
-
-# We start by calculating the most popular style
-# Then we find out which museum exhibits the most paintings in this style
-query16 = conn.execute(
-    text(
-        """
-        with most_pop_painting as (
-                    select style from (
-                    select style, count(name) as cnt_style from work
-                    group by style
-                    order by cnt_style desc
-                    limit 1) as x),
-
-            museum_most_pop_painting as (
-                    select museum_id, count(*) as cnt_most_pop_painting, min(style) as style from work
-                    where style in (select style from most_pop_painting) and museum_id is not null
-                    group by museum_id
-                    order by cnt_most_pop_painting desc
-                    limit 1)
-
-        select m.museum_id, m.name, m.city, museum_most_pop_painting.style,
-        museum_most_pop_painting.cnt_most_pop_painting
-
-        from museum_most_pop_painting
-        join
-        museum as m
-
-        on (museum_most_pop_painting.museum_id = m.museum_id);
-    """
+        """,
+        params=(Param("n", Integer(), 5),),
     )
 )
 
-
 # ------------- Query 14 -------------
-# Display the 3 least popular canva sizes
-
-query14 = conn.execute(
-    text(
+register(
+    Query(
+        14,
+        "Display the 3 least popular canva sizes",
         """
         with count_work_by_size as (
             select size_id, count(work_id) as cnt_work from product_size
@@ -355,59 +386,59 @@ query14 = conn.execute(
             select *, dense_rank() over(order by cnt_work asc) as rnk from count_work_by_size)
 
         select * from count_rnk as cr
-        where cr.rnk <= 3;  # We keep only ranks below 3
-        """
+        where cr.rnk <= :n;  # We keep only the n lowest ranks
+        """,
+        params=(Param("n", Integer(), 3),),
     )
 )
 
 
 # ------------- Query 15 -------------
-# Which museum is open for the longest during a day. Dispay museum name, state
-# and hours open and which day ?
-
-# We start by calculating how long each museum is open on different days
-# Then we create a column of rank to select the museum with the longest opening day
-query15 = conn.execute(
-    text(
-        """
-        with museum_hours_1 as (select museum_id, day, open, close,
-                         str_to_date(close,'%h:%i:%p') - str_to_date(open,'%h:%i:%p') as duration_in_hour
-                         from museum_hours),
-
-            museum_hours_2 as (select *,
-                         rank() over (order by duration_in_hour desc) as rnk
-                         from museum_hours_1)
+# How long each museum is open on each day is computed by the loader
+# (see normalization.py), we create a column of rank to select the museum
+# with the longest opening day
+register(
+    Query(
+        15,
+        (
+            "Which museum is open for the longest during a day. Dispay museum name, "
+            "state and hours open and which day ?"
+        ),
+        """
+        with museum_hours_2 as (select museum_id, day, open, close, open_duration,
+                         rank() over (order by open_duration desc) as rnk
+                         from museum_hours)
 
         select name, state as city, day, open, close,
-               duration_in_hour as 'duration_in_hour (hh mi ss)'
+               open_duration as 'duration_in_hour (hh mi ss)'
         from museum_hours_2 as m2
         join museum as m
         on (m.museum_id = m2.museum_id)
 
         where rnk = 1;  # We keep the longest day
-    """
+    """,
     )
 )
 
 # ------------- Query 16 -------------
-# Which museum has the most no of most popular painting style ?
-
 # We start by calculating the most popular style
 # Then we find out which museum exhibits the most paintings in this style
-query16 = conn.execute(
-    text(
+# (the paintings are counted by the loader, see summaries.py)
+register(
+    Query(
+        16,
+        "Which museum has the most no of most popular painting style ?",
         """
         with most_pop_painting as (
                     select style from (
-                    select style, count(name) as cnt_style from work
-                    group by style
-                    order by cnt_style desc
+                    select style from summary_work_by_style
+                    order by cnt_paintings desc
                     limit 1) as x),
 
             museum_most_pop_painting as (
-                    select museum_id, count(*) as cnt_most_pop_painting, min(style) as style from work
+                    select museum_id, cnt_work as cnt_most_pop_painting, style
+                    from summary_work_by_museum_style
                     where style in (select style from most_pop_painting) and museum_id is not null
-                    group by museum_id
                     order by cnt_most_pop_painting desc
                     limit 1)
 
@@ -419,51 +450,44 @@ query16 = conn.execute(
         museum as m
 
         on (museum_most_pop_painting.museum_id = m.museum_id);
-    """
+    """,
     )
 )
 
 # ------------- Query 17 -------------
-# Identify the artists whose paintings are displayed in multiple countries
-
 # We calculate the number of countries in which each artist has paintings displayed,
 # then keep only those whose paintings are displayed at least in two countries.
-query17 = conn.execute(
-    text(
+# The countries are counted by the loader (see summaries.py).
+register(
+    Query(
+        17,
+        "Identify the artists whose paintings are displayed in multiple countries",
         """
-        with artist_country as (
-            select artist_id, count(distinct country) as cnt_country from (
-                select w.artist_id, m.country
-                from museum m
-                join
-                work w
-                on (m.museum_id = w.museum_id)) as x
-            group by artist_id
-            order by cnt_country desc)
-
-
     select ac.artist_id, ac.cnt_country, a.full_name,
     a.nationality, a.style
 
-    from artist_country ac
+    from summary_countries_by_artist ac
     join
     artist a
 
     on (ac.artist_id = a.artist_id
     and ac.cnt_country >= 2)  # We select artists who are displayed at least in two different countries
     order by ac.cnt_country desc;
-    """
+    """,
     )
 )
 
 # ------------- Query 18 -------------
-# Display the country and the city with most no of museums.
-# Output 2 seperate columns to mention the city and country.
-# If there are multiple value, seperate them with comma.
 
 
-query18 = conn.execute(
-    text(
+register(
+    Query(
+        18,
+        (
+            "Display the country and the city with most no of museums. Output 2 "
+            "seperate columns to mention the city and country. If there are "
+            "multiple value, seperate them with comma."
+        ),
         """
         with
             museum_by_city as (select city, count(distinct museum_id) as cnt_museum_by_city,
@@ -480,19 +504,21 @@ query18 = conn.execute(
 
         where museum_by_city.rnk = 1
         and museum_by_country.rnk = 1;
-    """
+    """,
     )
 )
 
 # ------------- Query 19 -------------
-# Identify the artist and the museum where the most expensive and least expensive
-# painting is placed. Display the artist name, sale_price, painting name, museum
-# name, museum city and canvas label
-
 # We calculate which paint is the cheapest and which is the most expensive,
 # then add the necessary information as we go along.
-query19 = conn.execute(
-    text(
+register(
+    Query(
+        19,
+        (
+            "Identify the artist and the museum where the most expensive and least "
+            "expensive painting is placed. Display the artist name, sale_price, "
+            "painting name, museum name, museum city and canvas label"
+        ),
         """
         with least_and_most_expensive as (
             select work_id, sale_price, size_id from product_size
@@ -537,72 +563,70 @@ query19 = conn.execute(
 
         select painting_name, sale_price, full_name,
         museum_name, city, label from add_canvas_label;
-    """
+    """,
     )
 )
 
 
 # ------------- Query 20 -------------
-# Which country has the 5th highest no of paintings ?
-
-# We calculate which paint is the cheapest and which is the most expensive,
-# then add the necessary information as we go along.
-query20 = conn.execute(
-    text(
+# The paintings are counted by country by the loader (see summaries.py),
+# then the countries are ranked
+register(
+    Query(
+        20,
+        "Which country has the 5th highest no of paintings ?",
         """
         with
-            museum_with_country as (
-            select w.*, m.country from work as w
-            join museum as m
-            on (w.museum_id = m.museum_id)),
-
             cnt_museum_by_country as (
             select country,
-                count(name) as cnt_painting, rank() over(order by count(name)desc) as rnk
-                from museum_with_country
-                group by country)
+                cnt_paintings as cnt_painting, rank() over(order by cnt_paintings desc) as rnk
+                from summary_work_by_country)
 
         select * from cnt_museum_by_country
-        where rnk = 5;
-"""
+        where rnk = :rank;
+""",
+        params=(Param("rank", Integer(), 5),),
     )
 )
 
 # ------------- Query 21 -------------
-# Which are the 3 most popular and 3 least popular painting styles ?
-
 # We calculate the 3 most popular and the 3 least popular painting styles,
-# then we join the results together
-query21 = conn.execute(
-    text(
-        """
-        select least_popular.* from (select style, count(style) as cnt_style, 'least popular' as popularity from work
+# then we join the results together with UNION ALL, as the two lists have
+# different popularity labels (the paintings are counted by the loader,
+# see summaries.py)
+register(
+    Query(
+        21,
+        "Which are the 3 most popular and 3 least popular painting styles ?",
+        """
+        select least_popular.* from (select style, cnt_style, 'least popular' as popularity from summary_work_by_style
         where style <> ''
-        group by style
         order by cnt_style asc
-        limit 3) as least_popular
+        limit :n) as least_popular
 
-        union
+        union all
 
-        select most_popular.* from (select style, count(style) as cnt_style, 'most popular' as popularity from work
+        select most_popular.* from (select style, cnt_style, 'most popular' as popularity from summary_work_by_style
         where style <> ''
-        group by style
         order by cnt_style desc
-        limit 3) as most_popular;
-    """
+        limit :n) as most_popular;
+    """,
+        params=(Param("n", Integer(), 3),),
     )
 )
 
 # ------------- Query 22 -------------
-# Which artist has the most no of Portraits paintings outside USA ?
-# Display artist name, no of paintings and the artist nationality.
-
 # All information about the paintings (artist name, museum name,
 # work name, etc.) is gathered in a single table.
 # Then, from thistable, we calculate the number of portraits paintings per artist outside the USA.
 # Finally, we keep the one with the most.
-query22 = conn.execute(
-    text(
+register(
+    Query(
+        22,
+        (
+            "Which artist has the most no of Portraits paintings outside USA ? "
+            "Display artist name, no of paintings and the artist nationality."
+        ),
         """
         with
 
@@ -623,8 +647,8 @@ query22 = conn.execute(
 
             cnt_by_artist_and_country as (select full_name, nationality, country,
                 count(*) over(partition by artist_id) as cnt from painting_information
-                where country <> 'USA'
-                and subject = 'Portraits'),
+                where country <> :country
+                and subject = :subject),
 
             cnt_outside_usa as (select full_name, nationality, cnt,
                 rank() over(order by cnt desc) as rnk from cnt_by_artist_and_country)
@@ -632,6 +656,351 @@ query22 = conn.execute(
         select distinct full_name, nationality, cnt as most_portrait_painting_outside_usa
         from cnt_outside_usa
         where rnk = 1;
-        """
+        """,
+        params=(
+            Param("country", String(), "USA"),
+            Param("subject", String(), "Portraits"),
+        ),
     )
 )
+
+
+def observed(query, backend, run):
+    """Answer a query on a backend with run(), recording its latency and the
+    rows it returned (see metrics.py), and return its result"""
+    with metrics.span("query", query=query.id, backend=backend) as span:
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        span.set(rows=len(result))
+    labels = {"query": str(query.id), "backend": backend}
+    metrics.observe("query_duration_seconds", elapsed, **labels)
+    metrics.add("query_rows_returned_total", len(result), **labels)
+    return result
+
+
+def run_query(query, conn, cache=None, params=None, prepared=False):
+    """Execute a query and return its result as a DataFrame (see execute_query)"""
+    return observed(
+        query, "mysql", lambda: execute_query(query, conn, cache, params, prepared)
+    )
+
+
+def run_on_backend(query, backend, params=None):
+    """Answer a query on a DuckDBBackend or a PandasBackend"""
+    return observed(query, backend.name, lambda: backend.run(query, params))
+
+
+def execute_query(query, conn, cache=None, params=None, prepared=False):
+    """Execute a query and return its result as a DataFrame.
+
+    params overrides the default values of the query's parameters. With
+    prepared, the statements of a read-only query are executed as
+    server-side prepared statements, prepared once per pooled connection.
+    For a query which modifies the database, the number of affected rows
+    of each statement is returned instead, and the summary tables computed
+    from the tables it modifies are refreshed.
+    With a ResultCache, the result of a read-only query is served from the
+    cache as long as the tables it reads haven't changed, and a query
+    modifying the database invalidates the results of the tables it reads.
+    """
+    arguments = query.arguments(params)
+    if query.read_only:
+        # The versions of the tables read are used by the cache key and to
+        # tell the stale summaries, so they are read once
+        versions = None
+        if cache is not None or any(
+            t in summaries for t in referenced_tables(query.sql)
+        ):
+            versions = table_versions(conn, dependent_tables(query.sql))
+        if cache is not None:
+            key = cache.key(query.sql, conn, arguments, versions)
+            cached = cache.get(key)
+            metrics.annotate(cached=cached is not None)
+            if cached is not None:
+                return cached
+        # The summaries written around since their last refresh are read from
+        # the tables they are computed from
+        for i, statement in enumerate(fresh_statements(query, conn, versions)):
+            if prepared:
+                name = f"solution_{query.id}_{i}"
+                result = execute_prepared(conn, name, statement, arguments)
+            else:
+                result = conn.execute(query.bind(statement), arguments)
+        result = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+        if cache is not None:
+            cache.put(key, query.sql, result)
+        return result
+    affected_rows = [
+        conn.execute(query.bind(s), arguments).rowcount for s in query.statements
+    ]
+    # The modified tables get a new version (committed with their rows), then
+    # the summaries computed from them are refreshed, recording those versions
+    bump_versions(conn, referenced_tables(query.sql))
+    conn.commit()
+    refreshed = []
+    for name, _, _ in refresh_summaries(conn, referenced_tables(query.sql)):
+        bump_versions(conn, [name])
+        refreshed.append(name)
+    conn.commit()
+    if cache is not None:
+        for table in referenced_tables(query.sql) + refreshed:
+            cache.invalidate(table)
+    return pd.DataFrame({"affected_rows": affected_rows})
+
+
+def check_ids(ids, allow_mutating=False):
+    """Return the selected query ids (all of them by default).
+
+    Unknown ids are refused, and so are the queries modifying the database
+    unless allow_mutating is True.
+    """
+    ids = sorted(queries) if ids is None else list(ids)
+    unknown = [i for i in ids if i not in queries]
+    if unknown:
+        raise KeyError(f"Unknown queries: {unknown}")
+    mutating = [i for i in ids if not queries[i].read_only]
+    if mutating and not allow_mutating:
+        raise PermissionError(
+            f"Queries {mutating} modify the database, use allow_mutating=True"
+        )
+    return ids
+
+
+def params_of(query, values):
+    """Return the values of a mapping which are parameters of a query"""
+    names = {param.name for param in query.params}
+    return {name: value for name, value in (values or {}).items() if name in names}
+
+
+def run_queries(
+    conn, ids=None, allow_mutating=False, cache=None, params=None, prepared=False
+):
+    """Execute the selected queries (all of them by default), in order.
+
+    params gives values of parameters, each query using the ones it has.
+    Returns the results by query id.
+    """
+    return {
+        i: run_query(queries[i], conn, cache, params_of(queries[i], params), prepared)
+        for i in check_ids(ids, allow_mutating)
+    }
+
+
+def run_on_own_connection(query, engine, cache=None, params=None, prepared=False):
+    """Execute a query on a connection of the engine's pool (the time waited
+    for the connection is recorded)"""
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        metrics.observe("pool_wait_seconds", time.perf_counter() - start)
+        return run_query(query, conn, cache, params_of(query, params), prepared)
+
+
+def run_queries_concurrently(
+    engine,
+    ids=None,
+    allow_mutating=False,
+    workers=QUERY_WORKERS,
+    cache=None,
+    params=None,
+    prepared=False,
+):
+    """Execute the selected queries at the same time, each on its own connection.
+
+    The read-only queries don't depend on each other, so up to workers of
+    them run concurrently. A query modifying the database is a barrier:
+    it runs alone, once the queries selected before it are done, and the
+    queries selected after it wait for it.
+    The engine's pool should hold at least workers connections.
+    Returns the results by query id.
+    """
+    ids = check_ids(ids, allow_mutating)
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for i in ids + [None]:
+            if i is None or not queries[i].read_only:
+                # Barrier: wait for the running read-only queries
+                results.update({j: future.result() for j, future in pending.items()})
+                pending = {}
+                if i is not None:
+                    results[i] = run_on_own_connection(
+                        queries[i], engine, cache, params, prepared
+                    )
+            else:
+                # Each query is traced in a copy of the current context
+                pending[i] = executor.submit(
+                    contextvars.copy_context().run,
+                    run_on_own_connection,
+                    queries[i],
+                    engine,
+                    cache,
+                    params,
+                    prepared,
+                )
+    return {i: results[i] for i in ids}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run my SQL solutions")
+    parser.add_argument(
+        "ids",
+        nargs="*",
+        type=int,
+        help="ids of the queries to run (all the read-only ones by default)",
+    )
+    parser.add_argument(
+        "--allow-mutating",
+        action="store_true",
+        help="allow the queries which modify the database (6 and 8)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=QUERY_WORKERS,
+        help="number of read-only queries executed at the same time (1: one after another)",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="don't use the cache of results"
+    )
+    parser.add_argument(
+        "--clear-cache", action="store_true", help="empty the cache of results first"
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="REPORT",
+        help="profile the read-only queries (plans, server counters, timings) into a JSON file",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["mysql", "duckdb", "pandas"],
+        default="mysql",
+        help="run the queries on the MySQL server, on an embedded DuckDB database or with pandas",
+    )
+    parser.add_argument(
+        "--cross-check",
+        action="store_true",
+        help="compare the results of the read-only queries with the pandas answers",
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="value of a parameter of the queries, e.g. n=10 (see --list)",
+    )
+    parser.add_argument(
+        "--prepared",
+        action="store_true",
+        help="execute the queries as server-side prepared statements (MySQL)",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="write the latency and rows of each query to a Prometheus text file",
+    )
+    parser.add_argument(
+        "--traces",
+        metavar="FILE",
+        help="append the spans of the run to a file (OpenTelemetry JSON)",
+    )
+    parser.add_argument("--list", action="store_true", help="list the queries and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for query in queries.values():
+            params = ", ".join(f"{p.name}={p.default!r}" for p in query.params)
+            print(
+                f"{query.id:>2} {'' if query.read_only else '(mutating) '}{query.question}"
+                + (f" [{params}]" if params else "")
+            )
+        raise SystemExit
+
+    ids = args.ids or [i for i, query in queries.items() if query.read_only]
+    params = dict(param.split("=", 1) for param in args.param)
+    unknown = set(params) - {p.name for i in ids for p in queries[i].params}
+    if unknown:
+        parser.error(f"the selected queries have no parameters {sorted(unknown)}")
+    cache = None if args.no_cache else ResultCache()
+    if args.clear_cache and cache is not None:
+        cache.clear()
+
+    # Create a database connection with SQLAlchemy (MySQL Server 8.0),
+    # the other backends don't need one
+    if args.backend == "mysql" or args.profile:
+        engine = make_engine(pool_size=args.workers)
+    if args.profile:
+        with engine.connect() as conn:
+            profiles = profile_queries(conn, [queries[i] for i in check_ids(ids, True)])
+        write_report(profiles, args.profile)
+        for profile in profiles:
+            client = profile["client"]
+            print(
+                f"Query {profile['id']}: {client['rows']} rows, "
+                f"executed in {client['execute_seconds']:.3f}s, "
+                f"fetched in {client['fetch_seconds']:.3f}s"
+            )
+            for scan in profile["full_scans"]:
+                print(
+                    f"    full scan of {scan['table']} ({scan['rows_examined_per_scan']} rows) "
+                    f"although it has keys {scan['possible_keys'] or scan['join_keys']}"
+                )
+        print(f"Profiles written to {args.profile}")
+        raise SystemExit
+
+    start = time.perf_counter()
+    # The metrics and spans are written even if a query fails
+    try:
+        with metrics.span("run_queries", backend=args.backend, queries=len(ids)):
+            if args.backend in ("duckdb", "pandas"):
+                if args.backend == "duckdb":
+                    backend = DuckDBBackend(DUCKDB_PATH, DATA_DIR)
+                else:
+                    backend = PandasBackend(DATA_DIR)
+                results = {
+                    i: run_on_backend(
+                        queries[i], backend, params_of(queries[i], params)
+                    )
+                    for i in check_ids(ids, args.allow_mutating)
+                }
+            elif args.workers > 1:
+                results = run_queries_concurrently(
+                    engine,
+                    ids,
+                    args.allow_mutating,
+                    args.workers,
+                    cache,
+                    params,
+                    args.prepared,
+                )
+            else:
+                with engine.connect() as conn:
+                    results = run_queries(
+                        conn, ids, args.allow_mutating, cache, params, args.prepared
+                    )
+    finally:
+        if args.metrics:
+            metrics.write_prometheus(args.metrics)
+        if args.traces:
+            metrics.write_spans(args.traces)
+    elapsed = time.perf_counter() - start
+
+    for i, result in results.items():
+        print(f"------------- Query {i} -------------")
+        print(queries[i].question)
+        print(result.to_string(index=False))
+        print()
+    print(f"{len(results)} queries executed in {elapsed:.2f}s")
+
+    if args.cross_check:
+        pandas_backend = PandasBackend(DATA_DIR)
+        for i, result in results.items():
+            if not queries[i].read_only:
+                continue
+            start = time.perf_counter()
+            answer = pandas_backend.run(queries[i], params_of(queries[i], params))
+            elapsed = time.perf_counter() - start
+            status = (
+                "same result" if same_result(result, answer) else "DIFFERENT result"
+            )
+            print(f"Query {i}: {status} with pandas ({elapsed:.3f}s)")
@@ -0,0 +1,511 @@
+"""This file contains an analyzer of my SQL solutions: it flags the patterns
+    which scale badly, proposes rewrites and checks them on generated data"""
+
+import argparse
+import difflib
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, replace
+import schema
+from backends import tokenize
+from vectorized import same_result
+
+# File of the solutions, which the adopted rewrites are applied to
+SOLUTIONS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "SQLSolutions.py"
+)
+
+# Keywords ending a WHERE or ORDER BY clause (at the same parenthesis depth)
+clause_end_pattern = re.compile(
+    r"\b(group\s+by|order\s+by|limit|having|window|union)\b|[;()]", re.I
+)
+
+
+@dataclass(frozen=True)
+class Finding:
+    """A pattern found in a solution, and the SQL of the solution rewritten
+    without it"""
+
+    query_id: int
+    pattern: str
+    message: str
+    sql: str
+
+
+# Function looking for a pattern in the SQL of a solution, by pattern name.
+# Each function takes the SQL text and yields (message, rewritten SQL).
+patterns = {}
+
+
+def pattern(name):
+    """Register the function looking for a pattern"""
+
+    def register(function):
+        patterns[name] = function
+        return function
+
+    return register
+
+
+def mask(sql):
+    """Return the SQL text with its comments blanked and its strings filled
+    with x, so that it can be searched without matching them (the positions
+    are unchanged)"""
+    masked = []
+    for kind, token in tokenize(sql):
+        if kind == "comment":
+            masked.append(" " * len(token))
+        elif kind == "string":
+            masked.append("'" + "x" * (len(token) - 2) + "'")
+        else:
+            masked.append(token)
+    return "".join(masked)
+
+
+def closing(masked, start):
+    """Return the position of the parenthesis closing the one at start"""
+    depth = 0
+    for i in range(start, len(masked)):
+        if masked[i] == "(":
+            depth += 1
+        elif masked[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("Unbalanced parentheses")
+
+
+def clause_end(masked, start):
+    """Return where the clause starting at start ends: at the next clause
+    keyword, closing parenthesis or semicolon of the same depth"""
+    depth = 0
+    for match in clause_end_pattern.finditer(masked, start):
+        token = match.group()
+        if token == "(":
+            depth += 1
+        elif token == ")" and depth > 0:
+            depth -= 1
+        elif depth == 0:
+            return match.start()
+    return len(masked)
+
+
+def split_top_level(masked, start, end, separator):
+    """Split masked[start:end] on a separator (regex) outside parentheses,
+    as a list of (start, end) spans"""
+    spans, depth, begin = [], 0, start
+    matches = {m.start(): m.end() for m in re.finditer(separator, masked[:end], re.I)}
+    i = start
+    while i < end:
+        if masked[i] == "(":
+            depth += 1
+        elif masked[i] == ")":
+            depth -= 1
+        elif depth == 0 and i in matches and i > begin:
+            spans.append((begin, i))
+            begin = i = matches[i]
+            continue
+        i += 1
+    spans.append((begin, end))
+    return spans
+
+
+def unwrap(masked, start, end):
+    """Return the span of a condition without the whitespace and the
+    parentheses around all of it"""
+    while True:
+        while start < end and masked[start].isspace():
+            start += 1
+        while end > start and masked[end - 1].isspace():
+            end -= 1
+        if masked[start : start + 1] == "(" and closing(masked, start) == end - 1:
+            start, end = start + 1, end - 1
+        else:
+            return start, end
+
+
+@pattern("not_in_subquery")
+def not_in_subquery(sql):
+    """x NOT IN (select c from t ...) rewritten as anti-joins (NOT EXISTS)"""
+    masked = mask(sql)
+    for match in re.finditer(
+        r"([\w.]+)\s+not\s+in\s*(\()\s*select\s", masked, flags=re.I
+    ):
+        start, end = match.start(2), closing(masked, match.start(2))
+        subquery = re.fullmatch(
+            r"\s*select\s+(?:distinct\s+)?(?:(\w+)\.)?(\w+)\s+from\s+(\w+)"
+            r"(?:\s+(?:as\s+)?(?!where\b)(\w+))?\s*(?:where\s+(.*?))?\s*",
+            masked[start + 1 : end],
+            flags=re.I | re.S,
+        )
+        if subquery is None:
+            continue  # only single-column subqueries on one table are rewritten
+        column, table, alias = subquery.group(2, 3, 4)
+        alias = alias or table
+        value = match.group(1)
+        if "." not in value:
+            # Qualify the outer column, which the subquery would capture
+            outer = list(
+                re.finditer(
+                    r"\bfrom\s+(\w+)(?:\s+(?:as\s+)?(?!where\b|join\b)(\w+))?",
+                    masked[: match.start()],
+                    flags=re.I,
+                )
+            )
+            if not outer:
+                continue
+            value = f"{outer[-1].group(2) or outer[-1].group(1)}.{value}"
+        where = ""
+        if subquery.group(5):
+            where = f" and ({sql[start + 1 + subquery.start(5) : start + 1 + subquery.end(5)]})"
+        source = f"{table} as {alias}" if alias != table else table
+        rewrite = (
+            f"{value} is not null"
+            f" and not exists (select 1 from {source} where {alias}.{column} = {value}{where})"
+            f" and not exists (select 1 from {source} where {alias}.{column} is null{where})"
+        )
+        yield (
+            f"{match.group(1)} NOT IN (subquery) can be evaluated as a dependent "
+            "subquery; NOT EXISTS is an anti-join. NOT IN is never true when the subquery "
+            "returns a NULL, which the rewrite keeps (is null test): check that "
+            "this is intended",
+            sql[: match.start()] + rewrite + sql[end + 1 :],
+        )
+
+
+@pattern("join_without_on")
+def join_without_on(sql):
+    """join t where (a.x = t.y and ...) rewritten as join t on (a.x = t.y) where ..."""
+    masked = mask(sql)
+    for match in re.finditer(
+        r"\bjoin\s+(\w+)(?:\s+(?:as\s+)?(?!where\b|on\b|using\b)(\w+))?\s+(where)\b",
+        masked,
+        flags=re.I,
+    ):
+        name = match.group(2) or match.group(1)
+        start, end = unwrap(masked, match.end(3), clause_end(masked, match.end(3)))
+        conditions = split_top_level(masked, start, end, r"\band\b")
+        on, rest = [], []
+        for begin, finish in conditions:
+            condition = sql[begin:finish].strip()
+            if "=" in masked[begin:finish] and re.search(
+                rf"\b{name}\.", masked[begin:finish], re.I
+            ):
+                on.append(condition)
+            else:
+                rest.append(condition)
+        if not on:
+            continue
+        where_end = clause_end(masked, match.end(3))
+        trailing = sql[len(sql[:where_end].rstrip()) : where_end]
+        rewrite = f"on ({' and '.join(on)})" + (
+            f" where {' and '.join(rest)}" if rest else ""
+        )
+        yield (
+            f"join {match.group(1)} has no ON clause: the join condition is in the "
+            "WHERE clause, which hides it and turns a forgotten condition into a "
+            "cross join",
+            sql[: match.start(3)] + rewrite + trailing + sql[where_end:],
+        )
+
+
+def unique_columns(table):
+    """Return the columns of the primary key of a table of the schema (empty if unknown)"""
+    if table not in schema.tables:
+        return set()
+    return {column.name for column in schema.tables[table].primary_key.columns}
+
+
+@pattern("redundant_distinct")
+def redundant_distinct(sql):
+    """DISTINCT on rows which are already unique, or in an IN subquery"""
+    masked = mask(sql)
+    for match in re.finditer(r"\bin\s*\(\s*select\s+(distinct\s+)", masked, re.I):
+        yield (
+            "DISTINCT in an IN (subquery) is useless: IN only tests membership",
+            sql[: match.start(1)] + sql[match.end(1) :],
+        )
+    for match in re.finditer(
+        r"\bselect\s+(distinct\s+)([\w.\s,]+?)\s+from\s+(\w+)"
+        r"(?:\s+(?:as\s+)?(?!where\b|join\b|group\b|order\b|limit\b)(\w+))?"
+        r"\s*(?=where\b|group\b|order\b|limit\b|\)|;|$)",
+        masked,
+        flags=re.I,
+    ):
+        columns = {c.strip().split(".")[-1] for c in match.group(2).split(",")}
+        key = unique_columns(match.group(3))
+        if key and key <= columns:
+            yield (
+                f"DISTINCT on rows of {match.group(3)} which include its primary "
+                f"key ({', '.join(sorted(key))}) removes no row but may sort them",
+                sql[: match.start(1)] + sql[match.end(1) :],
+            )
+
+
+@pattern("order_by_in_subquery")
+def order_by_in_subquery(sql):
+    """ORDER BY without LIMIT in a subquery or a CTE, where it is ignored"""
+    masked = mask(sql)
+    for match in re.finditer(r"\(\s*select\b", masked, re.I):
+        if re.search(r"\bover\s*$", masked[: match.start()], re.I):
+            continue
+        start, end = match.start(), closing(masked, match.start())
+        depth, order = 0, None
+        for token in re.finditer(
+            r"[()]|\border\s+by\b|\blimit\b", masked[start + 1 : end], re.I
+        ):
+            if token.group() == "(":
+                depth += 1
+            elif token.group() == ")":
+                depth -= 1
+            elif depth == 0 and token.group().lower() == "limit":
+                order = None
+                break
+            elif depth == 0:
+                order = start + 1 + token.start()
+        if order is None:
+            continue
+        order_end = clause_end(masked, order + len("order"))
+        yield (
+            "ORDER BY without LIMIT in a subquery or a CTE doesn't order the "
+            "result of the query: the sort is wasted",
+            sql[:order] + sql[order_end:].lstrip(" "),
+        )
+
+
+@pattern("union_distinct")
+def union_distinct(sql):
+    """UNION (which removes duplicates) where UNION ALL gives the same rows"""
+    masked = mask(sql)
+    unions = list(re.finditer(r"\bunion\b(?!\s+all\b)", masked, re.I))
+    if unions:
+        rewritten = sql
+        for match in reversed(unions):
+            rewritten = rewritten[: match.end()] + " all" + rewritten[match.end() :]
+        yield (
+            "UNION removes the duplicates through a temporary table; UNION ALL "
+            "doesn't when the branches can't return the same rows",
+            rewritten,
+        )
+
+
+def analyze(query):
+    """Return the findings of every pattern in a solution"""
+    return [
+        Finding(query.id, name, message, sql)
+        for name, find in patterns.items()
+        for message, sql in find(query.sql)
+    ]
+
+
+def best_time(run, query, repeat):
+    """Run a query once to warm up, then repeat times, and return its result
+    and its best time (in seconds)"""
+    result = run(query)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(query)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def verify(query, finding, run, repeat=5, min_speedup=1.05):
+    """Run a read-only solution and its rewrite with run (query -> DataFrame).
+
+    The rewrite is adopted when it returns the same rows and is at least
+    min_speedup times faster. Returns the comparison as a dict.
+    """
+    rewritten = replace(query, sql=finding.sql)
+    original, original_time = best_time(run, query, repeat)
+    try:
+        result, rewrite_time = best_time(run, rewritten, repeat)
+    except Exception as error:
+        return {"error": f"{type(error).__name__}: {error}", "adopted": False}
+    same = same_result(original, result)
+    speedup = original_time / rewrite_time if rewrite_time else float("inf")
+    return {
+        "same_result": same,
+        "original_seconds": original_time,
+        "rewrite_seconds": rewrite_time,
+        "speedup": speedup,
+        "adopted": same and speedup >= min_speedup,
+    }
+
+
+def combine(query, findings):
+    """Return the SQL of a solution with the rewrites of all the findings.
+
+    Each rewrite is made on the SQL rewritten by the previous ones: its
+    pattern is looked for again, and the finding with the same message used.
+    """
+    sql = query.sql
+    for finding in findings:
+        for message, rewritten in patterns[finding.pattern](sql):
+            if message == finding.message:
+                sql = rewritten
+                break
+    return sql
+
+
+def patch(rewrites, path=SOLUTIONS_FILE):
+    """Return the file of the solutions with their SQL replaced by rewrites
+    (SQL by query id), and the change as a unified diff"""
+    from SQLSolutions import queries
+
+    with open(path) as f:
+        source = f.read()
+    rewritten = source
+    for query_id, sql in sorted(rewrites.items()):
+        original = queries[query_id].sql
+        if rewritten.count(original) != 1:
+            raise ValueError(f"the SQL of Query {query_id} isn't found once in {path}")
+        rewritten = rewritten.replace(original, sql)
+    diff = difflib.unified_diff(
+        source.splitlines(keepends=True),
+        rewritten.splitlines(keepends=True),
+        f"a/{os.path.basename(path)}",
+        f"b/{os.path.basename(path)}",
+    )
+    return rewritten, "".join(diff)
+
+
+if __name__ == "__main__":
+    from SQLSolutions import check_ids, queries, run_query
+
+    parser = argparse.ArgumentParser(
+        description="Flag the anti-patterns of my SQL solutions and check their rewrites"
+    )
+    parser.add_argument(
+        "ids",
+        nargs="*",
+        type=int,
+        help="ids of the queries to analyze (all the read-only ones by default)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["duckdb", "mysql"],
+        default="mysql",
+        help="run the rewrites on the MySQL server (benchmark database) or on DuckDB",
+    )
+    parser.add_argument(
+        "--no-verify", action="store_true", help="only list the findings"
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1, help="scale factor of the generated data"
+    )
+    parser.add_argument(
+        "--data-dir",
+        default="data/benchmark",
+        help="directory where the generated csv files are kept",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timed executions")
+    parser.add_argument(
+        "--min-speedup",
+        type=float,
+        default=1.05,
+        help="speedup a rewrite needs to be adopted",
+    )
+    parser.add_argument(
+        "--output", default="analysis.json", help="JSON file receiving the findings"
+    )
+    parser.add_argument(
+        "--patch",
+        default="analysis.patch",
+        help="file receiving the adopted rewrites as a patch of SQLSolutions.py",
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="apply the adopted rewrites to SQLSolutions.py",
+    )
+    args = parser.parse_args()
+
+    ids = check_ids(args.ids or [i for i, q in queries.items() if q.read_only])
+    findings = [finding for i in ids for finding in analyze(queries[i])]
+
+    if not args.no_verify:
+        from benchmarks.generate_data import generate
+
+        data_dir = os.path.join(args.data_dir, f"scale_{args.scale:g}")
+        if args.backend == "duckdb":
+            from backends import DuckDBBackend
+
+            if not os.path.exists(os.path.join(data_dir, "work.csv")):
+                generate(data_dir, args.scale)
+            run = DuckDBBackend(":memory:", data_dir).run
+        else:
+            from benchmarks.run_queries import load_scale
+            from database import make_engine
+            from configuration.config import BENCHMARK_DATABASE_NAME
+
+            engine = make_engine(BENCHMARK_DATABASE_NAME, local_infile=True)
+            load_scale(engine, data_dir, args.scale)
+            conn = engine.connect()
+
+            def run(query):
+                return run_query(query, conn)
+
+    report = []
+    for finding in findings:
+        print(f"Query {finding.query_id} - {finding.pattern}: {finding.message}")
+        entry = {**finding.__dict__}
+        if not args.no_verify:
+            entry.update(
+                verify(
+                    queries[finding.query_id],
+                    finding,
+                    run,
+                    args.repeat,
+                    args.min_speedup,
+                )
+            )
+            if "error" in entry:
+                print(f"    rewrite failed: {entry['error']}")
+            else:
+                print(
+                    f"    {'same' if entry['same_result'] else 'DIFFERENT'} result, "
+                    f"{entry['original_seconds'] * 1000:.1f}ms -> "
+                    f"{entry['rewrite_seconds'] * 1000:.1f}ms "
+                    f"(x{entry['speedup']:.2f}): "
+                    f"{'adopted' if entry['adopted'] else 'rejected'}"
+                )
+        report.append(entry)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"{len(findings)} findings written to {args.output}")
+
+    if not args.no_verify:
+        # The adopted rewrites of a solution are combined, then checked again
+        rewrites = {}
+        for i in ids:
+            adopted = [
+                finding
+                for finding, entry in zip(findings, report)
+                if finding.query_id == i and entry.get("adopted")
+            ]
+            if not adopted:
+                continue
+            sql = combine(queries[i], adopted)
+            if len(adopted) > 1:
+                entry = verify(
+                    queries[i],
+                    Finding(i, "combined", "", sql),
+                    run,
+                    args.repeat,
+                    args.min_speedup,
+                )
+                if not entry.get("same_result"):
+                    print(f"Query {i}: the combined rewrites give a different result")
+                    sql = adopted[0].sql
+            rewrites[i] = sql
+        rewritten, diff = patch(rewrites)
+        with open(args.patch, "w") as f:
+            f.write(diff)
+        print(f"{len(rewrites)} rewritten solutions written to {args.patch}")
+        if args.apply and rewrites:
+            with open(SOLUTIONS_FILE, "w") as f:
+                f.write(rewritten)
+            print(f"{len(rewrites)} rewritten solutions applied to {SOLUTIONS_FILE}")
@@ -0,0 +1,496 @@
+"""This file contains an embedded DuckDB backend able to run my SQL solutions
+without a MySQL server, and the translation of their MySQL dialect"""
+
+import os
+import re
+import pandas as pd
+from sqlalchemy import Boolean, Float, Integer, Time
+import schema
+import snapshots
+import vectorized
+from normalization import derived_columns, normalize
+from validation import apply_rules, rules_of
+from result_cache import referenced_tables
+from summaries import summaries, summaries_of
+from configuration.config import DATA_DIR
+
+# MySQL date format specifiers and their strptime equivalent
+date_formats = {
+    "%h": "%I",
+    "%I": "%I",
+    "%H": "%H",
+    "%k": "%H",
+    "%i": "%M",
+    "%s": "%S",
+    "%S": "%S",
+    "%p": "%p",
+    "%Y": "%Y",
+    "%y": "%y",
+    "%m": "%m",
+    "%c": "%m",
+    "%d": "%d",
+    "%e": "%d",
+    "%M": "%B",
+    "%b": "%b",
+}
+
+
+def tokenize(sql, ansi_quotes=False):
+    """Split a SQL text into (kind, text) tokens.
+
+    kind is "string" ('...', or "..." as in MySQL), "identifier" (`...`, or
+    "..." with ansi_quotes, as in DuckDB), "comment" (# ... or -- ... up to
+    the end of the line) or "code".
+    """
+    tokens = []
+    code = []
+    i = 0
+    while i < len(sql):
+        c = sql[i]
+        if c in "'`\"":
+            kind = "identifier" if c == "`" or (c == '"' and ansi_quotes) else "string"
+            end = i + 1
+            while end < len(sql):
+                if sql[end] == "\\" and kind == "string":
+                    end += 2
+                    continue
+                if sql[end] == c:
+                    if sql[end + 1 : end + 2] == c:  # doubled quote
+                        end += 2
+                        continue
+                    break
+                end += 1
+        elif c == "#" or sql.startswith("-- ", i):
+            end = sql.find("\n", i)
+            end = len(sql) - 1 if end == -1 else end - 1
+            kind = "comment"
+        else:
+            code.append(c)
+            i += 1
+            continue
+        if code:
+            tokens.append(("code", "".join(code)))
+            code = []
+        tokens.append((kind, sql[i : end + 1]))
+        i = end + 1
+    if code:
+        tokens.append(("code", "".join(code)))
+    return tokens
+
+
+# Bind parameters (:name) of a statement, as recognized by SQLAlchemy's text()
+bind_pattern = re.compile(r"(?<![:\w\\]):(\w+)(?!:)")
+
+
+def bind_names(sql):
+    """Return the names of the bind parameters of a statement, in order of
+    appearance (a name appears once per use)"""
+    return [
+        name
+        for kind, token in tokenize(sql)
+        if kind == "code"
+        for name in bind_pattern.findall(token)
+    ]
+
+
+def replace_binds(sql, replace):
+    """Replace each bind parameter of a statement by replace(name)"""
+    return "".join(
+        (
+            bind_pattern.sub(lambda m: replace(m.group(1)), token)
+            if kind == "code"
+            else token
+        )
+        for kind, token in tokenize(sql)
+    )
+
+
+def split_arguments(arguments):
+    """Split the arguments of a function call on the top-level commas"""
+    parts, depth, current = [], 0, []
+    for kind, token in tokenize(arguments):
+        if kind != "code":
+            current.append(token)
+            continue
+        for c in token:
+            depth += c == "("
+            depth -= c == ")"
+            if c == "," and depth == 0:
+                parts.append("".join(current).strip())
+                current = []
+            else:
+                current.append(c)
+    parts.append("".join(current).strip())
+    return parts
+
+
+def rewrite_calls(sql, name, rewrite):
+    """Replace every call name(...) of a SQL text by rewrite(arguments)"""
+    pattern = re.compile(rf"\b{name}\s*\(", re.IGNORECASE)
+    while True:
+        # Calls are looked for in the code only, not in strings or comments
+        offset, match = 0, None
+        for kind, token in tokenize(sql):
+            if kind == "code":
+                match = pattern.search(token)
+                if match:
+                    break
+            offset += len(token)
+        if match is None:
+            return sql
+        start = offset + match.start()
+        depth, end = 0, offset + match.end() - 1
+        position = end
+        for kind, token in tokenize(sql[end:]):
+            if kind == "code":
+                for i, c in enumerate(token):
+                    depth += c == "("
+                    depth -= c == ")"
+                    if depth == 0:
+                        end = position + i
+                        break
+                if depth == 0:
+                    break
+            position += len(token)
+        arguments = split_arguments(sql[offset + match.end() : end])
+        sql = sql[:start] + rewrite(arguments) + sql[end + 1 :]
+
+
+def translate_date_format(literal):
+    """Translate a MySQL date format literal to a strptime one"""
+    return re.sub(r"%\w", lambda m: date_formats.get(m.group(), m.group()), literal)
+
+
+def translate_group_concat(arguments):
+    """group_concat(a, b separator s) -> string_agg(concat(a, b), s)"""
+    separator = "','"
+    last = re.match(r"(.*)\s+separator\s+('.*')$", arguments[-1], re.I | re.S)
+    if last:
+        arguments = arguments[:-1] + [last.group(1)]
+        separator = last.group(2)
+    distinct = re.match(r"distinct\s+(.*)", arguments[0], re.I | re.S)
+    prefix = "distinct " if distinct else ""
+    if distinct:
+        arguments = [distinct.group(1)] + arguments[1:]
+    value = arguments[0] if len(arguments) == 1 else f"concat({', '.join(arguments)})"
+    return f"string_agg({prefix}{value}, {separator})"
+
+
+join_keywords = {
+    "where",
+    "group",
+    "order",
+    "limit",
+    "having",
+    "union",
+    "window",
+    "join",
+    "inner",
+    "left",
+    "right",
+    "cross",
+    "natural",
+    "straight_join",
+}
+
+
+def code_words(sql):
+    """Return the (position, word) of the words and parentheses of the code of a SQL text"""
+    words, offset = [], 0
+    for kind, token in tokenize(sql, ansi_quotes=True):
+        if kind == "code":
+            words += [
+                (offset + match.start(), match.group().lower())
+                for match in re.finditer(r"\w+|[(),]", token)
+            ]
+        elif kind == "identifier":
+            words.append((offset, token))
+        offset += len(token)
+    return words
+
+
+def add_cross_joins(sql):
+    """Turn the joins without a join condition into cross joins.
+
+    MySQL accepts "a join b where ..." (the condition being in the where
+    clause), which is a cross join for the other databases.
+    """
+    words = code_words(sql)
+    inserts = []
+    for i, (start, word) in enumerate(words):
+        if word != "join" or (i > 0 and words[i - 1][1] == "cross"):
+            continue
+        following = [w for _, w in words[i + 1 : i + 5]]
+        if not following or following[0] == "(":
+            continue  # join on a subquery
+        rest = following[1:]
+        if rest[:1] == ["as"]:
+            rest = rest[2:]
+        elif rest and rest[0] not in join_keywords | {"on", "using", ")"}:
+            rest = rest[1:]  # alias
+        if not rest or rest[0] not in ("on", "using"):
+            inserts.append(start)
+    for start in reversed(inserts):
+        sql = sql[:start] + "cross " + sql[start:]
+    return sql
+
+
+def translate_token(kind, token):
+    """Translate a token of a MySQL statement to DuckDB: # comments, `...`
+    identifiers and "..." strings, which are written '...'"""
+    if kind == "comment" and token.startswith("#"):
+        return "--" + token[1:]
+    if kind == "identifier":
+        return '"' + token[1:-1] + '"'
+    if kind == "string" and token.startswith('"'):
+        value = token[1:-1].replace('""', '"').replace('\\"', '"')
+        return "'" + value.replace("'", "''") + "'"
+    return token
+
+
+def translate_statement(sql):
+    """Translate one MySQL statement to DuckDB, as a list of statements"""
+    # Comments, quoted identifiers and double-quoted strings
+    sql = "".join(translate_token(kind, token) for kind, token in tokenize(sql))
+
+    # Statements DuckDB writes differently
+    code = " ".join(
+        token for kind, token in tokenize(sql, ansi_quotes=True) if kind != "comment"
+    )
+    code = " ".join(code.split())
+    match = re.fullmatch(r"drop table (if exists )?(.+)", code, re.I)
+    if match and "," in match.group(2):
+        return [
+            f"drop table {match.group(1) or ''}{name.strip()}"
+            for name in match.group(2).split(",")
+        ]
+    match = re.fullmatch(r"create table (\S+) like (\S+)", code, re.I)
+    if (
+        match
+        and match.group(2).strip('"') in schema.tables
+        and schema.generated_columns(match.group(2).strip('"'))
+    ):
+        # A copy made with "as select" would turn them into regular columns
+        return [create_statement(match.group(2).strip('"'), match.group(1))]
+    if match:
+        return [
+            f"create table {match.group(1)} as select * from {match.group(2)} limit 0"
+        ]
+    match = re.fullmatch(r"rename table (.+)", code, re.I)
+    if match:
+        renames = [
+            re.split(r"\s+to\s+", r.strip(), flags=re.I)
+            for r in match.group(1).split(",")
+        ]
+        return [
+            f"alter table {old} rename to {new.strip(chr(34))}" for old, new in renames
+        ]
+
+    sql = add_cross_joins(sql)
+
+    # Functions
+    sql = rewrite_calls(sql, "regexp_like", lambda a: f"regexp_matches({', '.join(a)})")
+    # Times are parsed as timestamps on 1900-01-01, so they can be compared
+    # and subtracted (which gives an interval)
+    sql = rewrite_calls(
+        sql,
+        "str_to_date",
+        lambda a: f"strptime({a[0]}, {translate_date_format(a[1])})",
+    )
+    sql = rewrite_calls(sql, "group_concat", translate_group_concat)
+    return [sql]
+
+
+def translate(statements):
+    """Translate MySQL statements to DuckDB"""
+    return [
+        translated
+        for statement in statements
+        for translated in translate_statement(statement)
+    ]
+
+
+def duckdb_type(column):
+    """Return the DuckDB type of a column of the schema"""
+    if isinstance(column.type, Integer):
+        return "BIGINT"
+    if isinstance(column.type, Float):
+        return "DOUBLE"
+    if isinstance(column.type, Boolean):
+        return "BOOLEAN"
+    if isinstance(column.type, Time):
+        return "TIME"
+    return "VARCHAR"
+
+
+def create_statement(table, name=None):
+    """Return the statement creating a table of the schema (named name) in
+    DuckDB, with its generated columns (computed when they are read)"""
+    generated = schema.generated_columns(table)
+    columns = [
+        (
+            f'"{c.name}" {duckdb_type(c)} generated always as '
+            f"({translate_statement(generated[c.name])[0]}) virtual"
+            if c.name in generated
+            else f'"{c.name}" {duckdb_type(c)}'
+        )
+        for c in schema.tables[table].columns
+    ]
+    name = name or f'"{table}"'
+    return f"create or replace table {name} ({', '.join(columns)})"
+
+
+class DuckDBBackend:
+    """Runs the solutions on an in-process DuckDB database.
+
+    The tables are created from the csv files when they don't exist in the
+    database yet (an in-memory database is filled each time).
+    """
+
+    name = "duckdb"
+
+    def __init__(self, database=":memory:", data_dir=DATA_DIR):
+        import duckdb
+
+        self.db = duckdb.connect(database)
+        self.data_dir = data_dir
+        existing = {name for (name,) in self.db.execute("show tables").fetchall()}
+        for table in schema.tables:
+            if table not in existing:
+                self.load_table(table)
+        for summary in summaries.values():
+            if summary.name not in existing:
+                self.refresh_summary(summary)
+
+    def load_table(self, table):
+        """(Re)create a table from its Parquet snapshot if it is up to date,
+        from its csv file otherwise, without the rows breaking a "quarantine"
+        rule (see validation.py), as the loader does"""
+        if derived_columns(table):
+            # The typed columns are computed by pandas, as by the loader, and
+            # the flag columns are generated by the database
+            rows = PandasBackend(self.data_dir)[table]
+            columns = ", ".join(f'"{c}"' for c in schema.stored_columns(table))
+            self.db.register("normalized_rows", rows)
+            self.db.execute(create_statement(table))
+            self.db.execute(
+                f'insert into "{table}" ({columns}) '
+                f"select {columns} from normalized_rows"
+            )
+            self.db.unregister("normalized_rows")
+            return
+        if snapshots.is_fresh(table, self.data_dir):
+            path = snapshots.snapshot_path(table).replace("'", "''")
+            self.db.execute(
+                f'create or replace table "{table}" as select * from '
+                f"read_parquet('{path}')"
+            )
+        else:
+            columns = ", ".join(
+                f"'{c.name}': '{duckdb_type(c)}'" for c in schema.tables[table].columns
+            )
+            path = os.path.join(self.data_dir, f"{table}.csv").replace("'", "''")
+            self.db.execute(
+                f'create or replace table "{table}" as select * from '
+                f"read_csv('{path}', header = true, columns = {{{columns}}})"
+            )
+        # The rows breaking a "quarantine" rule are left out (the rows
+        # normalized by pandas above already are)
+        for rule in rules_of(table, "quarantine"):
+            condition = translate_statement(rule.condition)[0]
+            self.db.execute(f'delete from "{table}" where {condition}')
+
+    def refresh_summary(self, summary, cursor=None):
+        """(Re)compute a summary table (see summaries.py)"""
+        (cursor or self.db).execute(
+            f'create or replace table "{summary.name}" as '
+            + translate_statement(summary.select)[0]
+        )
+
+    def run(self, query, params=None):
+        """Execute a query and return its result as a DataFrame.
+
+        params overrides the default values of the query's parameters
+        (bound as DuckDB $name parameters).
+        For a query which modifies the database, the number of affected
+        rows of each statement is returned instead, and the summary tables
+        computed from the tables it modifies are refreshed.
+        """
+        arguments = query.arguments(params)
+
+        def execute(statement):
+            values = {name: arguments[name] for name in bind_names(statement)}
+            return cursor.execute(
+                replace_binds(statement, lambda name: f"${name}"), values or None
+            )
+
+        # Each thread uses its own cursor on the shared database
+        cursor = self.db.cursor()
+        try:
+            if query.read_only:
+                for statement in translate(query.statements):
+                    result = execute(statement)
+                return result.df()
+            affected_rows = []
+            cursor.execute("begin transaction")
+            try:
+                # One count per statement of the solution, whatever the
+                # number of DuckDB statements it is translated to
+                for statement in query.statements:
+                    count = 0
+                    for translated in translate_statement(statement):
+                        result = execute(translated).fetchall()
+                        # DuckDB returns the number of affected rows of a DML statement
+                        count += result[0][0] if len(result) == 1 else 0
+                    affected_rows.append(count)
+                for summary in summaries_of(referenced_tables(query.sql)):
+                    self.refresh_summary(summary, cursor)
+            except Exception:
+                cursor.execute("rollback")
+                raise
+            cursor.execute("commit")
+            return pd.DataFrame({"affected_rows": affected_rows})
+        finally:
+            cursor.close()
+
+
+class PandasBackend:
+    """Answers the questions with the vectorized pandas code of vectorized.py.
+
+    Each table is read once, when a query first needs it: from its Parquet
+    snapshot if it is up to date, from its csv file otherwise. The queries
+    modifying the database modify these in-memory tables.
+    """
+
+    name = "pandas"
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.tables = {}
+
+    def __getitem__(self, table):
+        if table not in self.tables:
+            # The rows are normalized and checked as by the loader (the
+            # quarantined ones are left out)
+            rows = normalize(table, self.load_table(table))
+            self.tables[table] = apply_rules(table, rows)[0]
+        return self.tables[table]
+
+    def __setitem__(self, table, df):
+        self.tables[table] = df
+
+    def load_table(self, table):
+        """Read a table from its Parquet snapshot or from its csv file (without
+        the typed and flag columns computed from the csv columns)"""
+        if snapshots.is_fresh(table, self.data_dir):
+            return snapshots.read_snapshot(table)
+        return pd.read_csv(
+            os.path.join(self.data_dir, f"{table}.csv"),
+            dtype=schema.dtypes.get(table),
+        )
+
+    def run(self, query, params=None):
+        """Compute the answer of a query as a DataFrame (with the columns of
+        its SQL solution), params overriding the default values of its parameters"""
+        answer = vectorized.solutions[query.id](self, **query.arguments(params))
+        return answer.reset_index(drop=True)
@@ -0,0 +1,159 @@
+"""This file measures the insert and fetch throughput (rows/s) of each MySQL
+    driver, to pick the fastest one for loading the data and running the solutions"""
+
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from database import async_drivers, drivers, make_async_engine, make_engine
+from configuration.config import BENCHMARK_DATABASE_NAME, BATCH_SIZE
+
+# Table receiving the rows of the benchmark (in the benchmark database)
+benchmark_table = "driver_benchmark"
+
+
+def sample_rows(rows, seed=0):
+    """Return rows shaped like the work table (integers, strings and NULLs)"""
+    rng = np.random.default_rng(seed)
+    museum_id = pd.array(rng.integers(1, 60, rows), dtype="Int64")
+    museum_id[rng.random(rows) < 0.3] = pd.NA
+    return pd.DataFrame(
+        {
+            "work_id": np.arange(rows),
+            "name": [f"Painting {i}" for i in rng.integers(0, 100_000, rows)],
+            "artist_id": rng.integers(1, 1_000, rows),
+            "style": rng.choice(["Baroque", "Impressionism", "Realism"], rows),
+            "museum_id": museum_id,
+        }
+    )
+
+
+def create_benchmark_table(conn):
+    """(Re)create the empty table receiving the rows"""
+    conn.execute(text(f"drop table if exists `{benchmark_table}`"))
+    conn.execute(text(f"""
+            create table `{benchmark_table}` (
+                work_id int, name varchar(255), artist_id int,
+                style varchar(100), museum_id int
+            )
+            """))
+
+
+def measure(conn, df, batch_size=BATCH_SIZE, repeat=3):
+    """Time batched inserts, to_sql and a full fetch of the rows on a connection.
+
+    Returns the best throughput of repeat runs (in rows/s) of each operation.
+    """
+    records = df.astype(object).where(df.notna(), None).to_dict("records")
+    columns = list(df.columns)
+    insert = text(
+        f"insert into `{benchmark_table}` ({', '.join(columns)}) "
+        f"values ({', '.join(f':{c}' for c in columns)})"
+    )
+    timings = {"insert": [], "to_sql": [], "fetch": []}
+    for _ in range(repeat):
+        create_benchmark_table(conn)
+        start = time.perf_counter()
+        for i in range(0, len(records), batch_size):
+            conn.execute(insert, records[i : i + batch_size])
+        timings["insert"].append(time.perf_counter() - start)
+
+        create_benchmark_table(conn)
+        start = time.perf_counter()
+        df.to_sql(
+            benchmark_table,
+            con=conn,
+            if_exists="append",
+            index=False,
+            chunksize=batch_size,
+        )
+        timings["to_sql"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        fetched = conn.execute(text(f"select * from `{benchmark_table}`")).fetchall()
+        timings["fetch"].append(time.perf_counter() - start)
+    conn.execute(text(f"drop table `{benchmark_table}`"))
+    if len(fetched) != len(df):
+        raise RuntimeError(f"{len(fetched)} rows fetched instead of {len(df)}")
+    return {
+        f"{operation}_rows_per_s": len(df) / min(seconds)
+        for operation, seconds in timings.items()
+    }
+
+
+async def measure_async(engine, df, batch_size=BATCH_SIZE, repeat=3):
+    """Run measure on a connection of an asyncio engine"""
+    async with engine.begin() as conn:
+        result = await conn.run_sync(measure, df, batch_size, repeat)
+    await engine.dispose()
+    return result
+
+
+def benchmark_driver(driver, database, df, batch_size=BATCH_SIZE, repeat=3):
+    """Return the throughputs of a driver, or the error raised (e.g. not installed)"""
+    try:
+        if driver in async_drivers:
+            engine = make_async_engine(database, driver)
+            return asyncio.run(measure_async(engine, df, batch_size, repeat))
+        engine = make_engine(database, driver)
+        with engine.begin() as conn:
+            return measure(conn, df, batch_size, repeat)
+    except Exception as error:
+        return {"error": f"{type(error).__name__}: {error}"}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the insert and fetch throughput of the MySQL drivers"
+    )
+    parser.add_argument(
+        "--drivers",
+        nargs="+",
+        choices=drivers,
+        default=drivers,
+        help="drivers to measure (all of them by default, the missing ones are reported)",
+    )
+    parser.add_argument(
+        "--rows", type=int, default=200_000, help="number of rows inserted and fetched"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="number of rows sent in a single multi-row insert",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs")
+    parser.add_argument(
+        "--database",
+        default=BENCHMARK_DATABASE_NAME,
+        help="database receiving the table of the benchmark",
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark_drivers.json",
+        help="JSON file receiving the throughputs",
+    )
+    args = parser.parse_args()
+
+    df = sample_rows(args.rows)
+    report = {}
+    for driver in args.drivers:
+        report[driver] = benchmark_driver(
+            driver, args.database, df, args.batch_size, args.repeat
+        )
+        if "error" in report[driver]:
+            print(f"{driver}: {report[driver]['error']}")
+        else:
+            print(
+                f"{driver}: "
+                + ", ".join(
+                    f"{name.removesuffix('_rows_per_s')} {value:,.0f} rows/s"
+                    for name, value in report[driver].items()
+                )
+            )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Throughputs written to {args.output}")
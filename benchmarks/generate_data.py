@@ -0,0 +1,331 @@
+"""This file generates synthetic csv files for the famous painting database,
+    at a given scale factor (1 is about the size of the Kaggle dataset)"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Number of rows of each table at scale factor 1 (Kaggle dataset)
+base_rows = {
+    "artist": 421,
+    "canvas_size": 200,
+    "museum": 57,
+    "work": 14_776,
+}
+
+# Average number of rows per painting of the tables describing paintings
+sizes_per_work = 7.5
+subjects_per_work = 0.46
+
+# Share of the paintings which are not displayed in any museum
+work_without_museum = 0.69
+
+# Share of the rows duplicated in work, product_size, subject and image_link
+duplicate_rate = 0.01
+
+nationalities = [
+    "French",
+    "American",
+    "Dutch",
+    "English",
+    "Italian",
+    "Spanish",
+    "German",
+    "Russian",
+]
+styles = [
+    "Impressionism",
+    "Baroque",
+    "Realism",
+    "Rococo",
+    "Romanticism",
+    "Post-Impressionism",
+    "Expressionism",
+    "Renaissance",
+    "Neo-Classicism",
+    "Classicism",
+    "Surrealism",
+    "Avant-Garde",
+]
+subjects = [
+    "Portraits",
+    "Nude",
+    "Landscape Art",
+    "Rivers/Lakes",
+    "Flowers",
+    "Abstract/Modern Art",
+    "Still-Life",
+    "Animal Art",
+    "Marine Art/Maritime",
+    "Horses",
+    "Religious Art",
+    "Cityscape",
+]
+countries = {
+    "USA": [
+        "New York",
+        "Washington",
+        "Boston",
+        "Chicago",
+        "Philadelphia",
+        "Los Angeles",
+    ],
+    "France": ["Paris", "Lyon"],
+    "UK": ["London", "Edinburgh"],
+    "Netherlands": ["Amsterdam", "The Hague"],
+    "Spain": ["Madrid", "Barcelona"],
+    "Germany": ["Berlin", "Munich"],
+    "Russia": ["St. Petersburg", "Moscow"],
+}
+days = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+words = [
+    "Portrait",
+    "Woman",
+    "Man",
+    "Garden",
+    "River",
+    "Sunset",
+    "Flowers",
+    "Harbor",
+    "Madonna",
+    "Child",
+    "Boats",
+    "Bridge",
+    "Morning",
+    "Evening",
+    "Still",
+    "Life",
+    "Horse",
+    "Church",
+]
+
+
+def zipf_choice(rng, values, size, a=1.2):
+    """Draw values with a Zipf-like popularity (the first ones are the most frequent)"""
+    weights = 1 / np.arange(1, len(values) + 1) ** a
+    return rng.choice(values, size=size, p=weights / weights.sum())
+
+
+def with_duplicates(rng, df):
+    """Append a share of duplicate_rate of the rows of a DataFrame, duplicated"""
+    duplicates = df.sample(frac=duplicate_rate, random_state=rng.integers(2**31))
+    return pd.concat([df, duplicates], ignore_index=True)
+
+
+def hours(rng, size, start, span):
+    """Format random hours between start and start + span as 'hh:mi:AM'"""
+    minutes = (start + rng.integers(0, span + 1, size=size)) * 30
+    h, m = minutes // 60, minutes % 60
+    return [
+        f"{(x - 1) % 12 + 1:02d}:{y:02d}:{'AM' if x < 12 else 'PM'}"
+        for x, y in zip(h, m)
+    ]
+
+
+def generate_dimensions(rng, scale):
+    """Generate the artist, canvas_size, museum and museum_hours tables"""
+    n_artist = max(1, round(base_rows["artist"] * scale))
+    first_names = rng.choice(
+        ["Claude", "Pierre", "John", "Mary", "Vincent", "Rembrandt"], n_artist
+    )
+    last_names = rng.choice(
+        ["Monet", "Renoir", "Sargent", "Cassatt", "Gogh", "Rijn"], n_artist
+    )
+    birth = rng.integers(1450, 1900, n_artist)
+    artist = pd.DataFrame(
+        {
+            "artist_id": np.arange(500, 500 + n_artist),
+            "full_name": [
+                f"{f} {l} {i}" for i, (f, l) in enumerate(zip(first_names, last_names))
+            ],
+            "first_name": first_names,
+            "middle_names": np.where(rng.random(n_artist) < 0.2, "Auguste", None),
+            "last_name": last_names,
+            "nationality": zipf_choice(rng, nationalities, n_artist),
+            "style": zipf_choice(rng, styles, n_artist),
+            "birth": birth,
+            "death": birth + rng.integers(30, 90, n_artist),
+        }
+    )
+
+    n_size = max(1, round(base_rows["canvas_size"] * scale))
+    width = rng.integers(6, 80, n_size)
+    height = rng.integers(6, 80, n_size)
+    long_edge_only = rng.random(n_size) < 0.1
+    canvas_size = pd.DataFrame(
+        {
+            "size_id": width * 100 + height + np.arange(n_size) * 10_000,
+            "width": width,
+            "height": pd.Series(height, dtype="Int64").mask(long_edge_only),
+            "label": [
+                (
+                    f'{w}" Long Edge'
+                    if edge_only
+                    else f'{w}" x {h}"({w * 2.54:.0f}cm x {h * 2.54:.0f}cm)'
+                )
+                for w, h, edge_only in zip(width, height, long_edge_only)
+            ],
+        }
+    )
+
+    n_museum = max(1, round(base_rows["museum"] * scale))
+    country = zipf_choice(rng, list(countries), n_museum, a=1.5)
+    city = [rng.choice(countries[c]) for c in country]
+    # A few museums have a postal code instead of a city (Query 7)
+    invalid_city = rng.random(n_museum) < 0.05
+    museum = pd.DataFrame(
+        {
+            "museum_id": np.arange(1, n_museum + 1),
+            "name": [f"Museum of Art {i}" for i in range(1, n_museum + 1)],
+            "address": [f"{rng.integers(1, 999)} Main Street" for _ in range(n_museum)],
+            "city": np.where(
+                invalid_city, rng.integers(10000, 99999, n_museum).astype(str), city
+            ),
+            "state": np.where(country == "USA", "NY", None),
+            "postal": rng.integers(10000, 99999, n_museum).astype(str),
+            "country": country,
+            "phone": [
+                f"+1 {rng.integers(100, 999)} {rng.integers(1000, 9999)}"
+                for _ in range(n_museum)
+            ],
+            "url": [f"https://museum{i}.example.org" for i in range(1, n_museum + 1)],
+        }
+    )
+
+    # Each museum is open 5 to 7 days a week
+    open_days = [
+        (museum_id, day)
+        for museum_id in museum["museum_id"]
+        for day in rng.choice(days, rng.integers(5, 8), replace=False)
+    ]
+    n_hours = len(open_days)
+    museum_hours = pd.DataFrame(
+        {
+            "museum_id": [museum_id for museum_id, _ in open_days],
+            "day": [day for _, day in open_days],
+            "open": hours(rng, n_hours, 16, 6),
+            "close": hours(rng, n_hours, 32, 10),
+        }
+    )
+    # One invalid entry opening in the afternoon (Query 8)
+    museum_hours.loc[rng.integers(n_hours), "open"] = "01:00:PM"
+
+    return {
+        "artist": artist,
+        "canvas_size": canvas_size,
+        "museum": museum,
+        "museum_hours": museum_hours,
+    }
+
+
+def generate_work_chunk(rng, work_ids, dimensions):
+    """Generate the work, product_size, subject and image_link rows of some paintings"""
+    n = len(work_ids)
+    museum_ids = dimensions["museum"]["museum_id"].to_numpy()
+    work = pd.DataFrame(
+        {
+            "work_id": work_ids,
+            "name": [" ".join(rng.choice(words, 2)) for _ in range(n)],
+            "artist_id": zipf_choice(
+                rng, dimensions["artist"]["artist_id"].to_numpy(), n, a=0.8
+            ),
+            "style": np.where(rng.random(n) < 0.95, zipf_choice(rng, styles, n), None),
+            "museum_id": pd.Series(
+                zipf_choice(rng, museum_ids, n, a=0.7), dtype="Int64"
+            ).mask(rng.random(n) < work_without_museum),
+        }
+    )
+
+    counts = rng.poisson(sizes_per_work, n)
+    size_ids = dimensions["canvas_size"]["size_id"].to_numpy().astype(float)
+    regular_price = rng.integers(50, 200, counts.sum()) * 5
+    # A few size ids are not integers (Query 14)
+    size_id = zipf_choice(rng, size_ids, counts.sum(), a=0.9)
+    size_id[rng.random(counts.sum()) < 0.001] += 0.5
+    product_size = pd.DataFrame(
+        {
+            "work_id": np.repeat(work_ids, counts),
+            "size_id": size_id,
+            "sale_price": np.round(
+                regular_price * rng.uniform(0.4, 1.02, counts.sum())
+            ).astype(int),
+            "regular_price": regular_price,
+        }
+    )
+
+    has_subject = rng.random(n) < subjects_per_work
+    subject = pd.DataFrame(
+        {
+            "work_id": work_ids[has_subject],
+            "subject": zipf_choice(rng, subjects, has_subject.sum(), a=0.9),
+        }
+    )
+
+    image_link = pd.DataFrame(
+        {
+            "work_id": work_ids,
+            "url": [f"https://images.example.org/{i}.jpg" for i in work_ids],
+            "thumbnail_small_url": [
+                f"https://images.example.org/{i}_small.jpg" for i in work_ids
+            ],
+            "thumbnail_large_url": [
+                f"https://images.example.org/{i}_large.jpg" for i in work_ids
+            ],
+        }
+    )
+
+    return {
+        "work": with_duplicates(rng, work),
+        "product_size": with_duplicates(rng, product_size),
+        "subject": with_duplicates(rng, subject),
+        "image_link": with_duplicates(rng, image_link),
+    }
+
+
+def generate(output_dir, scale=1, seed=0, chunk_size=100_000):
+    """Write the eight csv files of the database at a given scale factor.
+
+    The paintings are generated chunk_size at a time, so the memory used
+    doesn't depend on the scale factor.
+    Returns the number of rows written by table.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    rows = {}
+    for table, df in generate_dimensions(rng, scale).items():
+        df.to_csv(os.path.join(output_dir, f"{table}.csv"), index=False)
+        rows[table] = len(df)
+    dimensions = {
+        table: pd.read_csv(os.path.join(output_dir, f"{table}.csv")) for table in rows
+    }
+
+    n_work = max(1, round(base_rows["work"] * scale))
+    for start in range(0, n_work, chunk_size):
+        work_ids = np.arange(start, min(start + chunk_size, n_work)) + 10_000
+        for table, df in generate_work_chunk(rng, work_ids, dimensions).items():
+            df.to_csv(
+                os.path.join(output_dir, f"{table}.csv"),
+                index=False,
+                mode="w" if start == 0 else "a",
+                header=start == 0,
+            )
+            rows[table] = rows.get(table, 0) + len(df)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic painting csv files"
+    )
+    parser.add_argument("output_dir", help="directory where the csv files are written")
+    parser.add_argument(
+        "--scale", type=float, default=1, help="scale factor (1: Kaggle dataset size)"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the random generator"
+    )
+    args = parser.parse_args()
+
+    for table, n in generate(args.output_dir, args.scale, args.seed).items():
+        print(f"{table}: {n} rows")
@@ -0,0 +1,117 @@
+"""This file sends concurrent requests to the HTTP service (service.py) and
+    reports its throughput and latency percentiles"""
+
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from configuration.config import SERVICE_HOST, SERVICE_PORT
+
+
+async def get(reader, writer, host, path):
+    """Send a GET request on a kept-alive connection and return its status and body"""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    return status, body
+
+
+async def client(host, port, paths, latencies, errors):
+    """Send the requests of paths one after the other on a single connection"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            status, _ = await get(reader, writer, host, path)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def load_test(host, port, ids, concurrency, requests):
+    """Send requests for the queries ids (round robin) from concurrency clients.
+
+    Returns the throughput (requests/s), the latency percentiles (in
+    seconds), the statuses other than 200 and the statistics of the service.
+    """
+    paths = [f"/queries/{ids[i % len(ids)]}" for i in range(requests)]
+    latencies, errors = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[
+            client(host, port, paths[i::concurrency], latencies, errors)
+            for i in range(concurrency)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection(host, port)
+    _, stats = await get(reader, writer, host, "/stats")
+    writer.close()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "requests_per_s": len(latencies) / elapsed,
+        "latency": {
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "p99": float(np.percentile(latencies, 99)),
+            "max": float(np.max(latencies)),
+        },
+        "errors": errors,
+        "service": json.loads(stats),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput and tail latency of the HTTP service"
+    )
+    parser.add_argument("--host", default=SERVICE_HOST, help="address of the service")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="its port")
+    parser.add_argument(
+        "--queries",
+        nargs="+",
+        type=int,
+        default=[1, 2, 5, 9, 12, 13, 16, 20],
+        help="ids of the (read-only) queries requested in turn",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=32, help="number of concurrent clients"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=2_000, help="total number of requests"
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark_service.json",
+        help="JSON file receiving the measures",
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        load_test(args.host, args.port, args.queries, args.concurrency, args.requests)
+    )
+    latency = report["latency"]
+    print(
+        f"{report['requests']} requests in {report['seconds']:.2f}s: "
+        f"{report['requests_per_s']:,.0f} requests/s, "
+        f"p50 {latency['p50'] * 1000:.1f}ms, p95 {latency['p95'] * 1000:.1f}ms, "
+        f"p99 {latency['p99'] * 1000:.1f}ms, max {latency['max'] * 1000:.1f}ms"
+    )
+    service = report["service"]
+    print(
+        f"{service['executions']} executions for {service['requests']} requests "
+        f"(coalesced), errors: {report['errors'] or 'none'}"
+    )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Measures written to {args.output}")
@@ -0,0 +1,104 @@
+"""This file measures the call rate of the parameterized solutions executed with
+    literal values, with bind parameters and as server-side prepared statements"""
+
+import argparse
+import json
+import time
+from sqlalchemy import Integer, text
+from SQLSolutions import queries, run_query
+from summaries import fresh_statements
+from database import make_engine
+from configuration.config import DATABASE_NAME
+
+
+def variants(query, count):
+    """Return count values of the parameters of a query (the integers vary
+    around their default, the other parameters keep it)"""
+    return [
+        {
+            p.name: p.default + i % 3 if isinstance(p.type, Integer) else p.default
+            for p in query.params
+        }
+        for i in range(count)
+    ]
+
+
+def call_literal(query, conn, values):
+    """Execute a query with its values written in the SQL text (a new text per
+    variant), its stale summaries read from their sources as in the other modes"""
+    for statement in fresh_statements(query, conn):
+        result = conn.execute(text(query.inline(statement, values)))
+    return result.fetchall()
+
+
+def call_bound(query, conn, values):
+    """Execute a query with typed bind parameters"""
+    return run_query(query, conn, params=values)
+
+
+def call_prepared(query, conn, values):
+    """Execute a query as server-side prepared statements"""
+    return run_query(query, conn, params=values, prepared=True)
+
+
+# Way of executing a query, by mode
+modes = {"literal": call_literal, "bound": call_bound, "prepared": call_prepared}
+
+
+def measure(query, conn, calls, warmup=10):
+    """Call a query calls times in each mode (cycling through variants of
+    its parameters) and return the calls per second of each mode"""
+    values = variants(query, calls)
+    rates = {}
+    for mode, call in modes.items():
+        for i in range(warmup):
+            call(query, conn, values[i % len(values)])
+        start = time.perf_counter()
+        for v in values:
+            call(query, conn, v)
+        rates[f"{mode}_calls_per_s"] = calls / (time.perf_counter() - start)
+    return rates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the parse and plan overhead saved by prepared statements"
+    )
+    parser.add_argument(
+        "ids",
+        nargs="*",
+        type=int,
+        help="ids of the queries to call (all the parameterized ones by default)",
+    )
+    parser.add_argument(
+        "--calls",
+        type=int,
+        default=1_000,
+        help="timed calls of each query in each mode",
+    )
+    parser.add_argument(
+        "--database", default=DATABASE_NAME, help="database holding the loaded data"
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark_prepared.json",
+        help="JSON file receiving the call rates",
+    )
+    args = parser.parse_args()
+
+    ids = args.ids or [i for i, q in queries.items() if q.read_only and q.params]
+    engine = make_engine(args.database)
+    report = {}
+    with engine.connect() as conn:
+        for i in ids:
+            report[i] = measure(queries[i], conn, args.calls)
+            print(
+                f"Query {i}: "
+                + ", ".join(
+                    f"{name.removesuffix('_calls_per_s')} {rate:,.0f} calls/s"
+                    for name, rate in report[i].items()
+                )
+            )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Call rates written to {args.output}")
@@ -0,0 +1,127 @@
+"""This file times my SQL solutions on synthetic data generated at several
+    scale factors, and writes the timings to a JSON file"""
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+import csv_to_database
+from SQLSolutions import queries, run_query
+from summaries import refresh_summaries
+from benchmarks.generate_data import generate
+from database import make_engine
+from configuration.config import BENCHMARK_DATABASE_NAME
+
+
+def load_scale(engine, data_dir, scale, seed=0):
+    """Generate the csv files of a scale factor (if needed), load them and
+    compute the summary tables"""
+    if not os.path.exists(os.path.join(data_dir, "work.csv")):
+        generate(data_dir, scale, seed)
+    csv_to_database.data_dir = data_dir
+    with engine.begin() as conn:
+        csv_to_database.ensure_load_state(conn)
+        csv_to_database.ensure_validation_tables(conn)
+    rows = {
+        file: rows
+        for file, rows, _, _ in csv_to_database.load_files(
+            engine, csv_to_database.files
+        )
+    }
+    with engine.begin() as conn:
+        for _ in refresh_summaries(conn):
+            pass
+    return rows
+
+
+def time_query(query, conn, warmup=1, repeat=5):
+    """Execute a query warmup + repeat times and return its timing statistics (in seconds)"""
+    for _ in range(warmup):
+        run_query(query, conn)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run_query(query, conn)
+        timings.append(time.perf_counter() - start)
+    return {
+        "rows": len(result),
+        "min": min(timings),
+        "p50": float(np.percentile(timings, 50)),
+        "p95": float(np.percentile(timings, 95)),
+        "max": max(timings),
+    }
+
+
+def run_benchmark(engine, scales, data_dir, ids=None, warmup=1, repeat=5, seed=0):
+    """Time the read-only solutions at each scale factor.
+
+    Returns {scale: {"rows": rows loaded by table, "queries": {query id: timings}}}.
+    """
+    ids = ids or [i for i, query in queries.items() if query.read_only]
+    report = {}
+    for scale in scales:
+        rows = load_scale(
+            engine, os.path.join(data_dir, f"scale_{scale:g}"), scale, seed
+        )
+        timings = {}
+        with engine.connect() as conn:
+            for i in ids:
+                try:
+                    timings[i] = time_query(queries[i], conn, warmup, repeat)
+                except Exception as error:
+                    conn.rollback()
+                    timings[i] = {"error": str(error)}
+                print(f"scale {scale:g} - Query {i}: {timings[i]}")
+        report[f"{scale:g}"] = {"rows": rows, "queries": timings}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark my SQL solutions")
+    parser.add_argument(
+        "--scales",
+        type=float,
+        nargs="+",
+        default=[1, 10, 100],
+        help="scale factors of the generated data",
+    )
+    parser.add_argument(
+        "--queries",
+        type=int,
+        nargs="+",
+        help="ids of the queries to time (all the read-only ones by default)",
+    )
+    parser.add_argument("--warmup", type=int, default=1, help="untimed executions")
+    parser.add_argument("--repeat", type=int, default=5, help="timed executions")
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the data generator"
+    )
+    parser.add_argument(
+        "--data-dir",
+        default="data/benchmark",
+        help="directory where the generated csv files are kept",
+    )
+    parser.add_argument(
+        "--database",
+        default=BENCHMARK_DATABASE_NAME,
+        help="database whose tables are replaced by the generated data",
+    )
+    parser.add_argument(
+        "--output", default="benchmark.json", help="JSON file receiving the timings"
+    )
+    args = parser.parse_args()
+
+    engine = make_engine(args.database, local_infile=True)
+    report = run_benchmark(
+        engine,
+        args.scales,
+        args.data_dir,
+        args.queries,
+        args.warmup,
+        args.repeat,
+        args.seed,
+    )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Timings written to {args.output}")
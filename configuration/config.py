@@ -6,3 +6,65 @@ DATABASE_PASSWORD = "your_password"
 DATABASE_HOST = "localhost"
 DATABASE_PORT = "3306"
 DATABASE_NAME = "your_database_name"
+
+# MySQL driver used by SQLAlchemy: "mysqlconnector" (pure Python), "mysqldb"
+# (mysqlclient, C extension), "pymysql" or "asyncmy" (asyncio only)
+DATABASE_DRIVER = "mysqlconnector"
+
+# Connection pool: pooled connections, extra connections allowed beyond them,
+# whether connections are checked before use, and their maximum age (in seconds)
+POOL_SIZE = 5
+POOL_MAX_OVERFLOW = 10
+POOL_PRE_PING = True
+POOL_RECYCLE = 3600
+
+# Each of the settings above can be overridden by an environment variable of
+# the same name (e.g. DATABASE_DRIVER=mysqldb python SQLSolutions.py)
+
+# Directory containing the csv files
+DATA_DIR = "data"
+
+# Directory containing the Parquet snapshots of the csv files
+SNAPSHOT_DIR = "data/parquet"
+
+# Number of csv rows read and written at once when loading the data
+CHUNK_SIZE = 50_000
+
+# Number of rows sent in a single multi-row insert statement
+BATCH_SIZE = 5_000
+
+# Number of tables loaded in parallel (each one on its own connection)
+WORKERS = 4
+
+# Partitioning of the large fact tables: "work_id" or "museum_id" (see
+# schema.partitionings)
+PARTITIONING = "work_id"
+
+# Solutions filtering the partitioned tables, which must read only some of
+# their partitions (python partitions.py check fails otherwise)
+PRUNING_TARGETS = (12, 16, 17, 20, 22)
+
+# Number of read-only solutions executed at the same time (each one on its own connection)
+QUERY_WORKERS = 8
+
+# Number of rows fetched from the server and written at once when exporting a result
+EXPORT_BATCH_SIZE = 10_000
+
+# File storing the results of the solutions, and its maximum size (in bytes)
+RESULT_CACHE_PATH = ".cache/results.sqlite"
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Address of the HTTP service answering the questions, and the number of
+# queries it executes at the same time on each backend
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8000
+SERVICE_CONCURRENCY = 8
+
+# Database used by the benchmarks (its tables are replaced by generated data)
+BENCHMARK_DATABASE_NAME = "painting_benchmark"
+
+# DuckDB database used by the embedded backend (":memory:" reads the csv files on each run)
+DUCKDB_PATH = ":memory:"
+
+# Number of finished spans kept in memory until they are written (the oldest ones are dropped)
+MAX_SPANS = 100_000
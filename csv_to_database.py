@@ -1,21 +1,40 @@
 """This file contains my solutions about some SQL queries
     using the famous painting database"""
 
+import argparse
+import contextvars
+import hashlib
+import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import inspect, text
+import metrics
+import schema
+import snapshots
+from normalization import derived_columns, normalize_chunks, update_statements
+from summaries import refresh_summaries
+from validation import (
+    ensure_validation_tables,
+    quarantine_table,
+    validate_chunks,
+    validate_table,
+    validation_summary,
+)
+from deduplication import deduplicate as deduplicate_table, drop_duplicate_rows
+from result_cache import ResultCache, bump_versions
+from partitions import split_by_partition
+from database import make_engine
 from configuration.config import (
-    DATABASE_USER,
-    DATABASE_PASSWORD,
-    DATABASE_HOST,
-    DATABASE_PORT,
-    DATABASE_NAME,
+    DATA_DIR,
+    CHUNK_SIZE,
+    BATCH_SIZE,
+    WORKERS,
 )
 
-# Create a database connection with SQLAlchemy (MySQL Server)
-engine = create_engine(
-    f"mysql+mysqlconnector://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
-)
-conn = engine.connect()  # Connection to the database
+# Directory containing the csv files
+data_dir = DATA_DIR
 
 # List of csv file names
 files = [
@@ -29,7 +48,759 @@ files = [
     "work",
 ]
 
-# Save data in your SQL database
-for file in files:
-    df = pd.read_csv(f"data/{file}.csv")
-    df.to_sql(file, con=conn, if_exists="replace", index=False)
+
+def csv_path(file):
+    """Return the path of the csv file of a table"""
+    return os.path.join(data_dir, f"{file}.csv")
+
+
+def read_chunks(file, chunk_size=CHUNK_SIZE, deduplicate=False, snapshot=False):
+    """Read a csv file lazily, chunk_size rows at a time.
+
+    With snapshot=True, the rows are read from the Parquet snapshot of the
+    file (built first if it is missing or stale) instead of parsing it.
+    With deduplicate=True, the rows already read are dropped.
+    The typed columns computed from the csv columns (see normalization.py)
+    are added to each chunk.
+    Reading the rows is timed as the "parse" stage of the load, and what
+    follows as its "transform" stage (see metrics.py).
+    """
+    if snapshot:
+        snapshots.ensure_snapshot(file, data_dir, chunk_size=chunk_size)
+        chunks = snapshots.iter_snapshot(file, chunk_size)
+    else:
+        chunks = pd.read_csv(
+            csv_path(file), dtype=schema.dtypes.get(file), chunksize=chunk_size
+        )
+    chunks = metrics.timed_chunks(chunks, "parse", file, source=True)
+    chunks = metrics.counted_chunks(chunks, "transform", file)
+    if deduplicate:
+        chunks = drop_duplicate_rows(chunks)
+    return normalize_chunks(file, chunks)
+
+
+def csv_columns(file):
+    """Return the columns of a csv file"""
+    return list(pd.read_csv(csv_path(file), nrows=0).columns)
+
+
+def table_columns(file):
+    """Return the columns written to a table: those of its csv file, then the
+    ones computed from them (the columns generated by the server excepted)"""
+    generated = schema.generated_columns(file)
+    return csv_columns(file) + [c for c in derived_columns(file) if c not in generated]
+
+
+def staging_table(file):
+    """Return the name of the staging table a table is reloaded into"""
+    return f"{file}__staging"
+
+
+def create_table(file, conn, keyed=False, indexes="after", table=None):
+    """(Re)create an empty table from the schema (see schema.py).
+
+    With indexes="before" the secondary indexes are created with the table,
+    otherwise they are left to be built once the data is loaded.
+    With keyed=True, a unique key is added on the natural key of the table
+    so that rows can be upserted.
+    With table, the table is created under that name (e.g. its staging table).
+    Returns the columns written to the table.
+    """
+    partitioning = schema.partitioning.get(file)
+    if keyed and partitioning and partitioning.column not in schema.natural_keys[file]:
+        # MySQL requires the unique keys of a table to include its partitioning column
+        raise ValueError(
+            f"{file} is partitioned on {partitioning.column}, "
+            "which is not part of its natural key"
+        )
+    schema.create_table(file, conn, indexes=indexes == "before", target=table)
+    if keyed:
+        conn.execute(
+            text(
+                f"alter table `{table or file}` add unique key natural_key "
+                f"({', '.join(f'`{c}`' for c in schema.natural_keys[file])})"
+            )
+        )
+    return table_columns(file)
+
+
+def to_records(chunk):
+    """Convert a chunk to a list of dicts, with None instead of missing values"""
+    return chunk.astype(object).where(chunk.notna(), None).to_dict("records")
+
+
+def checked_chunks(file, chunks, conn, reset=True, table=None):
+    """Check the data-quality rules on the chunks of a table (see validation.py),
+    the end of the "transform" stage of its load (into table, if it is given).
+
+    The flag columns are left out: the server generates them.
+    """
+    generated = list(schema.generated_columns(file))
+    chunks = (
+        chunk.drop(columns=generated)
+        for chunk in validate_chunks(file, chunks, conn, reset, table)
+    )
+    return metrics.timed_chunks(chunks, "transform", file)
+
+
+def write_batches(file, conn, statement, chunk, batch_size=BATCH_SIZE):
+    """Execute a statement on the rows of a chunk, batch_size rows at a time
+    (the "write" stage of the load of a table). Returns the number of rows."""
+    records = to_records(chunk)
+    with metrics.stage("write", file):
+        for start in range(0, len(records), batch_size):
+            conn.execute(statement, records[start : start + batch_size])
+    size = int(chunk.memory_usage(deep=True).sum())
+    metrics.record_rows("write", file, len(records), len(records), size)
+    return len(records)
+
+
+def local_infile_enabled(conn):
+    """Check whether the server accepts LOAD DATA LOCAL INFILE"""
+    try:
+        return bool(conn.execute(text("select @@global.local_infile")).scalar())
+    except Exception:
+        return False
+
+
+def load_with_to_sql(
+    file,
+    conn,
+    chunk_size=CHUNK_SIZE,
+    indexes="after",
+    deduplicate=False,
+    snapshot=False,
+    table=None,
+):
+    """Stream a csv file into the table of the same name (or into table) with
+    pandas' to_sql.
+
+    The chunks are appended to the table one after another, so only one
+    chunk is held in memory at a time. The rows breaking a data-quality rule
+    are quarantined or flagged on the way (see validation.py).
+    Returns the number of rows written.
+    """
+    table = table or file
+    create_table(file, conn, indexes=indexes, table=table)
+    rows = 0
+    chunks = read_chunks(file, chunk_size, deduplicate, snapshot)
+    for chunk in checked_chunks(file, chunks, conn, table=table):
+        with metrics.stage("write", file):
+            chunk.to_sql(table, con=conn, if_exists="append", index=False)
+        size = int(chunk.memory_usage(deep=True).sum())
+        metrics.record_rows("write", file, len(chunk), len(chunk), size)
+        rows += len(chunk)
+    return rows
+
+
+def load_with_insert(
+    file,
+    conn,
+    chunk_size=CHUNK_SIZE,
+    batch_size=BATCH_SIZE,
+    indexes="after",
+    deduplicate=False,
+    snapshot=False,
+    table=None,
+):
+    """Stream a csv file into its table (or into table) with batched multi-row inserts.
+
+    Each batch of batch_size rows is sent with executemany, which the MySQL
+    drivers rewrite as a single insert ... values (...), (...) statement.
+    The rows breaking a data-quality rule are quarantined or flagged on the
+    way (see validation.py). The rows of a partitioned table are written
+    partition by partition (grouped by partitions.split_by_partition), so
+    each batch only opens and locks one partition, the server routing the
+    rows itself. They are written on the connection of the load, in its
+    transaction, a failed load leaving no rows behind: the partitions are
+    written in parallel by partitions.reload_partitions instead.
+    Returns the number of rows written.
+    """
+    table = table or file
+    columns = create_table(file, conn, indexes=indexes, table=table)
+
+    insert = text(
+        f"insert into `{table}` ({', '.join(f'`{c}`' for c in columns)}) "
+        f"values ({', '.join(f':{c}' for c in columns)})"
+    )
+    rows = 0
+    chunks = read_chunks(file, chunk_size, deduplicate, snapshot)
+    for chunk in checked_chunks(file, chunks, conn, table=table):
+        parts = (
+            split_by_partition(file, chunk).values()
+            if file in schema.partitioning
+            else [chunk]
+        )
+        for part in parts:
+            rows += write_batches(file, conn, insert, part, batch_size)
+    return rows
+
+
+def load_with_load_data(file, conn, indexes="after", deduplicate=False, table=None):
+    """Load a csv file with LOAD DATA LOCAL INFILE (into table if it is given).
+
+    The file is streamed by the driver and parsed by the server, which is
+    by far the fastest path. Empty fields are stored as NULL, and the typed
+    columns computed from the csv columns are then filled in one update.
+    The data-quality rules are then checked on the server (see validation.py).
+    With deduplicate=True, the duplicate rows are then removed in a single
+    pass over the table (see deduplication.py).
+    Returns the number of rows written.
+    """
+    table = table or file
+    create_table(file, conn, indexes=indexes, table=table)
+    columns = csv_columns(file)
+    path = os.path.abspath(csv_path(file)).replace("\\", "/").replace("'", "\\'")
+    variables = ", ".join(f"@v{i}" for i in range(len(columns)))
+    # The last field of a line may keep the '\r' of Windows line endings
+    assignments = ", ".join(
+        (
+            f"`{c}` = nullif(trim(trailing '\\r' from @v{i}), '')"
+            if i == len(columns) - 1
+            else f"`{c}` = nullif(@v{i}, '')"
+        )
+        for i, c in enumerate(columns)
+    )
+    # The server parses and writes the rows at once: it is all the "write" stage
+    with metrics.stage("write", file):
+        result = conn.execute(
+            text(
+                f"load data local infile '{path}' into table `{table}` "
+                "character set utf8mb4 "
+                "fields terminated by ',' optionally enclosed by '\"' "
+                "lines terminated by '\\n' "
+                "ignore 1 lines "
+                f"({variables}) set {assignments}"
+            )
+        )
+    size = os.path.getsize(csv_path(file))
+    metrics.record_rows("write", file, result.rowcount, result.rowcount, size)
+    with metrics.stage("transform", file):
+        if file in update_statements:
+            conn.execute(text(update_statements[file].format(table=table)))
+        rows = result.rowcount - validate_table(file, conn, table)
+        if deduplicate:
+            rows -= deduplicate_table(table, conn)
+    metrics.record_rows("transform", file, result.rowcount, rows)
+    return rows
+
+
+def ensure_load_state(conn):
+    """Create the table storing the fingerprint of the last loaded csv files"""
+    conn.execute(text("""
+            create table if not exists load_state (
+                table_name varchar(64) primary key,
+                size bigint not null,
+                mtime double not null,
+                sha256 char(64) not null,
+                loaded_at timestamp default current_timestamp
+                    on update current_timestamp
+            )
+            """))
+
+
+def get_load_state(file, conn):
+    """Return the fingerprint recorded for a table, or None"""
+    return (
+        conn.execute(
+            text("select size, mtime, sha256 from load_state where table_name = :t"),
+            {"t": file},
+        )
+        .mappings()
+        .first()
+    )
+
+
+def set_load_state(file, conn, fingerprint):
+    """Record the fingerprint of the csv file a table has been loaded from"""
+    conn.execute(text("delete from load_state where table_name = :t"), {"t": file})
+    conn.execute(
+        text(
+            "insert into load_state (table_name, size, mtime, sha256) "
+            "values (:t, :size, :mtime, :sha256)"
+        ),
+        {"t": file, **fingerprint},
+    )
+
+
+def clear_load_state(file, conn):
+    """Forget the fingerprint of a table (its next incremental load is a full one)"""
+    conn.execute(text("delete from load_state where table_name = :t"), {"t": file})
+
+
+def ensure_row_hashes(conn):
+    """Create the table storing a hash of each row loaded incrementally, by
+    hash of its natural key"""
+    conn.execute(text("""
+            create table if not exists row_hash (
+                table_name varchar(64) not null,
+                key_hash bigint unsigned not null,
+                row_hash bigint unsigned not null,
+                primary key (table_name, key_hash)
+            )
+            """))
+
+
+def clear_row_hashes(file, conn):
+    """Forget the hashes of the rows of a table"""
+    conn.execute(text("delete from row_hash where table_name = :t"), {"t": file})
+
+
+def changed_rows(file, chunks, conn, batch_size=BATCH_SIZE):
+    """Yield the rows of the chunks which are new or changed since they were
+    last loaded, recording their hashes.
+
+    A row is compared with the one last loaded with the same natural key
+    through a 64-bit hash of its csv columns. The rows whose natural key
+    appears more than once in a chunk are always kept, so the last one
+    wins, as when all the rows are upserted.
+    """
+    current = dict(
+        conn.execute(
+            text("select key_hash, row_hash from row_hash where table_name = :t"),
+            {"t": file},
+        ).fetchall()
+    )
+    record = text(
+        "insert into row_hash (table_name, key_hash, row_hash) "
+        "values (:t, :key, :row) on duplicate key update row_hash = values(row_hash)"
+    )
+    for chunk in chunks:
+        keys = pd.util.hash_pandas_object(
+            chunk[schema.natural_keys[file]], index=False
+        ).to_numpy()
+        hashes = pd.util.hash_pandas_object(
+            chunk[list(schema.dtypes[file])], index=False
+        ).to_numpy()
+        changed = np.array(
+            [current.get(int(k)) != int(h) for k, h in zip(keys, hashes)], dtype=bool
+        )
+        changed |= pd.Series(keys).duplicated(keep=False).to_numpy()
+        records = [
+            {"t": file, "key": int(k), "row": int(h)}
+            for k, h in zip(keys[changed], hashes[changed])
+        ]
+        for start in range(0, len(records), batch_size):
+            conn.execute(record, records[start : start + batch_size])
+        current.update((r["key"], r["row"]) for r in records)
+        if changed.any():
+            yield chunk[changed]
+
+
+def file_fingerprint(file, prefix_size=None):
+    """Compute the size, mtime and sha256 of a csv file.
+
+    When prefix_size is given, the sha256 of the first prefix_size bytes is
+    also returned (None otherwise), which tells whether rows were only
+    appended to the file since it was last loaded.
+    """
+    path = csv_path(file)
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    prefix_digest = None
+    read = 0
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            if prefix_size is not None and read <= prefix_size < read + len(block):
+                digest.update(block[: prefix_size - read])
+                prefix_digest = digest.copy().hexdigest()
+                digest.update(block[prefix_size - read :])
+            else:
+                digest.update(block)
+            read += len(block)
+    if prefix_size == read:
+        prefix_digest = digest.hexdigest()
+    fingerprint = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": digest.hexdigest(),
+    }
+    return fingerprint, prefix_digest
+
+
+def read_csv_tail(file, offset, columns, chunk_size=CHUNK_SIZE):
+    """Read the rows of a csv file starting at a byte offset, chunk_size rows at a time"""
+    with open(csv_path(file), "rb") as f:
+        f.seek(offset)
+        chunks = pd.read_csv(
+            f,
+            header=None,
+            names=columns,
+            dtype=schema.dtypes.get(file),
+            chunksize=chunk_size,
+        )
+        chunks = metrics.timed_chunks(chunks, "parse", file, source=True)
+        yield from normalize_chunks(
+            file, metrics.counted_chunks(chunks, "transform", file)
+        )
+
+
+def upsert_chunks(file, conn, chunks, columns, batch_size=BATCH_SIZE):
+    """Insert rows, updating the existing ones with the same natural key.
+
+    Rows which didn't change are left untouched by the server.
+    Returns the number of rows sent.
+    """
+    keys = schema.natural_keys[file]
+    updated = [c for c in columns if c not in keys] or keys
+    upsert = text(
+        f"insert into `{file}` ({', '.join(f'`{c}`' for c in columns)}) "
+        f"values ({', '.join(f':{c}' for c in columns)}) "
+        "on duplicate key update "
+        + ", ".join(f"`{c}` = values(`{c}`)" for c in updated)
+    )
+    return sum(write_batches(file, conn, upsert, chunk, batch_size) for chunk in chunks)
+
+
+def load_incremental(
+    file, conn, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, indexes="after"
+):
+    """Load only what changed in a csv file since its last incremental load.
+
+    - unchanged file (same size and mtime, or same sha256): nothing is done
+    - rows appended at the end of the file: only the new rows are upserted
+    - any other change: every row is read and hashed, and only the rows
+      which are new or changed since they were loaded (see changed_rows)
+      are checked and upserted on the natural key of the table
+    - first load: the table is created with a unique natural key and filled
+
+    Rows are upserted on their natural key, so duplicated rows of the csv
+    file are stored once. Rows removed from the file are not deleted.
+    The validation summary of the table adds up the rows checked by each
+    load. Returns the number of rows sent and what was done.
+    """
+    state = get_load_state(file, conn)
+    stat = os.stat(csv_path(file))
+    if state is not None and (stat.st_size, stat.st_mtime) == (
+        state["size"],
+        state["mtime"],
+    ):
+        return 0, "unchanged"
+
+    fingerprint, prefix_digest = file_fingerprint(
+        file, state["size"] if state is not None else None
+    )
+    if state is not None and fingerprint["sha256"] == state["sha256"]:
+        set_load_state(file, conn, fingerprint)  # only the mtime changed
+        return 0, "unchanged"
+
+    ensure_row_hashes(conn)
+    if state is None:
+        columns = create_table(file, conn, keyed=True, indexes=indexes)
+        clear_row_hashes(file, conn)
+        chunks = changed_rows(file, read_chunks(file, chunk_size), conn, batch_size)
+        chunks = checked_chunks(file, chunks, conn)
+        rows = upsert_chunks(file, conn, chunks, columns, batch_size)
+        action = "full upsert"
+    else:
+        columns = table_columns(file)
+        with open(csv_path(file), "rb") as f:
+            f.seek(max(state["size"] - 1, 0))
+            ends_with_newline = f.read(1) == b"\n"
+        if prefix_digest == state["sha256"] and ends_with_newline:
+            chunks = read_csv_tail(file, state["size"], csv_columns(file), chunk_size)
+            action = "appended rows upsert"
+        else:
+            chunks = read_chunks(file, chunk_size)
+            action = "changed rows upsert"
+        chunks = changed_rows(file, chunks, conn, batch_size)
+        chunks = checked_chunks(file, chunks, conn, reset=False)
+        rows = upsert_chunks(file, conn, chunks, columns, batch_size)
+
+    if indexes == "after":
+        with metrics.stage("index", file):
+            schema.create_indexes(file, conn)
+    set_load_state(file, conn, fingerprint)
+    bump_versions(conn, [file])
+    return rows, action
+
+
+def load_table(
+    file,
+    conn,
+    method="auto",
+    chunk_size=CHUNK_SIZE,
+    batch_size=BATCH_SIZE,
+    incremental=False,
+    indexes="after",
+    deduplicate=False,
+    snapshot=False,
+    staging=False,
+):
+    """Load a csv file into the table of the same name.
+
+    method is one of "load-data", "insert", "to-sql" or "auto" (LOAD DATA
+    LOCAL INFILE when the server allows it, batched inserts otherwise).
+    With incremental=True, only the rows which changed since the last
+    incremental load are upserted (see load_incremental).
+    The secondary indexes of the schema are created "before" the data is
+    loaded, "after" it (faster), or not at all ("none").
+    With deduplicate=True, duplicate rows are dropped while loading (in
+    incremental mode, rows are always stored once per natural key).
+    With snapshot=True, the rows are read from the Parquet snapshot of the
+    csv file (LOAD DATA needs the csv file, so "auto" means "insert").
+    With staging=True, the rows are loaded into the staging table of the
+    table and its indexes are built there, the table itself (with its
+    quarantine table, validation summary and load state) being left
+    untouched until the staging table replaces it (see swap_staging_tables).
+    Returns the number of rows written and the method used.
+    """
+    if incremental:
+        if staging:
+            raise ValueError("An incremental load updates the table in place")
+        return load_incremental(file, conn, chunk_size, batch_size, indexes)
+    table = staging_table(file) if staging else file
+    if not staging:
+        clear_load_state(file, conn)
+    if method == "auto":
+        use_load_data = not snapshot and local_infile_enabled(conn)
+        method = "load-data" if use_load_data else "insert"
+    if method == "load-data":
+        rows = load_with_load_data(file, conn, indexes, deduplicate, table)
+    elif method == "insert":
+        rows = load_with_insert(
+            file, conn, chunk_size, batch_size, indexes, deduplicate, snapshot, table
+        )
+    else:
+        rows = load_with_to_sql(
+            file, conn, chunk_size, indexes, deduplicate, snapshot, table
+        )
+    if indexes == "after":
+        with metrics.stage("index", file):
+            schema.create_indexes(file, conn, table)
+    if not staging:
+        bump_versions(conn, [file])
+    return rows, method
+
+
+def swap_staging_tables(conn, files):
+    """Replace the tables of files, and their quarantine tables, by their
+    staging tables.
+
+    All the tables are swapped by a single RENAME TABLE statement, which is
+    atomic: the queries see either all the old tables or all the new ones,
+    and never a missing or half-loaded table. The old tables are dropped
+    afterwards, and the validation summaries of the staging tables become
+    the ones of the tables.
+    """
+    existing = set(inspect(conn).get_table_names())
+    pairs = []
+    for file in files:
+        staging = staging_table(file)
+        pairs.append((file, staging))
+        if quarantine_table(file, staging).name in existing:
+            pairs.append(
+                (quarantine_table(file).name, quarantine_table(file, staging).name)
+            )
+    renames, old = [], []
+    for table, staging in pairs:
+        if table in existing:
+            old.append(f"{table}__old")
+            renames.append(f"`{table}` to `{table}__old`")
+        renames.append(f"`{staging}` to `{table}`")
+    for table in old:
+        conn.execute(text(f"drop table if exists `{table}`"))
+    conn.execute(text(f"rename table {', '.join(renames)}"))
+    for table in old:
+        conn.execute(text(f"drop table `{table}`"))
+    bump_versions(conn, files)
+    for file in files:
+        clear_load_state(file, conn)
+        conn.execute(
+            text("delete from validation_summary where table_name = :t"), {"t": file}
+        )
+        conn.execute(
+            text("update validation_summary set table_name = :t where table_name = :s"),
+            {"t": file, "s": staging_table(file)},
+        )
+
+
+def drop_staging_tables(conn, files):
+    """Drop the staging tables of files, their quarantine tables and their
+    validation summaries (e.g. after a failed load)"""
+    for file in files:
+        staging = staging_table(file)
+        conn.execute(text(f"drop table if exists `{staging}`"))
+        conn.execute(
+            text(f"drop table if exists `{quarantine_table(file, staging).name}`")
+        )
+        conn.execute(
+            text("delete from validation_summary where table_name = :t"),
+            {"t": staging},
+        )
+
+
+def load_file(engine, file, **options):
+    """Load one csv file on its own connection, in its own transaction.
+
+    Returns the file name, the number of rows written, the method used
+    and the time spent.
+    """
+    start = time.perf_counter()
+    with metrics.span("load_table", table=file) as span:
+        with engine.begin() as conn:
+            rows, method = load_table(file, conn, **options)
+        span.set(rows=rows, method=method)
+    return file, rows, method, time.perf_counter() - start
+
+
+def load_files(engine, files, workers=WORKERS, **options):
+    """Load several csv files, up to workers of them at the same time.
+
+    The tables don't depend on each other, so each worker takes its own
+    pooled connection and loads one table. Results are yielded as soon as
+    a table is done.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Each table is traced in a copy of the current context (its span is a child)
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, load_file, engine, file, **options
+            )
+            for file in files
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the csv files into the database")
+    parser.add_argument(
+        "--data-dir",
+        default=DATA_DIR,
+        help="directory containing the csv files",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="number of csv rows read and written at once",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="number of rows sent in a single multi-row insert",
+    )
+    parser.add_argument(
+        "--method",
+        choices=["auto", "load-data", "insert", "to-sql"],
+        default="auto",
+        help="how rows are written (auto: LOAD DATA LOCAL INFILE if allowed, else insert)",
+    )
+    parser.add_argument(
+        "--indexes",
+        choices=["after", "before", "none"],
+        default="after",
+        help="when the secondary indexes are built (after the load is faster)",
+    )
+    parser.add_argument(
+        "--deduplicate",
+        action="store_true",
+        help="drop the duplicate rows of the csv files while loading them",
+    )
+    parser.add_argument(
+        "--from-snapshots",
+        action="store_true",
+        help="read the rows from the Parquet snapshots of the csv files (rebuilt when stale)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip unchanged files and only upsert the rows which changed",
+    )
+    parser.add_argument(
+        "--staging",
+        action="store_true",
+        help="load into staging tables swapped in at once when every table is loaded",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="write the rows, bytes and time of each stage of each table to a "
+        "Prometheus text file",
+    )
+    parser.add_argument(
+        "--traces",
+        metavar="FILE",
+        help="append the spans of the run to a file (OpenTelemetry JSON)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="number of tables loaded in parallel",
+    )
+    args = parser.parse_args()
+    data_dir = args.data_dir
+    if args.staging and args.incremental:
+        parser.error("--staging reloads the tables, it can't be --incremental")
+
+    # Create a database connection with SQLAlchemy (MySQL Server)
+    engine = make_engine(pool_size=args.workers, local_infile=True)
+
+    with engine.begin() as conn:
+        ensure_load_state(conn)
+        ensure_validation_tables(conn)
+
+    cache = ResultCache()
+
+    # The run is traced as one span, its metrics and spans written even if it fails
+    try:
+        with metrics.span("load", tables=len(files)):
+            # Save data in your SQL database
+            start = time.perf_counter()
+            changed = []
+            try:
+                for file, rows, method, elapsed in load_files(
+                    engine,
+                    files,
+                    workers=args.workers,
+                    method=args.method,
+                    chunk_size=args.chunk_size,
+                    batch_size=args.batch_size,
+                    incremental=args.incremental,
+                    indexes=args.indexes,
+                    deduplicate=args.deduplicate,
+                    snapshot=args.from_snapshots,
+                    staging=args.staging,
+                ):
+                    if method != "unchanged":
+                        changed.append(file)
+                    print(
+                        f"{file}: {rows} rows loaded in {elapsed:.2f}s "
+                        f"({rows / elapsed:.0f} rows/s, {method})"
+                    )
+            except Exception:
+                if args.staging:
+                    # The tables in use are untouched, only the staging tables are dropped
+                    with engine.begin() as conn:
+                        drop_staging_tables(conn, files)
+                raise
+            if args.staging:
+                with metrics.span("swap_staging_tables"), engine.begin() as conn:
+                    swap_staging_tables(conn, files)
+            for file in changed:
+                cache.invalidate(file)  # the cached results using this table are stale
+            print(f"All tables loaded in {time.perf_counter() - start:.2f}s")
+
+            # Rows which broke the data-quality rules during this run
+            with engine.connect() as conn:
+                summary = validation_summary(conn, changed)
+            for row in summary.itertuples():
+                print(
+                    f"{row.table_name}.{row.rule}: {row.rows_broken} of {row.rows_checked} "
+                    f"rows {'quarantined' if row.action == 'quarantine' else 'flagged'}"
+                )
+
+            # Recompute the summary tables computed from the reloaded tables only
+            with metrics.span("refresh_summaries"), engine.begin() as conn:
+                for name, rows, elapsed in refresh_summaries(conn, changed):
+                    bump_versions(conn, [name])
+                    cache.invalidate(name)
+                    print(f"{name}: {rows} rows summarized in {elapsed:.2f}s")
+    finally:
+        if args.metrics:
+            metrics.write_prometheus(args.metrics)
+        if args.traces:
+            metrics.write_spans(args.traces)
@@ -0,0 +1,86 @@
+"""This file contains the factory of the SQLAlchemy engines connected to the
+MySQL server, whatever the driver used"""
+
+import os
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+from configuration import config
+
+# Drivers supported by the factory, and the connect argument enabling
+# LOAD DATA LOCAL INFILE for each of them
+local_infile_args = {
+    "mysqlconnector": {"allow_local_infile": True},
+    "mysqldb": {"local_infile": 1},
+    "pymysql": {"local_infile": True},
+    "asyncmy": {"local_infile": True},
+}
+drivers = list(local_infile_args)
+
+# Drivers which can only be used with asyncio
+async_drivers = ["asyncmy"]
+
+
+def setting(name):
+    """Return a setting of configuration/config.py, overridden by the
+    environment variable of the same name if it is set"""
+    default = getattr(config, name)
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes", "on")
+    return type(default)(value)
+
+
+def engine_url(driver=None, database=None):
+    """Return the URL of the database for a driver (the configured one by default)"""
+    return URL.create(
+        f"mysql+{driver or setting('DATABASE_DRIVER')}",
+        username=setting("DATABASE_USER"),
+        password=setting("DATABASE_PASSWORD"),
+        host=setting("DATABASE_HOST"),
+        port=int(setting("DATABASE_PORT")),
+        database=database or setting("DATABASE_NAME"),
+    )
+
+
+def engine_options(driver, pool_size=None, local_infile=False, **options):
+    """Return the options of create_engine: the pool settings and the connect arguments"""
+    if driver not in local_infile_args:
+        raise ValueError(f"Unknown MySQL driver {driver!r}, use one of {drivers}")
+    return {
+        "pool_size": pool_size or setting("POOL_SIZE"),
+        "max_overflow": setting("POOL_MAX_OVERFLOW"),
+        "pool_pre_ping": setting("POOL_PRE_PING"),
+        "pool_recycle": setting("POOL_RECYCLE"),
+        "connect_args": local_infile_args[driver] if local_infile else {},
+        **options,
+    }
+
+
+def make_engine(
+    database=None, driver=None, pool_size=None, local_infile=False, **options
+):
+    """Create an engine connected to the database (DATABASE_NAME by default).
+
+    The driver and pool settings come from config.py or the environment,
+    pool_size overrides POOL_SIZE (e.g. one connection per worker), and
+    local_infile=True allows LOAD DATA LOCAL INFILE.
+    Other options are passed to create_engine.
+    """
+    driver = driver or setting("DATABASE_DRIVER")
+    if driver in async_drivers:
+        raise ValueError(f"{driver} is an asyncio driver, use make_async_engine")
+    return create_engine(
+        engine_url(driver, database),
+        **engine_options(driver, pool_size, local_infile, **options),
+    )
+
+
+def make_async_engine(database=None, driver="asyncmy", pool_size=None, **options):
+    """Create an asyncio engine connected to the database (asyncmy by default)"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    return create_async_engine(
+        engine_url(driver, database), **engine_options(driver, pool_size, **options)
+    )
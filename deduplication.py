@@ -0,0 +1,104 @@
+"""This file contains the tools to remove duplicate records from the tables
+    of the famous painting database, in the database or while loading them"""
+
+import argparse
+import pandas as pd
+from sqlalchemy import text
+import schema
+from result_cache import bump_versions
+from database import make_engine
+
+# Tables containing duplicate records in the csv files (see Query 6)
+tables_with_duplicates = ["work", "product_size", "subject", "image_link"]
+
+
+def deduplication_statements(table, keys=None):
+    """Return the SQL statements removing the duplicate records of a table.
+
+    The table is read once: the distinct rows (or the first row of each
+    key, if keys are given) are written to a staging table, which then
+    replaces the table in a single atomic RENAME TABLE. NULLs are equal to
+    each other for DISTINCT and PARTITION BY, so rows containing NULLs are
+    deduplicated too.
+    """
+    staging, old = f"{table}__dedup", f"{table}__old"
+    # The generated columns are computed again by the server
+    columns = ", ".join(f"`{c}`" for c in schema.stored_columns(table))
+    if keys is None:
+        select = f"select distinct {columns} from `{table}`"
+    else:
+        partition = ", ".join(f"`{c}`" for c in keys)
+        select = (
+            f"select {columns} from (select *, row_number() over "
+            f"(partition by {partition}) as rn from `{table}`) as x where rn = 1"
+        )
+    return [
+        f"drop table if exists `{staging}`, `{old}`",
+        f"create table `{staging}` like `{table}`",
+        f"insert into `{staging}` ({columns}) {select}",
+        f"rename table `{table}` to `{old}`, `{staging}` to `{table}`",
+        f"drop table `{old}`",
+    ]
+
+
+def count_duplicates(table, conn):
+    """Return the number of rows of a table which duplicate another row"""
+    return conn.execute(
+        text(
+            f"select (select count(*) from `{table}`) "
+            f"- (select count(*) from (select distinct * from `{table}`) as x)"
+        )
+    ).scalar()
+
+
+def deduplicate(table, conn, keys=None):
+    """Remove the duplicate records of a table and return the number of rows removed.
+
+    With keys, rows are duplicates when they have the same values for these
+    columns (the first one read is kept), otherwise when all their values
+    are the same.
+    """
+    before = conn.execute(text(f"select count(*) from `{table}`")).scalar()
+    for statement in deduplication_statements(table, keys):
+        conn.execute(text(statement))
+    return before - conn.execute(text(f"select count(*) from `{table}`")).scalar()
+
+
+def drop_duplicate_rows(chunks):
+    """Yield the chunks of a csv file without the rows already seen.
+
+    Rows are compared through a 64-bit hash of their values (missing values
+    included), so only the hashes of the rows seen are kept in memory.
+    """
+    seen = set()
+    for chunk in chunks:
+        hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        keep &= ~pd.Series(hashes).isin(seen).to_numpy()
+        seen.update(hashes[keep].tolist())
+        yield chunk[keep]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove duplicate records from tables")
+    parser.add_argument(
+        "tables",
+        nargs="*",
+        default=tables_with_duplicates,
+        help="tables to deduplicate (work, product_size, subject and image_link by default)",
+    )
+    parser.add_argument(
+        "--keys",
+        nargs="+",
+        help="columns identifying a record (all the columns by default)",
+    )
+    args = parser.parse_args()
+
+    # Create a database connection with SQLAlchemy (MySQL Server)
+    engine = make_engine()
+    with engine.connect() as conn:
+        for table in args.tables:
+            removed = deduplicate(table, conn, args.keys)
+            print(f"{table}: {removed} duplicate rows removed")
+        bump_versions(conn, args.tables)
+        conn.commit()
@@ -0,0 +1,184 @@
+"""This file contains the export of the results of my SQL solutions to CSV,
+    JSONL or Parquet files, streamed from the server in fixed-size batches"""
+
+import argparse
+import os
+import time
+import pandas as pd
+from SQLSolutions import check_ids, params_of, queries
+from summaries import fresh_statements
+from database import make_engine
+from configuration.config import EXPORT_BATCH_SIZE
+
+# Drivers able to stream a result with an unbuffered (server-side) cursor.
+# SQLAlchemy always buffers the results of mysqlconnector, which can only be
+# used to export small results.
+streaming_drivers = ["pymysql", "mysqldb"]
+
+
+def stream_query(query, conn, batch_size=EXPORT_BATCH_SIZE, params=None):
+    """Execute a read-only query and yield its result batch_size rows at a time, as DataFrames.
+
+    The last statement is executed with an unbuffered cursor (stream_results),
+    so only one batch is held in memory at a time. A result without rows is
+    yielded as one empty DataFrame, to keep its columns. The stale summaries
+    are read from their sources (see summaries.fresh_statements).
+    params overrides the default values of the query's parameters.
+    """
+    if not query.read_only:
+        raise PermissionError(f"Query {query.id} modifies the database")
+    arguments = query.arguments(params)
+    statements = fresh_statements(query, conn)
+    for statement in statements[:-1]:
+        conn.execute(query.bind(statement), arguments)
+    result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+        query.bind(statements[-1]), arguments
+    )
+    columns = list(result.keys())
+    empty = True
+    for rows in result.partitions():
+        empty = False
+        yield pd.DataFrame(rows, columns=columns)
+    if empty:
+        yield pd.DataFrame(columns=columns)
+
+
+def write_csv(batches, path):
+    """Write batches of rows to a CSV file, the header first"""
+    rows = 0
+    with open(path, "w", newline="") as f:
+        for i, batch in enumerate(batches):
+            batch.to_csv(f, header=i == 0, index=False)
+            rows += len(batch)
+    return rows
+
+
+def write_jsonl(batches, path):
+    """Write batches of rows to a JSON Lines file (one object per row)"""
+    rows = 0
+    with open(path, "w") as f:
+        for batch in batches:
+            if len(batch):
+                lines = batch.to_json(
+                    orient="records",
+                    lines=True,
+                    date_format="iso",
+                    default_handler=str,
+                )
+                f.write(lines if lines.endswith("\n") else lines + "\n")
+            rows += len(batch)
+    return rows
+
+
+def write_parquet(batches, path):
+    """Write batches of rows to a zstd-compressed Parquet file, one row group per batch.
+
+    The schema is the one of the first batch, its columns without any value
+    being written as strings.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer, rows = None, 0
+    try:
+        for batch in batches:
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            if writer is None:
+                arrow_schema = pa.schema(
+                    [
+                        (
+                            field.with_type(pa.string())
+                            if pa.types.is_null(field.type)
+                            else field
+                        )
+                        for field in table.schema
+                    ]
+                )
+                writer = pq.ParquetWriter(path, arrow_schema, compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+            rows += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+# Writer of each export format
+writers = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def export_query(
+    query, conn, path, format=None, batch_size=EXPORT_BATCH_SIZE, params=None
+):
+    """Stream the result of a query to a file and return the number of rows written.
+
+    The format is given by the extension of path unless it is specified.
+    """
+    format = format or os.path.splitext(path)[1].lstrip(".").lower()
+    if format not in writers:
+        raise ValueError(f"Unknown export format: {format}")
+    return writers[format](stream_query(query, conn, batch_size, params), path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the results of my SQL solutions"
+    )
+    parser.add_argument(
+        "ids",
+        nargs="*",
+        type=int,
+        help="ids of the queries to export (all the read-only ones by default)",
+    )
+    parser.add_argument(
+        "--format", choices=list(writers), default="csv", help="format of the files"
+    )
+    parser.add_argument(
+        "--output-dir", default="exports", help="directory receiving the files"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=EXPORT_BATCH_SIZE,
+        help="number of rows fetched and written at once",
+    )
+    parser.add_argument(
+        "--driver",
+        choices=streaming_drivers + ["mysqlconnector"],
+        default="pymysql",
+        help="MySQL driver (mysqlconnector buffers the whole result)",
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="value of a parameter of the queries, e.g. n=10",
+    )
+    args = parser.parse_args()
+
+    ids = check_ids(args.ids or [i for i, q in queries.items() if q.read_only])
+    params = dict(param.split("=", 1) for param in args.param)
+    unknown = set(params) - {p.name for i in ids for p in queries[i].params}
+    if unknown:
+        parser.error(f"the selected queries have no parameters {sorted(unknown)}")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # Create a database connection with SQLAlchemy (MySQL Server)
+    engine = make_engine(driver=args.driver)
+    with engine.connect() as conn:
+        for i in ids:
+            path = os.path.join(args.output_dir, f"query_{i}.{args.format}")
+            start = time.perf_counter()
+            rows = export_query(
+                queries[i],
+                conn,
+                path,
+                args.format,
+                args.batch_size,
+                params_of(queries[i], params),
+            )
+            print(
+                f"Query {i}: {rows} rows written to {path} "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
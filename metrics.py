@@ -0,0 +1,299 @@
+"""This file contains the metrics and traces recorded by the loader and the
+    query runner, exported as Prometheus text and OpenTelemetry-style spans"""
+
+import bisect
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from configuration.config import MAX_SPANS
+
+# Description and type of each metric (the histograms are in seconds)
+descriptions = {
+    "loader_rows_read_total": ("counter", "Rows read by a stage of the loader"),
+    "loader_rows_written_total": ("counter", "Rows written by a stage of the loader"),
+    "loader_bytes_total": (
+        "counter",
+        "Bytes written by a stage of the loader (in-memory size of the rows, "
+        "size of the csv file for LOAD DATA)",
+    ),
+    "loader_stage_seconds_total": (
+        "counter",
+        "Time spent in a stage of the loader, excluding the stages it consumes",
+    ),
+    "query_duration_seconds": ("histogram", "Time to answer a query"),
+    "query_rows_returned_total": ("counter", "Rows returned by a query"),
+    "pool_wait_seconds": (
+        "histogram",
+        "Time waited for a connection of the pool before running a query",
+    ),
+}
+
+# Upper bounds of the buckets of the histograms (in seconds)
+buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def label_text(labels):
+    """Return the labels of a sample in the Prometheus text format"""
+    if not labels:
+        return ""
+    escaped = {
+        name: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for name, value in labels
+    }
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+class Metrics:
+    """Counters and histograms by name and labels, shared by the threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def add(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                key, {"counts": [0] * (len(buckets) + 1), "sum": 0.0}
+            )
+            histogram["counts"][bisect.bisect_left(buckets, value)] += 1
+            histogram["sum"] += value
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text format"""
+        lines = []
+        with self.lock:
+            samples = {**self.counters, **self.histograms}
+            for name, (kind, description) in descriptions.items():
+                keys = sorted(key for key in samples if key[0] == name)
+                if not keys:
+                    continue
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+                for _, labels in keys:
+                    if kind == "counter":
+                        lines.append(
+                            f"{name}{label_text(labels)} {samples[name, labels]}"
+                        )
+                        continue
+                    histogram = samples[name, labels]
+                    cumulative = 0
+                    for bound, count in zip(buckets + ("+Inf",), histogram["counts"]):
+                        cumulative += count
+                        bucket = label_text(labels + (("le", bound),))
+                        lines.append(f"{name}_bucket{bucket} {cumulative}")
+                    lines.append(f"{name}_sum{label_text(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{label_text(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Forget all the recorded values"""
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+class Span:
+    """A timed operation of a trace, with its attributes"""
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else ""
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Add attributes to the span"""
+        self.attributes.update(attributes)
+
+    def otlp(self):
+        """Return the span in the OTLP JSON encoding"""
+
+        def value(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [
+                {"key": k, "value": value(v)} for k, v in self.attributes.items()
+            ],
+            "status": (
+                {"code": 2, "message": self.error} if self.error else {"code": 1}
+            ),
+        }
+
+
+class Tracer:
+    """Records the spans of the operations (the last max_spans finished ones).
+
+    The current span is kept in a context variable, so the spans opened in
+    it (in the same thread, or in a copy of its context) are its children.
+    """
+
+    def __init__(self, service_name="sqlchallenge", max_spans=MAX_SPANS):
+        self.service_name = service_name
+        self.current = contextvars.ContextVar("span", default=None)
+        self.finished = deque(maxlen=max_spans)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Record the operation run in the block as a span, a child of the current one"""
+        span = Span(name, self.current.get(), **attributes)
+        token = self.current.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.error = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            self.current.reset(token)
+            span.end = time.time_ns()
+            self.finished.append(span)
+
+    def otlp(self):
+        """Return the finished spans as an OTLP JSON export request"""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [span.otlp() for span in list(self.finished)],
+                        }
+                    ],
+                }
+            ]
+        }
+
+
+# Metrics and spans of this process
+registry = Metrics()
+add = registry.add
+observe = registry.observe
+tracer = Tracer()
+span = tracer.span
+
+
+def annotate(**attributes):
+    """Add attributes to the current span (if any)"""
+    current = tracer.current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+# Stages of the loader being timed in each thread, innermost last
+stages = threading.local()
+
+
+@contextmanager
+def stage(name, table):
+    """Time a stage of the loading of a table.
+
+    A stage run while another one is timed (e.g. a chunk parsed when the
+    transform stage asks for it) is subtracted from the outer one, so each
+    stage gets its own time only.
+    """
+    stack = stages.__dict__.setdefault("stack", [])
+    timer = [time.perf_counter(), 0.0]
+    stack.append(timer)
+    try:
+        yield
+    finally:
+        stack.pop()
+        elapsed = time.perf_counter() - timer[0]
+        if stack:
+            stack[-1][1] += elapsed
+        add("loader_stage_seconds_total", elapsed - timer[1], table=table, stage=name)
+
+
+def record_rows(name, table, read=0, written=0, size=0):
+    """Count the rows read, the rows written and the bytes of a stage of the loader"""
+    add("loader_rows_read_total", read, table=table, stage=name)
+    add("loader_rows_written_total", written, table=table, stage=name)
+    add("loader_bytes_total", size, table=table, stage=name)
+
+
+def timed_chunks(chunks, name, table, source=False):
+    """Yield the chunks produced by a stage of the loading of a table, timing it
+    and counting them as written by the stage (and as read, with source=True)"""
+    iterator = iter(chunks)
+    while True:
+        with stage(name, table):
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        rows = len(chunk)
+        size = int(chunk.memory_usage(deep=True).sum())
+        record_rows(name, table, rows if source else 0, rows, size)
+        yield chunk
+
+
+def counted_chunks(chunks, name, table):
+    """Yield the chunks read by a stage of the loading of a table, counting them"""
+    for chunk in chunks:
+        record_rows(name, table, read=len(chunk))
+        yield chunk
+
+
+def write_atomically(path, content):
+    """Replace a file by content (readers never see a partly written file)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
+def write_prometheus(path):
+    """Write the metrics to a Prometheus text file (e.g. for the textfile
+    collector of the node exporter)"""
+    write_atomically(path, registry.prometheus())
+
+
+def write_spans(path):
+    """Append the finished spans to a file, as one line of OTLP JSON (the
+    format of the OpenTelemetry Collector's file exporter)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(tracer.otlp()) + "\n")
+    tracer.finished.clear()
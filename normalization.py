@@ -0,0 +1,80 @@
+"""This file contains the normalization of the museum_hours strings into typed
+    columns, computed once when the csv files are loaded"""
+
+import pandas as pd
+import schema
+
+# Days of the week and their number (1 = Sunday, as MySQL's dayofweek())
+days = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+day_numbers = {day.lower(): number for number, day in enumerate(days, start=1)}
+# Misspelled days found in the csv file (e.g. "Thusday" in the real dataset)
+day_numbers.update({"thusday": 5})
+
+# Opening and closing times are written as '10:30:AM' in the csv file
+time_pattern = r"^(0?[1-9]|1[0-2]):[0-5][0-9]:(AM|PM)$"
+
+
+def parse_times(values):
+    """Parse 'hh:mi:AM' strings (str_to_date(value, '%h:%i:%p')), NaT when malformed"""
+    return pd.to_datetime(values, format="%I:%M:%p", errors="coerce")
+
+
+def times_of_day(timestamps):
+    """Return the times of day of timestamps, None for the missing ones"""
+    return timestamps.dt.time.astype(object).where(timestamps.notna(), None)
+
+
+def normalize_museum_hours(chunk):
+    """Add the typed columns of museum_hours to a chunk of its csv file.
+
+    day_of_week is the number of the day, open_time and close_time the
+    parsed times and open_duration the time between them. A row is flagged
+    (is_valid = False) when its day or one of its times is malformed, or
+    when it closes before it opens; its open_duration is then missing.
+    """
+    day_of_week = chunk["day"].str.strip().str.lower().map(day_numbers)
+    opens, closes = parse_times(chunk["open"]), parse_times(chunk["close"])
+    opened = (closes > opens).to_numpy()
+    duration = pd.Timestamp(0) + (closes - opens).where(opened)
+    return chunk.assign(
+        day_of_week=day_of_week.astype("Int64"),
+        open_time=times_of_day(opens),
+        close_time=times_of_day(closes),
+        open_duration=times_of_day(duration),
+        is_valid=day_of_week.notna().to_numpy() & opened,
+    )
+
+
+# Function adding the typed columns of a table to a chunk of its csv file,
+# and statement computing them on the server, by table ({table} is the table
+# the rows were loaded into)
+normalizers = {"museum_hours": normalize_museum_hours}
+
+update_statements = {"museum_hours": f"""
+        update `{{table}}` set
+            day_of_week = case lower(trim(day)) {' '.join(f"when '{d}' then {n}" for d, n in day_numbers.items())} end,
+            open_time = if(open regexp '{time_pattern}', str_to_date(open, '%h:%i:%p'), null),
+            close_time = if(close regexp '{time_pattern}', str_to_date(close, '%h:%i:%p'), null),
+            open_duration = if(close_time > open_time, timediff(close_time, open_time), null),
+            is_valid = day_of_week is not null and open_duration is not null
+        """}
+
+
+def derived_columns(table):
+    """Return the columns of a table which are not read from its csv file"""
+    return [
+        c.name
+        for c in schema.tables[table].columns
+        if c.name not in schema.dtypes[table]
+    ]
+
+
+def normalize(table, chunk):
+    """Add the typed columns of a table (if it has any) to a chunk of its csv file"""
+    return normalizers[table](chunk) if table in normalizers else chunk
+
+
+def normalize_chunks(table, chunks):
+    """Add the typed columns of a table to each chunk of its csv file"""
+    for chunk in chunks:
+        yield normalize(table, chunk)
@@ -0,0 +1,399 @@
+"""This file contains the maintenance of the partitioned tables (see schema.py):
+    per-partition rebuilds, and routing and pruning checks"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+import schema
+from summaries import fresh_statements, refresh_summaries
+from result_cache import ResultCache, bump_versions
+from database import make_engine
+from profiler import table_aliases
+from configuration.config import (
+    BATCH_SIZE,
+    CHUNK_SIZE,
+    DATA_DIR,
+    PRUNING_TARGETS,
+    WORKERS,
+)
+
+
+def assign_partitions(table, values):
+    """Return the name of the partition of each value of the partitioning
+    column of a table, as the server computes it (NULL is 0 for "hash" and
+    below every bound for "range").
+
+    It only splits the rows of a reload between the workers: the server
+    routes the inserted rows itself, and validates the rows of a partition
+    exchanged with a staging table (see check_routing).
+    """
+    partitioning = schema.partitioning[table]
+    names = np.array(partitioning.names(), dtype=object)
+    values = pd.Series(values)
+    if partitioning.method == "hash":
+        numbers = values.fillna(0).astype("int64").to_numpy()
+        return names[np.mod(np.abs(numbers), partitioning.partitions)]
+    if partitioning.method == "range":
+        bounds = np.array(
+            [np.inf if b is None else b for _, b in partitioning.bounds], dtype=float
+        )
+        numbers = values.astype("float64").fillna(-np.inf).to_numpy()
+        positions = np.searchsorted(bounds, numbers, side="right")
+        if (positions == len(names)).any():
+            raise ValueError(f"Values of {table} are above the last partition")
+        return names[positions]
+    partition_of = {
+        value: name for name, values in partitioning.bounds for value in values
+    }
+    assigned = [partition_of.get(None if pd.isna(v) else v) for v in values]
+    if None in assigned:
+        raise ValueError(f"Values of {table} belong to no partition")
+    return np.array(assigned, dtype=object)
+
+
+def split_by_partition(table, chunk):
+    """Split a chunk of rows of a partitioned table by partition"""
+    partitions = assign_partitions(table, chunk[schema.partitioning[table].column])
+    return {name: chunk[partitions == name] for name in pd.unique(partitions)}
+
+
+def partition_rows(conn, table):
+    """Return the (estimated) number of rows of each partition of a table"""
+    rows = conn.execute(
+        text(
+            "select partition_name, table_rows from information_schema.partitions "
+            "where table_schema = database() and table_name = :t "
+            "and partition_name is not null order by partition_ordinal_position"
+        ),
+        {"t": table},
+    )
+    return dict(rows.fetchall())
+
+
+def create_staging_table(conn, table, partition):
+    """(Re)create an empty, non-partitioned copy of a table (same columns and
+    indexes) which can be exchanged with one of its partitions"""
+    staging = f"{table}__{partition}"
+    conn.execute(text(f"drop table if exists `{staging}`"))
+    conn.execute(text(f"create table `{staging}` like `{table}`"))
+    conn.execute(text(f"alter table `{staging}` remove partitioning"))
+    return staging
+
+
+def exchange_partition(conn, table, partition, staging):
+    """Swap the rows of a partition with the ones of its staging table (an
+    atomic metadata change), then drop the staging table and the old rows"""
+    conn.execute(
+        text(
+            f"alter table `{table}` exchange partition `{partition}` "
+            f"with table `{staging}` with validation"
+        )
+    )
+    conn.execute(text(f"drop table `{staging}`"))
+
+
+def deduplicate_partition(engine, table, partition):
+    """Remove the duplicate records of one partition of a table.
+
+    Duplicate rows have the same partitioning column, so they are in the
+    same partition: its distinct rows are written to a staging table which
+    then replaces the partition. Returns the number of rows removed.
+    """
+    with engine.begin() as conn:
+        staging = create_staging_table(conn, table, partition)
+        before = conn.execute(
+            text(f"select count(*) from `{table}` partition (`{partition}`)")
+        ).scalar()
+        # The generated columns are computed again by the server
+        columns = ", ".join(f"`{c}`" for c in schema.stored_columns(table))
+        after = conn.execute(
+            text(
+                f"insert into `{staging}` ({columns}) select distinct {columns} "
+                f"from `{table}` partition (`{partition}`)"
+            )
+        ).rowcount
+        exchange_partition(conn, table, partition, staging)
+    return before - after
+
+
+def deduplicate_partitions(engine, table, workers=WORKERS):
+    """Remove the duplicate records of a partitioned table, up to workers
+    partitions at a time (each on its own connection).
+
+    The other partitions stay readable while one is rebuilt.
+    Returns the number of rows removed by partition.
+    """
+    partitions = schema.partitioning[table].names()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        removed = executor.map(
+            lambda p: deduplicate_partition(engine, table, p), partitions
+        )
+        return dict(zip(partitions, removed))
+
+
+def reload_partitions(
+    engine,
+    table,
+    partitions=None,
+    workers=WORKERS,
+    chunk_size=CHUNK_SIZE,
+    batch_size=BATCH_SIZE,
+    snapshot=False,
+):
+    """Reload some partitions of a table (all of them by default) from its csv file.
+
+    The csv file is read once. The rows of each partition are written to a
+    staging table on its own connection, up to workers partitions being
+    written at the same time, and each staging table then replaces its
+    partition. The other partitions are neither read nor written.
+    The rows are normalized and checked as by the loader, the ones breaking
+    a "quarantine" rule being left out (the quarantine table and the
+    validation summary are only updated by a full load).
+    Returns the number of rows written by partition.
+    """
+    from csv_to_database import read_chunks, table_columns, to_records
+    from validation import apply_rules
+
+    partitions = partitions or schema.partitioning[table].names()
+    columns = table_columns(table)
+    connections = {p: engine.connect() for p in partitions}
+    rows = dict.fromkeys(partitions, 0)
+    try:
+        staging = {
+            p: create_staging_table(conn, table, p) for p, conn in connections.items()
+        }
+        inserts = {
+            p: text(
+                f"insert into `{staging[p]}` ({', '.join(f'`{c}`' for c in columns)}) "
+                f"values ({', '.join(f':{c}' for c in columns)})"
+            )
+            for p in partitions
+        }
+
+        def write(partition, chunk):
+            records = to_records(chunk[columns])
+            for start in range(0, len(records), batch_size):
+                connections[partition].execute(
+                    inserts[partition], records[start : start + batch_size]
+                )
+            rows[partition] += len(records)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk in read_chunks(table, chunk_size, snapshot=snapshot):
+                kept, _ = apply_rules(table, chunk)
+                split = split_by_partition(table, kept)
+                # A partition is written by one thread at a time (its connection)
+                for future in [
+                    executor.submit(write, p, part)
+                    for p, part in split.items()
+                    if p in connections
+                ]:
+                    future.result()
+        for p, conn in connections.items():
+            conn.commit()
+            exchange_partition(conn, table, p, staging[p])
+    finally:
+        for conn in connections.values():
+            conn.close()
+    return rows
+
+
+def explain_partitions(conn, sql):
+    """Return the partitions read by a query for each table of its plan"""
+    plan = conn.execute(text(f"explain {sql}")).mappings().all()
+    return {
+        row["table"]: row["partitions"].split(",") if row["partitions"] else []
+        for row in plan
+        if row["table"] is not None
+    }
+
+
+def check_routing(conn, tables=None):
+    """Check that assign_partitions puts the stored rows of each partitioned
+    table in the partition the server put them in.
+
+    Returns {table: number of rows assign_partitions routes elsewhere}.
+    """
+    report = {}
+    for table in tables or schema.partitioning:
+        column = schema.partitioning[table].column
+        misrouted = 0
+        for partition in schema.partitioning[table].names():
+            values = pd.DataFrame(
+                conn.execute(
+                    text(
+                        f"select `{column}`, count(*) from `{table}` "
+                        f"partition (`{partition}`) group by `{column}`"
+                    )
+                ).fetchall(),
+                columns=["value", "rows"],
+            )
+            if values.empty:
+                continue
+            elsewhere = assign_partitions(table, values["value"]) != partition
+            misrouted += int(values["rows"][elsewhere].sum())
+        report[table] = misrouted
+    return report
+
+
+def check_pruning(conn, tables=None):
+    """Check that a lookup on the partitioning column of each partitioned
+    table reads a single partition.
+
+    Returns {table: (partitions read, number of partitions)}.
+    """
+    report = {}
+    for table in tables or schema.partitioning:
+        column = schema.partitioning[table].column
+        value = conn.execute(
+            text(
+                f"select `{column}` from `{table}` where `{column}` is not null limit 1"
+            )
+        ).scalar()
+        if value is None:
+            continue
+        read = explain_partitions(
+            conn, f"select * from `{table}` where `{column}` = {int(value)}"
+        )[table]
+        report[table] = (read, len(schema.partitioning[table].names()))
+    return report
+
+
+def solution_partitions(conn, queries):
+    """Return the partitions of the partitioned tables read by each read-only
+    solution (with the default values of its parameters, and its stale
+    summaries read from their sources)"""
+    report = {}
+    for query in queries:
+        if not query.read_only:
+            continue
+        sql = query.inline(fresh_statements(query, conn)[-1])
+        # The plan names the tables by their alias in the query
+        aliases = table_aliases(sql)
+        report[query.id] = {
+            aliases.get(table, table): partitions
+            for table, partitions in explain_partitions(conn, sql).items()
+            if aliases.get(table, table) in schema.partitioning
+        }
+    return report
+
+
+def unpruned_solutions(report, targets=PRUNING_TARGETS):
+    """Return the (query id, table) of the target solutions of a report of
+    solution_partitions which read every partition of a partitioned table"""
+    return [
+        (i, table)
+        for i, plan in report.items()
+        if i in targets
+        for table, read in plan.items()
+        if len(schema.partitioning[table].names()) > 1
+        and set(schema.partitioning[table].names()) <= set(read)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the partitioned tables")
+    parser.add_argument(
+        "action",
+        choices=["show", "check", "deduplicate", "reload"],
+        help="show the rows of each partition, check the routing and the "
+        "partition pruning, or deduplicate or reload the tables partition by "
+        "partition",
+    )
+    parser.add_argument(
+        "tables",
+        nargs="*",
+        default=list(schema.partitioning),
+        help="partitioned tables (all of them by default)",
+    )
+    parser.add_argument(
+        "--partitions", nargs="+", help="partitions to reload (all of them by default)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="number of partitions rebuilt at the same time",
+    )
+    parser.add_argument(
+        "--data-dir", default=DATA_DIR, help="directory containing the csv files"
+    )
+    args = parser.parse_args()
+
+    unknown = [t for t in args.tables if t not in schema.partitioning]
+    if unknown:
+        parser.error(f"tables {unknown} are not partitioned (see schema.py)")
+
+    # Create a database connection with SQLAlchemy (MySQL Server)
+    engine = make_engine(pool_size=args.workers + 1)
+    if args.action == "show":
+        with engine.connect() as conn:
+            for table in args.tables:
+                print(f"{table}: {schema.partitioning[table].clause()}")
+                for partition, rows in partition_rows(conn, table).items():
+                    print(f"    {partition}: ~{rows} rows")
+    elif args.action == "check":
+        from SQLSolutions import queries
+
+        failed = False
+        with engine.connect() as conn:
+            for table, misrouted in check_routing(conn, args.tables).items():
+                status = "matches" if not misrouted else "DOESN'T match"
+                failed |= misrouted > 0
+                print(
+                    f"{table}: the client-side routing {status} the server "
+                    f"({misrouted} rows routed elsewhere)"
+                )
+            for table, (read, total) in check_pruning(conn, args.tables).items():
+                status = "pruned" if len(read) == 1 else "NOT pruned"
+                failed |= len(read) != 1
+                print(
+                    f"{table}: a lookup reads {len(read)} of {total} partitions ({status})"
+                )
+            report = solution_partitions(conn, queries.values())
+            unpruned = unpruned_solutions(report)
+            for i, plan in report.items():
+                for table, read in plan.items():
+                    total = len(schema.partitioning[table].names())
+                    status = " (NOT pruned)" if (i, table) in unpruned else ""
+                    print(
+                        f"Query {i}: reads {len(read)} of {total} partitions of "
+                        f"{table}{status}"
+                    )
+        if failed or unpruned:
+            raise SystemExit(1)
+    elif args.action == "deduplicate":
+        changed = args.tables
+        for table in args.tables:
+            start = time.perf_counter()
+            removed = deduplicate_partitions(engine, table, args.workers)
+            print(
+                f"{table}: {sum(removed.values())} duplicate rows removed "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+    else:
+        import csv_to_database
+
+        csv_to_database.data_dir = args.data_dir
+        changed = args.tables
+        for table in args.tables:
+            start = time.perf_counter()
+            rows = reload_partitions(engine, table, args.partitions, args.workers)
+            print(
+                f"{table}: {sum(rows.values())} rows reloaded into {len(rows)} "
+                f"partitions in {time.perf_counter() - start:.2f}s"
+            )
+
+    if args.action in ("deduplicate", "reload"):
+        # The summaries and the cached results of the rebuilt tables are stale
+        cache = ResultCache()
+        with engine.begin() as conn:
+            bump_versions(conn, changed)
+            for name, _, _ in refresh_summaries(conn, changed):
+                bump_versions(conn, [name])
+                cache.invalidate(name)
+        for table in changed:
+            cache.invalidate(table)
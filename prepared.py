@@ -0,0 +1,67 @@
+"""This file contains the execution of my SQL solutions as server-side prepared
+    statements, parsed once per connection and reused by the following calls"""
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from backends import bind_names, replace_binds
+
+# MySQL error raised when executing a statement which is not prepared on the
+# connection (ER_UNKNOWN_STMT_HANDLER)
+UNKNOWN_STATEMENT = 1243
+
+
+def prepared_statements(conn):
+    """Return the statements prepared on the DBAPI connection of conn, by name.
+
+    They are stored in the info of the pooled connection, so they are kept
+    while the connection goes back to the pool and is checked out again.
+    """
+    return conn.connection.info.setdefault("prepared_statements", {})
+
+
+def prepare(conn, name, sql):
+    """Prepare a statement on the server (unless it already is on this
+    connection), its bind parameters becoming ? placeholders"""
+    prepared = prepared_statements(conn)
+    if prepared.get(name) != sql:
+        conn.execute(
+            text("set @prepared_sql = :sql"), {"sql": replace_binds(sql, lambda _: "?")}
+        )
+        conn.execute(text(f"prepare `{name}` from @prepared_sql"))
+        prepared[name] = sql
+
+
+def execute_prepared(conn, name, sql, values=None):
+    """Execute a statement as the prepared statement name and return its result.
+
+    The values of the bind parameters are sent in user variables
+    (@param_<name>), the statement being prepared first if needed.
+    """
+    names = bind_names(sql)
+    if names:
+        conn.execute(
+            text(
+                "set " + ", ".join(f"@param_{n} = :{n}" for n in dict.fromkeys(names))
+            ),
+            {n: values[n] for n in names},
+        )
+    using = f" using {', '.join(f'@param_{n}' for n in names)}" if names else ""
+    prepare(conn, name, sql)
+    try:
+        return conn.execute(text(f"execute `{name}`{using}"))
+    except DBAPIError as error:
+        # Only when the server lost the statement (e.g. the connection was
+        # reset) is it prepared and executed again, other errors are raised
+        if error.orig is None or error.orig.args[:1] != (UNKNOWN_STATEMENT,):
+            raise
+        prepared_statements(conn).pop(name, None)
+        prepare(conn, name, sql)
+        return conn.execute(text(f"execute `{name}`{using}"))
+
+
+def deallocate(conn, name=None):
+    """Deallocate a prepared statement of the connection (all of them by default)"""
+    prepared = prepared_statements(conn)
+    for statement in [name] if name is not None else list(prepared):
+        conn.execute(text(f"deallocate prepare `{statement}`"))
+        prepared.pop(statement, None)
@@ -0,0 +1,174 @@
+"""This file contains the tools to profile my SQL solutions: execution plans,
+    server-side counters and client-side timings"""
+
+import json
+import re
+import time
+from sqlalchemy import bindparam, text
+import schema
+
+# Session counters telling how a query was executed
+status_counters = [
+    "Handler_read_first",
+    "Handler_read_key",
+    "Handler_read_next",
+    "Handler_read_rnd",
+    "Handler_read_rnd_next",
+    "Created_tmp_tables",
+    "Created_tmp_disk_tables",
+    "Select_full_join",
+    "Select_scan",
+    "Sort_merge_passes",
+    "Sort_rows",
+    "Sort_scan",
+]
+
+sql_keywords = {"as", "on", "join", "where", "group", "order", "limit", "union"}
+
+
+def session_status(conn):
+    """Return the session counters of status_counters"""
+    rows = conn.execute(
+        text("show session status where variable_name in :names").bindparams(
+            bindparam("names", expanding=True)
+        ),
+        {"names": status_counters},
+    )
+    return {name: int(value) for name, value in rows}
+
+
+def explain_json(conn, sql):
+    """Return the execution plan of a query (EXPLAIN FORMAT=JSON)"""
+    return json.loads(conn.execute(text(f"explain format=json {sql}")).scalar())
+
+
+def explain_analyze(conn, sql):
+    """Execute a query and return its measured execution plan (EXPLAIN ANALYZE)"""
+    return conn.execute(text(f"explain analyze {sql}")).scalar()
+
+
+def table_aliases(sql):
+    """Return the tables of the database read by a query, by alias"""
+    aliases = {}
+    for table, alias in re.findall(
+        r"\b(?:from|join)\s+`?(\w+)`?(?:\s+(?:as\s+)?(\w+))?", sql, flags=re.IGNORECASE
+    ):
+        if table.lower() in schema.tables:
+            if alias and alias.lower() not in sql_keywords:
+                aliases[alias] = table.lower()
+            aliases[table] = table.lower()
+    return aliases
+
+
+def plan_tables(plan):
+    """Yield the table accesses of an execution plan"""
+    if isinstance(plan, dict):
+        if "table_name" in plan and "access_type" in plan:
+            yield plan
+        for value in plan.values():
+            yield from plan_tables(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_tables(value)
+
+
+def join_columns(sql):
+    """Return the (alias, column) pairs compared in the equality conditions of a query"""
+    pairs = set()
+    for left, left_column, right, right_column in re.findall(
+        r"\b(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)", sql
+    ):
+        pairs.update({(left, left_column), (right, right_column)})
+    return pairs
+
+
+def leading_key_columns(table):
+    """Return the first column of each key of a table of the schema, by key name"""
+    keys = {index.name: list(index.columns)[0].name for index in table.indexes}
+    if table.primary_key.columns:
+        keys["PRIMARY"] = list(table.primary_key.columns)[0].name
+    return keys
+
+
+def find_full_scans(plan, sql):
+    """Return the full scans of tables which have a key that could be used.
+
+    A full scan is flagged when MySQL listed possible keys but didn't use
+    them, or when a join condition compares a column of the scanned table
+    which is the first column of one of its keys in the schema.
+    """
+    aliases = table_aliases(sql)
+    joined = join_columns(sql)
+    full_scans = []
+    for access in plan_tables(plan):
+        alias = access["table_name"]
+        table = aliases.get(alias)
+        if access["access_type"] != "ALL" or table is None:
+            continue
+        join_keys = [
+            key
+            for key, column in leading_key_columns(schema.tables[table]).items()
+            if (alias, column) in joined
+        ]
+        if access.get("possible_keys") or join_keys:
+            full_scans.append(
+                {
+                    "table": table,
+                    "alias": alias,
+                    "rows_examined_per_scan": access.get("rows_examined_per_scan"),
+                    "possible_keys": access.get("possible_keys", []),
+                    "join_keys": join_keys,
+                }
+            )
+    return full_scans
+
+
+def profile_query(query, conn):
+    """Profile a read-only query.
+
+    Returns its client-side timings (execution and fetch), the deltas of the
+    session counters, its execution plans and the full scans to look at.
+    The stale summaries are read from their sources, as by execute_query.
+    """
+    from summaries import fresh_statements
+
+    sql = query.inline(fresh_statements(query, conn)[-1])
+    # Reading the counters changes some of them: measure it to remove it
+    before = session_status(conn)
+    start = session_status(conn)
+    overhead = {name: start[name] - before[name] for name in status_counters}
+
+    started = time.perf_counter()
+    result = conn.execute(text(sql))
+    executed = time.perf_counter()
+    rows = result.fetchall()
+    fetched = time.perf_counter()
+
+    end = session_status(conn)
+    plan = explain_json(conn, sql)
+    return {
+        "id": query.id,
+        "question": query.question,
+        "client": {
+            "execute_seconds": executed - started,
+            "fetch_seconds": fetched - executed,
+            "rows": len(rows),
+        },
+        "server": {
+            name: end[name] - start[name] - overhead[name] for name in status_counters
+        },
+        "explain_json": plan,
+        "explain_analyze": explain_analyze(conn, sql),
+        "full_scans": find_full_scans(plan, sql),
+    }
+
+
+def profile_queries(conn, queries):
+    """Profile the read-only queries of a list (the other ones are skipped)"""
+    return [profile_query(query, conn) for query in queries if query.read_only]
+
+
+def write_report(profiles, path):
+    """Write the profiles to a JSON file"""
+    with open(path, "w") as f:
+        json.dump(profiles, f, indent=2, default=str)
@@ -0,0 +1,180 @@
+"""This file contains a persistent cache for the results of my SQL solutions,
+    stored in a SQLite file"""
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from sqlalchemy import bindparam, text
+import schema
+from summaries import summaries
+from configuration.config import RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES
+
+
+def normalize_sql(sql):
+    """Lowercase a SQL text and collapse its whitespace"""
+    return re.sub(r"\s+", " ", sql).strip().lower()
+
+
+def referenced_tables(sql):
+    """Return the tables of the database (summary tables included) read by a SQL text, sorted"""
+    names = re.findall(r"\b(?:from|join)\s+`?(\w+)`?", sql, flags=re.IGNORECASE)
+    return sorted(
+        {name.lower() for name in names} & (set(schema.tables) | set(summaries))
+    )
+
+
+def dependent_tables(sql):
+    """Return the tables a SQL text reads, with the tables the summaries it
+    reads are computed from (a stale summary is read from them), sorted"""
+    tables = referenced_tables(sql)
+    return sorted(
+        set(tables).union(*[summaries[t].sources for t in tables if t in summaries])
+    )
+
+
+def ensure_version_table(conn):
+    """Create the table counting the writes to each table (once per pooled connection)"""
+    if not conn.connection.info.get("table_version"):
+        conn.execute(text("""
+                create table if not exists table_version (
+                    table_name varchar(64) primary key,
+                    version bigint not null
+                )
+                """))
+        conn.connection.info["table_version"] = True
+
+
+def bump_versions(conn, tables):
+    """Increment the version of tables, whose rows were just written"""
+    ensure_version_table(conn)
+    for table in tables:
+        conn.execute(
+            text(
+                "insert into table_version (table_name, version) values (:t, 1) "
+                "on duplicate key update version = version + 1"
+            ),
+            {"t": table},
+        )
+
+
+def table_versions(conn, tables):
+    """Return a version stamp for each table.
+
+    The stamp combines the version counted in table_version, incremented by
+    the loader and the solutions modifying the database, with the
+    create_time and update_time of information_schema, which change when a
+    table is recreated or its rows are modified by any other means. The
+    statistics of information_schema are read fresh (MySQL caches them for
+    information_schema_stats_expiry seconds, a day by default, which is set
+    to 0 on the connections reading them).
+    """
+    if not tables:
+        return {}
+    ensure_version_table(conn)
+    if not conn.connection.info.get("stats_expiry"):
+        # Once per pooled connection, which keeps the setting
+        conn.execute(text("set session information_schema_stats_expiry = 0"))
+        conn.connection.info["stats_expiry"] = True
+    rows = conn.execute(
+        text(
+            "select t.table_name, t.create_time, t.update_time, v.version "
+            "from information_schema.tables as t "
+            "left join table_version as v on v.table_name = t.table_name "
+            "where t.table_schema = database() and t.table_name in :tables"
+        ).bindparams(bindparam("tables", expanding=True)),
+        {"tables": list(tables)},
+    )
+    return {
+        name.lower(): f"{created}/{updated}/{version}"
+        for name, created, updated, version in rows
+    }
+
+
+class ResultCache:
+    """Results of SQL queries, keyed on the SQL text and the version of the tables it reads.
+
+    Entries are evicted in least recently used order once the cache holds
+    more than max_bytes of results. The loader invalidates the entries of
+    the tables it reloads, and a write by any other means changes the
+    version of the table (see table_versions).
+    """
+
+    def __init__(self, path=RESULT_CACHE_PATH, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            create table if not exists results (
+                key text primary key,
+                tables text not null,
+                result blob not null,
+                size integer not null,
+                last_used real not null
+            )
+            """)
+        self.db.commit()
+
+    def key(self, sql, conn, params=None, versions=None):
+        """Return the cache key of a SQL text and the values of its parameters,
+        given the current version of its tables (versions, if already read)"""
+        if versions is None:
+            versions = table_versions(conn, dependent_tables(sql))
+        payload = json.dumps(
+            [normalize_sql(sql), params or {}, versions], sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached result of a key, or None"""
+        with self.lock:
+            row = self.db.execute(
+                "select result from results where key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "update results set last_used = ? where key = ?", (time.time(), key)
+            )
+            self.db.commit()
+        return pickle.loads(row[0])
+
+    def put(self, key, sql, result):
+        """Store a result, then evict the least recently used ones if the cache is too big"""
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        tables = "," + ",".join(dependent_tables(sql)) + ","
+        with self.lock:
+            self.db.execute(
+                "replace into results values (?, ?, ?, ?, ?)",
+                (key, tables, blob, len(blob), time.time()),
+            )
+            total = self.db.execute(
+                "select coalesce(sum(size), 0) from results"
+            ).fetchone()[0]
+            for old_key, size in self.db.execute(
+                "select key, size from results order by last_used"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.db.execute("delete from results where key = ?", (old_key,))
+                total -= size
+            self.db.commit()
+
+    def invalidate(self, table):
+        """Forget every result reading a table"""
+        with self.lock:
+            self.db.execute(
+                "delete from results where tables like ?", (f"%,{table},%",)
+            )
+            self.db.commit()
+
+    def clear(self):
+        """Forget every result"""
+        with self.lock:
+            self.db.execute("delete from results")
+            self.db.commit()
@@ -0,0 +1,455 @@
+"""This file contains the schema of the famous painting database:
+    column types, keys and the indexes used by my SQL solutions"""
+
+import argparse
+import time
+from dataclasses import dataclass
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Computed,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    SmallInteger,
+    String,
+    Table,
+    Text,
+    Time,
+    inspect,
+    text,
+)
+from sqlalchemy.schema import CreateTable
+from validation import rules_of
+from database import make_engine
+from configuration.config import PARTITIONING
+
+metadata = MetaData()
+
+
+def flag_columns(table):
+    """Return the flag columns of a table: one per "flag" rule of validation.py,
+    generated by the server from its condition (false when it is NULL)"""
+    return [
+        Column(
+            rule.name,
+            Boolean,
+            Computed(f"coalesce({rule.condition}, false)", persisted=True),
+        )
+        for rule in rules_of(table, "flag")
+    ]
+
+
+# Only the tables whose key is known to be unique in the csv files have a
+# primary key. The others contain duplicates (see Query 6), so their key is
+# a regular index.
+artist = Table(
+    "artist",
+    metadata,
+    Column("artist_id", Integer, primary_key=True, autoincrement=False),
+    Column("full_name", String(255)),
+    Column("first_name", String(100)),
+    Column("middle_names", String(100)),
+    Column("last_name", String(100)),
+    Column("nationality", String(100)),
+    Column("style", String(100)),
+    Column("birth", Integer),
+    Column("death", Integer),
+)
+
+canvas_size = Table(
+    "canvas_size",
+    metadata,
+    Column("size_id", Integer, primary_key=True, autoincrement=False),
+    Column("width", Integer),
+    Column("height", Integer),
+    Column("label", String(255)),
+)
+
+image_link = Table(
+    "image_link",
+    metadata,
+    Column("work_id", Integer),
+    Column("url", Text),
+    Column("thumbnail_small_url", Text),
+    Column("thumbnail_large_url", Text),
+    Index("ix_image_link_work_id", "work_id"),
+)
+
+# The strings of museum_hours are parsed once by the loader into the typed
+# columns which follow them (see normalization.py). The flag columns of the
+# tables are generated by the server from the other columns of their row
+# (the conditions of the "flag" rules of validation.py), so they are right
+# whatever wrote the row.
+museum_hours = Table(
+    "museum_hours",
+    metadata,
+    Column("museum_id", Integer),
+    Column("day", String(20)),
+    Column("open", String(20)),
+    Column("close", String(20)),
+    Column("day_of_week", SmallInteger),  # 1 = Sunday, ..., 7 = Saturday
+    Column("open_time", Time),
+    Column("close_time", Time),
+    Column("open_duration", Time),
+    Column("is_valid", Boolean),  # False for a malformed day or times
+    *flag_columns("museum_hours"),
+    # Query 10, 11
+    Index("ix_museum_hours_museum_id_day_of_week", "museum_id", "day_of_week"),
+    Index("ix_museum_hours_open_time", "open_time"),
+    Index("ix_museum_hours_invalid_open_time", "invalid_open_time"),  # Query 8
+    Index("ix_museum_hours_open_duration", "open_duration"),  # Query 15
+)
+
+museum = Table(
+    "museum",
+    metadata,
+    Column("museum_id", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(255)),
+    Column("address", Text),
+    Column("city", String(100)),
+    Column("state", String(100)),
+    Column("postal", String(20)),
+    Column("country", String(100)),
+    Column("phone", String(50)),
+    Column("url", Text),
+    *flag_columns("museum"),
+    Index("ix_museum_country", "country"),  # Query 18, 20, 22
+    Index("ix_museum_city", "city"),  # Query 18
+    Index("ix_museum_invalid_city", "invalid_city"),  # Query 7
+)
+
+product_size = Table(
+    "product_size",
+    metadata,
+    Column("work_id", Integer),
+    Column("size_id", Float(53)),  # some size ids are not integers (see Query 14)
+    Column("sale_price", Float(53)),
+    Column("regular_price", Float(53)),
+    *flag_columns("product_size"),
+    Index("ix_product_size_work_id_size_id", "work_id", "size_id"),  # Query 6
+    Index("ix_product_size_size_id", "size_id"),  # Query 5, 14, 19
+    Index("ix_product_size_sale_price", "sale_price"),  # Query 5, 19
+    Index("ix_product_size_sale_above_regular", "sale_above_regular"),  # Query 3
+    Index("ix_product_size_sale_below_half", "sale_below_half"),  # Query 4
+)
+
+subject = Table(
+    "subject",
+    metadata,
+    Column("work_id", Integer),
+    Column("subject", String(100)),
+    Index("ix_subject_work_id", "work_id"),  # Query 22
+    Index("ix_subject_subject", "subject"),  # Query 9, 22
+)
+
+work = Table(
+    "work",
+    metadata,
+    Column("work_id", Integer),
+    Column("name", String(255)),
+    Column("artist_id", Integer),
+    Column("style", String(100)),
+    Column("museum_id", Integer),
+    Index("ix_work_work_id", "work_id"),  # Query 4, 19, 22
+    Index("ix_work_artist_id", "artist_id"),  # Query 13, 17, 22
+    Index("ix_work_museum_id", "museum_id"),  # Query 1, 2, 12, 17, 20, 22
+    Index("ix_work_style_museum_id", "style", "museum_id"),  # Query 16, 21
+)
+
+tables = metadata.tables
+
+
+@dataclass(frozen=True)
+class Partitioning:
+    """How a table is partitioned on one of its integer columns.
+
+    method is "hash" (the rows are spread over partitions partitions named
+    p0, p1, ... by the value of the column modulo partitions), "range" or
+    "list". For "range", bounds is a tuple of (partition name, upper bound)
+    in increasing order, the last bound being None for MAXVALUE. For
+    "list", it is a tuple of (partition name, tuple of values), None being
+    the value of the rows without any. The column must be part of the
+    natural key of the table, which is unique in incremental mode.
+    """
+
+    method: str
+    column: str
+    partitions: int = 0
+    bounds: tuple = ()
+
+    def names(self):
+        """Return the names of the partitions, in order"""
+        if self.method == "hash":
+            return [f"p{i}" for i in range(self.partitions)]
+        return [name for name, _ in self.bounds]
+
+    def clause(self):
+        """Return the PARTITION BY clause of the table"""
+        if self.method == "hash":
+            return f"partition by hash (`{self.column}`) partitions {self.partitions}"
+        if self.method == "range":
+            definitions = [
+                f"partition `{name}` values less than "
+                + ("maxvalue" if bound is None else f"({bound})")
+                for name, bound in self.bounds
+            ]
+        elif self.method == "list":
+            definitions = [
+                f"partition `{name}` values in "
+                f"({', '.join('null' if v is None else str(v) for v in values)})"
+                for name, values in self.bounds
+            ]
+        else:
+            raise ValueError(f"Unknown partitioning method {self.method!r}")
+        return (
+            f"partition by {self.method} (`{self.column}`) ({', '.join(definitions)})"
+        )
+
+
+# Declarations of the partitioning of the large fact tables, by name.
+# With "work_id", they are joined to each other on work_id, so a painting's
+# rows are in the same partition of each table. With "museum_id", work is
+# partitioned by ranges of museums (the paintings without a museum alone in
+# the first one), so a filter on museum_id reads only some partitions. It
+# can't be used in incremental mode, museum_id not being part of the
+# natural key of work.
+partitionings = {
+    "work_id": {
+        "work": Partitioning("hash", "work_id", 8),
+        "product_size": Partitioning("hash", "work_id", 8),
+        "subject": Partitioning("hash", "work_id", 8),
+    },
+    "museum_id": {
+        "work": Partitioning(
+            "range",
+            "museum_id",
+            bounds=(
+                ("p_none", 1),
+                ("p1", 9),
+                ("p2", 17),
+                ("p3", 25),
+                ("p4", 33),
+                ("p5", 41),
+                ("p6", 49),
+                ("p7", None),
+            ),
+        ),
+        "product_size": Partitioning("hash", "work_id", 8),
+        "subject": Partitioning("hash", "work_id", 8),
+    },
+}
+partitioning = partitionings[PARTITIONING]
+
+# Columns identifying a row of each table, used to upsert rows in incremental mode
+natural_keys = {
+    "artist": ["artist_id"],
+    "canvas_size": ["size_id"],
+    "image_link": ["work_id"],
+    "museum_hours": ["museum_id", "day"],
+    "museum": ["museum_id"],
+    "product_size": ["work_id", "size_id"],
+    "subject": ["work_id", "subject"],
+    "work": ["work_id"],
+}
+
+
+# Explicit column types for each csv file, so that every chunk of a
+# file is parsed the same way (type inference differs from chunk to chunk)
+dtypes = {
+    "artist": {
+        "artist_id": "Int64",
+        "full_name": "string",
+        "first_name": "string",
+        "middle_names": "string",
+        "last_name": "string",
+        "nationality": "string",
+        "style": "string",
+        "birth": "Int64",
+        "death": "Int64",
+    },
+    "canvas_size": {
+        "size_id": "Int64",
+        "width": "Int64",
+        "height": "Int64",
+        "label": "string",
+    },
+    "image_link": {
+        "work_id": "Int64",
+        "url": "string",
+        "thumbnail_small_url": "string",
+        "thumbnail_large_url": "string",
+    },
+    "museum_hours": {
+        "museum_id": "Int64",
+        "day": "string",
+        "open": "string",
+        "close": "string",
+    },
+    "museum": {
+        "museum_id": "Int64",
+        "name": "string",
+        "address": "string",
+        "city": "string",
+        "state": "string",
+        "postal": "string",
+        "country": "string",
+        "phone": "string",
+        "url": "string",
+    },
+    "product_size": {
+        "work_id": "Int64",
+        "size_id": "float64",  # some size ids are not integers (see Query 14)
+        "sale_price": "float64",
+        "regular_price": "float64",
+    },
+    "subject": {
+        "work_id": "Int64",
+        "subject": "string",
+    },
+    "work": {
+        "work_id": "Int64",
+        "name": "string",
+        "artist_id": "Int64",
+        "style": "string",
+        "museum_id": "Int64",
+    },
+}
+
+
+def stored_columns(name):
+    """Return the columns of a table which are written (not generated)"""
+    return [c.name for c in tables[name].columns if c.computed is None]
+
+
+def generated_columns(name):
+    """Return the generated columns of a table, by name, with their expression"""
+    return {
+        c.name: str(c.computed.sqltext)
+        for c in tables[name].columns
+        if c.computed is not None
+    }
+
+
+def table_as(name, target=None):
+    """Return a table of the schema, or a copy of it named target (e.g. its
+    staging table, whose indexes have the same names)"""
+    if target is None or target == name:
+        return tables[name]
+    return tables[name].to_metadata(MetaData(), name=target)
+
+
+def create_table(name, conn, indexes=True, target=None):
+    """(Re)create a table from the schema, partitioned if it is declared so.
+
+    With indexes=False, only the primary key is created: the secondary
+    indexes can be built after the data is loaded with create_indexes,
+    which is faster than maintaining them row by row.
+    With target, the table is created under that name instead.
+    """
+    table = table_as(name, target)
+    conn.execute(text(f"drop table if exists `{table.name}`"))
+    conn.execute(CreateTable(table))
+    if name in partitioning:
+        conn.execute(text(f"alter table `{table.name}` {partitioning[name].clause()}"))
+    if indexes:
+        create_indexes(name, conn, target)
+
+
+def create_indexes(name, conn, target=None):
+    """Create the secondary indexes of a table (or of its copy named target)
+    which don't exist yet"""
+    table = table_as(name, target)
+    existing = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(conn)
+
+
+def drop_indexes(name, conn):
+    """Drop the secondary indexes of a table"""
+    existing = {index["name"] for index in inspect(conn).get_indexes(name)}
+    for index in tables[name].indexes:
+        if index.name in existing:
+            index.drop(conn)
+
+
+def solution_queries(conn):
+    """Return the SQL of the read-only solutions of SQLSolutions.py (with the
+    default values of their parameters, and their stale summaries read from
+    their sources), by query id"""
+    from SQLSolutions import queries
+    from summaries import fresh_statements
+
+    return {
+        i: query.inline(fresh_statements(query, conn)[-1])
+        for i, query in queries.items()
+        if query.read_only
+    }
+
+
+def time_queries(conn, queries, repeat=3):
+    """Return the best execution time of each query (None if it failed)"""
+    timings = {}
+    for name, sql in queries.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                conn.execute(text(sql)).fetchall()
+            except Exception:
+                conn.rollback()
+                break
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    return timings
+
+
+def compare_indexes(conn, queries, repeat=3):
+    """Time queries without and with the secondary indexes of the schema"""
+    for name in tables:
+        drop_indexes(name, conn)
+    without_indexes = time_queries(conn, queries, repeat)
+    for name in tables:
+        create_indexes(name, conn)
+    with_indexes = time_queries(conn, queries, repeat)
+    return {name: (without_indexes[name], with_indexes[name]) for name in queries}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the indexes of the database")
+    parser.add_argument(
+        "action",
+        choices=["create-indexes", "drop-indexes", "compare"],
+        help="create or drop the secondary indexes, or compare query timings without and with them",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="executions of each query"
+    )
+    args = parser.parse_args()
+
+    # Create a database connection with SQLAlchemy (MySQL Server)
+    engine = make_engine()
+
+    with engine.connect() as conn:
+        if args.action == "create-indexes":
+            for name in tables:
+                create_indexes(name, conn)
+        elif args.action == "drop-indexes":
+            for name in tables:
+                drop_indexes(name, conn)
+        else:
+            print(f"{'query':<10}{'no indexes':>14}{'indexes':>14}")
+            for i, timings in compare_indexes(
+                conn, solution_queries(conn), args.repeat
+            ).items():
+                print(
+                    f"Query {i:<4}"
+                    + "".join(
+                        f"{t:>13.3f}s" if t is not None else f"{'failed':>14}"
+                        for t in timings
+                    )
+                )
+        conn.commit()
@@ -0,0 +1,219 @@
+"""This file contains an asyncio HTTP service answering the questions of
+    SQLSolutions.py, with one endpoint per query and request coalescing"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import parse_qsl, urlsplit
+import metrics
+from SQLSolutions import queries, run_on_backend, run_query
+from backends import DuckDBBackend, PandasBackend
+from database import make_async_engine
+from result_cache import ResultCache
+from configuration.config import (
+    DATA_DIR,
+    DUCKDB_PATH,
+    SERVICE_HOST,
+    SERVICE_PORT,
+    SERVICE_CONCURRENCY,
+)
+
+reasons = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found"}
+reasons.update({405: "Method Not Allowed", 500: "Internal Server Error"})
+
+
+def result_payload(query, result, elapsed):
+    """Return the JSON body answering a query"""
+    table = json.loads(
+        result.to_json(
+            orient="split", index=False, date_format="iso", default_handler=str
+        )
+    )
+    return json.dumps(
+        {
+            "id": query.id,
+            "question": query.question,
+            "columns": table["columns"],
+            "rows": table["data"],
+            "seconds": elapsed,
+        }
+    ).encode()
+
+
+class QueryService:
+    """Answers the read-only questions on a backend ("mysql", "duckdb" or "pandas").
+
+    At most concurrency queries are executed at the same time, and the
+    requests for a query which is already being executed wait for that
+    execution instead of starting another one (request coalescing).
+    """
+
+    def __init__(self, backend="mysql", concurrency=SERVICE_CONCURRENCY, cache=None):
+        self.backend = backend
+        self.cache = cache
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = {}
+        self.stats = {"requests": 0, "executions": 0, "errors": 0}
+        if backend == "mysql":
+            self.engine = make_async_engine(pool_size=concurrency)
+        elif backend == "duckdb":
+            self.engine = DuckDBBackend(DUCKDB_PATH, DATA_DIR)
+        elif backend == "pandas":
+            self.engine = PandasBackend(DATA_DIR)
+        else:
+            raise ValueError(f"Unknown backend {backend!r}")
+
+    async def run(self, query, params):
+        """Execute a query on the backend and return its result as a DataFrame"""
+        if self.backend == "mysql":
+            start = time.perf_counter()
+            async with self.engine.connect() as conn:
+                metrics.observe("pool_wait_seconds", time.perf_counter() - start)
+                return await conn.run_sync(
+                    lambda sync_conn: run_query(
+                        query, sync_conn, self.cache, params, prepared=True
+                    )
+                )
+        # The embedded backends are blocking: they run in a worker thread
+        return await asyncio.to_thread(run_on_backend, query, self.engine, params)
+
+    async def execute(self, query, params):
+        """Execute a query (once a slot is free) and return its JSON body"""
+        async with self.semaphore:
+            self.stats["executions"] += 1
+            start = time.perf_counter()
+            result = await self.run(query, params)
+            return result_payload(query, result, time.perf_counter() - start)
+
+    async def answer(self, query, params=None):
+        """Return the JSON body of a query, sharing the execution in flight if any"""
+        self.stats["requests"] += 1
+        arguments = query.arguments(params)
+        key = (query.id, tuple(sorted(arguments.items())))
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.execute(query, arguments))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # A cancelled request must not cancel the execution the others wait for
+        return await asyncio.shield(task)
+
+    async def respond(self, method, target):
+        """Return the status and the JSON body answering a request"""
+        if method != "GET":
+            return 405, {"error": "only GET is supported"}
+        url = urlsplit(target)
+        parts = url.path.strip("/").split("/")
+        if parts == ["queries"]:
+            return 200, [
+                {
+                    "id": q.id,
+                    "question": q.question,
+                    "read_only": q.read_only,
+                    "params": {p.name: p.default for p in q.params},
+                }
+                for q in queries.values()
+            ]
+        if parts == ["stats"]:
+            return 200, {**self.stats, "in_flight": len(self.in_flight)}
+        if parts == ["metrics"]:
+            return 200, metrics.registry.prometheus()
+        if len(parts) != 2 or parts[0] != "queries" or not parts[1].isdigit():
+            return 404, {"error": f"no endpoint {target}"}
+        query = queries.get(int(parts[1]))
+        if query is None:
+            return 404, {"error": f"unknown query {parts[1]}"}
+        if not query.read_only:
+            return 403, {"error": f"query {query.id} modifies the database"}
+        # The parameters of the query are given in the query string (e.g. ?n=10)
+        params = dict(parse_qsl(url.query))
+        try:
+            query.arguments(params)
+        except (KeyError, ValueError) as error:
+            return 400, {"error": str(error).strip('"')}
+        try:
+            return 200, await self.answer(query, params)
+        except Exception as error:
+            self.stats["errors"] += 1
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+
+    async def handle(self, reader, writer):
+        """Serve the HTTP/1.1 requests of a connection (kept alive between requests)"""
+        try:
+            while request_line := await reader.readline():
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get("content-length", 0)):
+                    await reader.readexactly(int(headers["content-length"]))
+
+                status, body = await self.respond(method, target)
+                # The metrics are Prometheus text, the other bodies are JSON
+                content_type = "application/json"
+                if isinstance(body, str):
+                    content_type = "text/plain; version=0.0.4"
+                    body = body.encode()
+                elif not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                writer.write(
+                    f"{version} {status} {reasons[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass  # the client went away or sent a malformed request
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        """Serve the requests until cancelled"""
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving the {self.backend} backend on http://{host}:{port}/queries")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve my SQL solutions over HTTP")
+    parser.add_argument("--host", default=SERVICE_HOST, help="address to listen on")
+    parser.add_argument(
+        "--port", type=int, default=SERVICE_PORT, help="port to listen on"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["mysql", "duckdb", "pandas"],
+        default="mysql",
+        help="answer with the MySQL server (asyncmy driver), DuckDB or pandas",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=SERVICE_CONCURRENCY,
+        help="number of queries executed at the same time",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="don't use the cache of results (MySQL)"
+    )
+    args = parser.parse_args()
+
+    async def main():
+        cache = None if args.no_cache else ResultCache()
+        service = QueryService(args.backend, args.concurrency, cache)
+        await service.serve(args.host, args.port)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
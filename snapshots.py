@@ -0,0 +1,164 @@
+"""This file contains the Parquet snapshots of the csv files: each table is
+    parsed once and then read from a typed, compressed, memory-mapped file"""
+
+import argparse
+import hashlib
+import json
+import os
+import pandas as pd
+import schema
+from configuration.config import DATA_DIR, SNAPSHOT_DIR, CHUNK_SIZE
+
+
+def csv_path(table, data_dir=DATA_DIR):
+    """Return the path of the csv file of a table"""
+    return os.path.join(data_dir, f"{table}.csv")
+
+
+def snapshot_path(table, snapshot_dir=SNAPSHOT_DIR):
+    """Return the path of the Parquet snapshot of a table"""
+    return os.path.join(snapshot_dir, f"{table}.parquet")
+
+
+def sha256(path):
+    """Return the sha256 of a file, read 1 MB at a time"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_source(path):
+    """Return the fingerprint of the csv file a snapshot was built from, or None"""
+    import pyarrow.parquet as pq
+
+    if not os.path.exists(path):
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    source = metadata.get(b"source")
+    return json.loads(source) if source else None
+
+
+def is_fresh(table, data_dir=DATA_DIR, snapshot_dir=SNAPSHOT_DIR):
+    """Check whether the snapshot of a table is up to date with its csv file.
+
+    The size and modification time of the csv file are compared first, and
+    its sha256 only when they differ (e.g. the file was copied again).
+    """
+    source = snapshot_source(snapshot_path(table, snapshot_dir))
+    if source is None:
+        return False
+    stat = os.stat(csv_path(table, data_dir))
+    if (stat.st_size, stat.st_mtime) == (source["size"], source["mtime"]):
+        return True
+    return (
+        stat.st_size == source["size"]
+        and sha256(csv_path(table, data_dir)) == source["sha256"]
+    )
+
+
+def build_snapshot(
+    table, data_dir=DATA_DIR, snapshot_dir=SNAPSHOT_DIR, chunk_size=CHUNK_SIZE
+):
+    """Convert the csv file of a table to a zstd-compressed Parquet file.
+
+    The csv file is parsed chunk_size rows at a time with the types of the
+    schema, and the fingerprint of the csv file is stored in the metadata
+    of the snapshot. Returns the number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = csv_path(table, data_dir)
+    stat = os.stat(path)
+    source = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256(path)}
+    os.makedirs(snapshot_dir, exist_ok=True)
+    target = snapshot_path(table, snapshot_dir)
+    partial = f"{target}.partial"
+
+    def open_writer(arrow_schema):
+        metadata = {**(arrow_schema.metadata or {}), b"source": json.dumps(source)}
+        return pq.ParquetWriter(
+            partial, arrow_schema.with_metadata(metadata), compression="zstd"
+        )
+
+    writer, rows = None, 0
+    try:
+        for chunk in pd.read_csv(
+            path, dtype=schema.dtypes.get(table), chunksize=chunk_size
+        ):
+            batch = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = open_writer(batch.schema)
+            writer.write_table(batch.cast(writer.schema))
+            rows += len(chunk)
+        if writer is None:  # csv file without rows
+            empty = pd.read_csv(path, dtype=schema.dtypes.get(table), nrows=0)
+            batch = pa.Table.from_pandas(empty, preserve_index=False)
+            writer = open_writer(batch.schema)
+            writer.write_table(batch.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(partial, target)  # readers never see a partially written snapshot
+    return rows
+
+
+def ensure_snapshot(
+    table, data_dir=DATA_DIR, snapshot_dir=SNAPSHOT_DIR, chunk_size=CHUNK_SIZE
+):
+    """Build the snapshot of a table if it is missing or stale.
+
+    Returns True if it was (re)built.
+    """
+    if is_fresh(table, data_dir, snapshot_dir):
+        return False
+    build_snapshot(table, data_dir, snapshot_dir, chunk_size)
+    return True
+
+
+def read_snapshot(table, columns=None, snapshot_dir=SNAPSHOT_DIR):
+    """Read the snapshot of a table (only the given columns) with a memory map"""
+    import pyarrow.parquet as pq
+
+    return pq.read_table(
+        snapshot_path(table, snapshot_dir), columns=columns, memory_map=True
+    ).to_pandas()
+
+
+def iter_snapshot(
+    table, chunk_size=CHUNK_SIZE, columns=None, snapshot_dir=SNAPSHOT_DIR
+):
+    """Read the snapshot of a table chunk_size rows at a time, as DataFrames"""
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(snapshot_path(table, snapshot_dir), memory_map=True)
+    for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the Parquet snapshots of the csv files"
+    )
+    parser.add_argument(
+        "tables",
+        nargs="*",
+        default=list(schema.tables),
+        help="tables to snapshot (all of them by default)",
+    )
+    parser.add_argument(
+        "--data-dir", default=DATA_DIR, help="directory containing the csv files"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="rebuild even the fresh snapshots"
+    )
+    args = parser.parse_args()
+
+    for table in args.tables:
+        if args.force or not is_fresh(table, args.data_dir):
+            rows = build_snapshot(table, args.data_dir)
+            print(f"{table}: snapshot built ({rows} rows)")
+        else:
+            print(f"{table}: snapshot up to date")
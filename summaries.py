@@ -0,0 +1,240 @@
+"""This file contains the summary tables of the famous painting database:
+    painting counts precomputed by the loader for the popularity questions"""
+
+import argparse
+import json
+import re
+import time
+from dataclasses import dataclass
+from sqlalchemy import bindparam, inspect, text
+from database import make_engine
+
+
+@dataclass(frozen=True)
+class Summary:
+    """An aggregate of tables of the database, stored in its own table.
+
+    sources are the tables it is computed from (it is refreshed when one of
+    them is reloaded, and stale when one of them was written since its last
+    refresh), and index the columns its queries sort on.
+    """
+
+    name: str
+    sources: tuple
+    select: str
+    index: tuple
+
+
+# Summary tables, by name
+summaries = {
+    summary.name: summary
+    for summary in [
+        Summary(
+            "summary_work_by_museum",  # Query 12
+            ("work",),
+            "select museum_id, count(name) as cnt_paintings from work group by museum_id",
+            ("cnt_paintings",),
+        ),
+        Summary(
+            "summary_work_by_artist",  # Query 13
+            ("work",),
+            "select artist_id, count(name) as cnt_paintings from work group by artist_id",
+            ("cnt_paintings",),
+        ),
+        Summary(
+            "summary_work_by_style",  # Query 16, 21
+            ("work",),
+            "select style, count(name) as cnt_paintings, count(style) as cnt_style "
+            "from work group by style",
+            ("cnt_style",),
+        ),
+        Summary(
+            "summary_work_by_museum_style",  # Query 16
+            ("work",),
+            "select museum_id, style, count(*) as cnt_work from work "
+            "group by museum_id, style",
+            ("style", "cnt_work"),
+        ),
+        Summary(
+            "summary_work_by_country",  # Query 20
+            ("work", "museum"),
+            "select m.country, count(w.name) as cnt_paintings from work as w "
+            "join museum as m on (w.museum_id = m.museum_id) group by m.country",
+            ("cnt_paintings",),
+        ),
+        Summary(
+            "summary_countries_by_artist",  # Query 17
+            ("work", "museum"),
+            "select w.artist_id, count(distinct m.country) as cnt_country from work as w "
+            "join museum as m on (w.museum_id = m.museum_id) group by w.artist_id",
+            ("cnt_country",),
+        ),
+    ]
+}
+
+
+def summaries_of(tables):
+    """Return the summaries computed from any of the given tables"""
+    tables = set(tables)
+    return [s for s in summaries.values() if tables & set(s.sources)]
+
+
+def refresh_statements(summary, exists=True):
+    """Return the SQL statements recomputing a summary table.
+
+    The summary is computed into a staging table, which then replaces the
+    current one in a single atomic RENAME TABLE, so the queries reading it
+    never see it empty.
+    """
+    name = summary.name
+    staging, old = f"{name}__staging", f"{name}__old"
+    columns = ", ".join(f"`{c}`" for c in summary.index)
+    rename = (
+        f"rename table `{name}` to `{old}`, `{staging}` to `{name}`"
+        if exists
+        else f"rename table `{staging}` to `{name}`"
+    )
+    statements = [
+        f"drop table if exists `{staging}`, `{old}`",
+        f"create table `{staging}` as {summary.select}",
+        f"create index `ix_{name}` on `{staging}` ({columns})",
+        rename,
+    ]
+    if exists:
+        statements.append(f"drop table `{old}`")
+    return statements
+
+
+def ensure_summary_state(conn):
+    """Create the table storing the versions of the sources of each summary
+    when it was last refreshed (once per pooled connection)"""
+    if not conn.connection.info.get("summary_state"):
+        conn.execute(text("""
+                create table if not exists summary_state (
+                    name varchar(64) primary key,
+                    source_versions text not null
+                )
+                """))
+        conn.connection.info["summary_state"] = True
+
+
+def refresh_summary(summary, conn):
+    """Recompute a summary table and return its number of rows.
+
+    The versions of its sources are recorded, to tell when it goes stale.
+    """
+    from result_cache import table_versions
+
+    exists = inspect(conn).has_table(summary.name)
+    for statement in refresh_statements(summary, exists):
+        conn.execute(text(statement))
+    ensure_summary_state(conn)
+    conn.execute(
+        text("replace into summary_state values (:name, :versions)"),
+        {
+            "name": summary.name,
+            "versions": json.dumps(table_versions(conn, summary.sources)),
+        },
+    )
+    return conn.execute(text(f"select count(*) from `{summary.name}`")).scalar()
+
+
+def stale_summaries(conn, names, versions=None):
+    """Return the summaries among names whose sources were written since
+    their last refresh (by any means: see result_cache.table_versions), or
+    which were never refreshed.
+
+    versions are the current versions of their sources, if already read.
+    """
+    from result_cache import table_versions
+
+    if not names:
+        return set()
+    ensure_summary_state(conn)
+    recorded = dict(
+        conn.execute(
+            text(
+                "select name, source_versions from summary_state where name in :names"
+            ).bindparams(bindparam("names", expanding=True)),
+            {"names": list(names)},
+        ).fetchall()
+    )
+    if versions is None:
+        sources = {source for name in names for source in summaries[name].sources}
+        versions = table_versions(conn, sources)
+    return {
+        name
+        for name in names
+        if name not in recorded
+        or json.loads(recorded[name])
+        != {source: versions.get(source) for source in summaries[name].sources}
+    }
+
+
+def fresh_statements(query, conn, versions=None):
+    """Return the statements of a solution, the stale summaries it reads
+    replaced with their select (see inline_summaries).
+
+    versions are the current versions of the tables it depends on, if
+    already read (see result_cache.dependent_tables).
+    """
+    from result_cache import referenced_tables
+
+    names = [table for table in referenced_tables(query.sql) if table in summaries]
+    stale = stale_summaries(conn, names, versions)
+    return [inline_summaries(statement, stale) for statement in query.statements]
+
+
+# Words which may follow a table name in a from or join clause, other than an alias
+clause_words = {"as", "where", "join", "inner", "left", "right", "cross", "natural"}
+clause_words |= {"on", "using", "group", "order", "limit", "having", "union", "window"}
+
+
+def inline_summaries(sql, names):
+    """Replace the summaries named names read by a SQL text with their select,
+    so the text reads the tables they are computed from (e.g. when they are
+    stale). The derived tables keep the name of the summary as alias, unless
+    the text gives them another one."""
+    for name in names:
+        pattern = re.compile(
+            rf"\b(from|join)(\s+)`?{name}\b`?(?=(\s+(\w+))?)", re.IGNORECASE
+        )
+
+        def derived(match):
+            alias = match.group(4)
+            select = f"{match.group(1)}{match.group(2)}({summaries[name].select})"
+            if alias is not None and (
+                alias.lower() == "as" or alias.lower() not in clause_words
+            ):
+                return select  # the text gives an alias
+            return f"{select} as {name}"
+
+        sql = pattern.sub(derived, sql)
+    return sql
+
+
+def refresh_summaries(conn, tables=None):
+    """Recompute the summaries computed from the given tables (all of them by default).
+
+    Yields the name, the number of rows and the refresh time of each summary.
+    """
+    for summary in summaries.values() if tables is None else summaries_of(tables):
+        start = time.perf_counter()
+        rows = refresh_summary(summary, conn)
+        yield summary.name, rows, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute the summary tables")
+    parser.add_argument(
+        "tables",
+        nargs="*",
+        help="refresh the summaries computed from these tables (all of them by default)",
+    )
+    args = parser.parse_args()
+
+    # Create a database connection with SQLAlchemy (MySQL Server)
+    engine = make_engine()
+    with engine.begin() as conn:
+        for name, rows, elapsed in refresh_summaries(conn, args.tables or None):
+            print(f"{name}: {rows} rows in {elapsed:.2f}s")
@@ -0,0 +1,280 @@
+"""This file contains the data-quality rules checked while loading the csv
+    files: the rows breaking them are quarantined or flagged"""
+
+from dataclasses import dataclass
+from datetime import time
+from typing import Callable
+import pandas as pd
+from sqlalchemy import Column, DateTime, MetaData, String, Table, func, text
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A data-quality rule on the rows of a table.
+
+    check returns True for the rows of a chunk breaking the rule, and
+    condition is the same test in SQL. The rows breaking a "quarantine"
+    rule are moved to the quarantine table of their table, the ones
+    breaking a "flag" rule are kept with their flag column (named after the
+    rule) true: a column generated by the server from condition (see
+    schema.flag_columns), check computing it for the rows held by pandas.
+    """
+
+    table: str
+    name: str
+    action: str
+    check: Callable
+    condition: str
+
+
+def is_true(values):
+    """Turn a boolean Series with missing values into a numpy array (missing -> False)"""
+    return values.fillna(False).astype(bool).to_numpy()
+
+
+rules = [
+    Rule(
+        "artist",
+        "missing_artist_id",
+        "quarantine",
+        lambda chunk: chunk["artist_id"].isna().to_numpy(),
+        "artist_id is null",
+    ),
+    Rule(
+        "canvas_size",
+        "missing_size_id",
+        "quarantine",
+        lambda chunk: chunk["size_id"].isna().to_numpy(),
+        "size_id is null",
+    ),
+    Rule(
+        "museum",
+        "missing_museum_id",
+        "quarantine",
+        lambda chunk: chunk["museum_id"].isna().to_numpy(),
+        "museum_id is null",
+    ),
+    Rule(  # Query 7
+        "museum",
+        "invalid_city",
+        "flag",
+        lambda chunk: is_true(chunk["city"].str.fullmatch(r"[0-9]+")),
+        "regexp_like(city, '^[0-9]+$')",
+    ),
+    Rule(  # Query 8
+        "museum_hours",
+        "invalid_open_time",
+        "flag",
+        lambda chunk: chunk["open_time"]
+        .map(lambda t: t is not None and t >= time(12, 1))
+        .to_numpy(dtype=bool),
+        "open_time >= '12:01:00'",
+    ),
+    Rule(
+        "product_size",
+        "negative_price",
+        "quarantine",
+        lambda chunk: is_true((chunk["sale_price"] < 0) | (chunk["regular_price"] < 0)),
+        "sale_price < 0 or regular_price < 0",
+    ),
+    Rule(  # Query 3
+        "product_size",
+        "sale_above_regular",
+        "flag",
+        lambda chunk: is_true(chunk["sale_price"] > chunk["regular_price"]),
+        "sale_price > regular_price",
+    ),
+    Rule(  # Query 4
+        "product_size",
+        "sale_below_half",
+        "flag",
+        lambda chunk: is_true(chunk["sale_price"] < 0.5 * chunk["regular_price"]),
+        "sale_price < 0.5 * regular_price",
+    ),
+]
+
+
+def rules_of(table, action=None):
+    """Return the rules of a table (only the ones with the given action)"""
+    return [
+        rule for rule in rules if rule.table == table and action in (None, rule.action)
+    ]
+
+
+def quarantine_table(table, target=None):
+    """Return the quarantine table of a table (or of the table named target,
+    e.g. its staging table): the columns of its csv file, the rule the row
+    broke and when it was quarantined"""
+    import schema  # schema imports the rules to generate the flag columns
+
+    return Table(
+        f"{target or table}__quarantine",
+        MetaData(),
+        *[
+            Column(name, schema.tables[table].c[name].type)
+            for name in schema.dtypes[table]
+        ],
+        Column("rule", String(64)),
+        Column("quarantined_at", DateTime, server_default=func.now()),
+    )
+
+
+def ensure_validation_tables(conn):
+    """Create the table storing the summary of the last validation of each table"""
+    conn.execute(text("""
+            create table if not exists validation_summary (
+                table_name varchar(64) not null,
+                rule varchar(64) not null,
+                action varchar(16) not null,
+                rows_checked bigint not null,
+                rows_broken bigint not null,
+                checked_at timestamp default current_timestamp,
+                primary key (table_name, rule)
+            )
+            """))
+
+
+def reset_quarantine(table, conn, target=None):
+    """(Re)create the empty quarantine table of a table, or of the table named
+    target (if it has quarantine rules)"""
+    if rules_of(table, "quarantine"):
+        quarantine = quarantine_table(table, target)
+        quarantine.drop(conn, checkfirst=True)
+        quarantine.create(conn)
+
+
+def record_summary(table, conn, counts, checked, target=None, accumulate=False):
+    """Replace the validation summary of a table (stored under the name of
+    target if it is given) by the counts of rows breaking each rule, or add
+    them to it with accumulate=True (e.g. for the rows of an incremental load)"""
+    target = target or table
+    if accumulate:
+        previous = conn.execute(
+            text(
+                "select rule, rows_checked, rows_broken from validation_summary "
+                "where table_name = :t"
+            ),
+            {"t": target},
+        ).fetchall()
+        counts = dict(counts)
+        for rule, _, rows_broken in previous:
+            counts[rule] = counts.get(rule, 0) + rows_broken
+        checked += max((row.rows_checked for row in previous), default=0)
+    conn.execute(
+        text("delete from validation_summary where table_name = :t"), {"t": target}
+    )
+    for rule in rules_of(table):
+        conn.execute(
+            text(
+                "insert into validation_summary "
+                "(table_name, rule, action, rows_checked, rows_broken) "
+                "values (:t, :rule, :action, :checked, :broken)"
+            ),
+            {
+                "t": target,
+                "rule": rule.name,
+                "action": rule.action,
+                "checked": checked,
+                "broken": counts.get(rule.name, 0),
+            },
+        )
+
+
+def apply_rules(table, chunk, counts=None):
+    """Check the rules of a table on a chunk of its rows.
+
+    Returns the rows to store, with a flag column per "flag" rule, and the
+    rows to quarantine, with the first "quarantine" rule they broke.
+    The number of rows breaking each rule is added to counts.
+    """
+    import schema
+
+    counts = {} if counts is None else counts
+    quarantined = pd.Series(None, index=chunk.index, dtype=object)
+    for rule in rules_of(table, "quarantine"):
+        broken = rule.check(chunk)
+        counts[rule.name] = counts.get(rule.name, 0) + int(broken.sum())
+        quarantined = quarantined.mask(
+            broken & quarantined.isna().to_numpy(), rule.name
+        )
+    kept = chunk[quarantined.isna().to_numpy()]
+    flags = {}
+    for rule in rules_of(table, "flag"):
+        flags[rule.name] = rule.check(kept)
+        counts[rule.name] = counts.get(rule.name, 0) + int(flags[rule.name].sum())
+    rejected = chunk.loc[quarantined.notna().to_numpy(), list(schema.dtypes[table])]
+    return kept.assign(**flags), rejected.assign(rule=quarantined.dropna())
+
+
+def validate_chunks(table, chunks, conn, reset=True, target=None):
+    """Check the rules of a table on each chunk of its rows while it is loaded
+    (into the table named target, if it is given).
+
+    The rows to store are yielded with their flag columns, the others are
+    written to the quarantine table (emptied first if reset is True). Once
+    the chunks are consumed, the validation summary of the table is recorded
+    (added to the previous one if reset is False).
+    The quarantine table and the summary are the ones of target, so loading
+    a staging table leaves those of the table untouched.
+    """
+    quarantine = quarantine_table(table, target)
+    if reset:
+        reset_quarantine(table, conn, target)
+    elif rules_of(table, "quarantine"):
+        quarantine.create(conn, checkfirst=True)
+    counts, checked = {}, 0
+    for chunk in chunks:
+        kept, rejected = apply_rules(table, chunk, counts)
+        if len(rejected):
+            rejected.to_sql(quarantine.name, con=conn, if_exists="append", index=False)
+        checked += len(chunk)
+        yield kept
+    record_summary(table, conn, counts, checked, target, accumulate=not reset)
+
+
+def validate_table(table, conn, target=None):
+    """Check the rules of a table on the rows already stored (after LOAD DATA),
+    in the table itself or in the table named target (e.g. its staging table).
+
+    The rows breaking a "quarantine" rule are moved to the quarantine table
+    (the one of target), then the rows flagged by the (generated) flag
+    columns are counted. Returns the number of rows quarantined.
+    """
+    import schema
+
+    target = target or table
+    reset_quarantine(table, conn, target)
+    checked = conn.execute(text(f"select count(*) from `{target}`")).scalar()
+    counts = {}
+    columns = ", ".join(f"`{c}`" for c in schema.dtypes[table])
+    for rule in rules_of(table, "quarantine"):
+        conn.execute(
+            text(
+                f"insert into `{target}__quarantine` ({columns}, rule) "
+                f"select {columns}, '{rule.name}' from `{target}` "
+                f"where {rule.condition}"
+            )
+        )
+        counts[rule.name] = conn.execute(
+            text(f"delete from `{target}` where {rule.condition}")
+        ).rowcount
+    for rule in rules_of(table, "flag"):
+        counts[rule.name] = conn.execute(
+            text(f"select count(*) from `{target}` where `{rule.name}`")
+        ).scalar()
+    record_summary(table, conn, counts, checked, target)
+    return sum(counts.get(rule.name, 0) for rule in rules_of(table, "quarantine"))
+
+
+def validation_summary(conn, tables=None):
+    """Return the validation summary of the tables (all of them by default) as a DataFrame"""
+    rows = conn.execute(
+        text(
+            "select table_name, rule, action, rows_checked, rows_broken, checked_at "
+            "from validation_summary order by table_name, rule"
+        )
+    )
+    summary = pd.DataFrame(rows.fetchall(), columns=list(rows.keys()))
+    if tables is not None:
+        summary = summary[summary["table_name"].isin(tables)]
+    return summary.reset_index(drop=True)
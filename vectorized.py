@@ -0,0 +1,351 @@
+"""This file contains the answers to the questions of SQLSolutions.py computed
+with vectorized pandas operations, without any database round-trip"""
+
+from datetime import time
+import numpy as np
+import pandas as pd
+import schema
+from deduplication import deduplication_statements, tables_with_duplicates
+
+# Answer of each question, by query id (the same ids as SQLSolutions.queries).
+# Each function takes the tables (a mapping of DataFrames) and the values of
+# the parameters of the query, and returns a DataFrame with the columns of the
+# SQL solution.
+solutions = {}
+
+
+def solution(query_id):
+    """Register the function computing the answer of a query"""
+
+    def register(function):
+        solutions[query_id] = function
+        return function
+
+    return register
+
+
+def top(df, column, n, ascending=False):
+    """Return the first n rows of df ordered by column (stable on ties, like a
+    single-pass ORDER BY ... LIMIT n)"""
+    order = np.argsort(
+        df[column].to_numpy(dtype="float64", na_value=np.nan)
+        * (1 if ascending else -1),
+        kind="stable",
+    )
+    return df.iloc[order[:n]]
+
+
+def count_by(df, keys, column=None, name="cnt"):
+    """count(column) (count(*) without column) of df grouped by keys, NULL keys included"""
+    grouped = df.groupby(keys, dropna=False, sort=False)
+    counts = grouped.size() if column is None else grouped[column].count()
+    return counts.rename(name).reset_index()
+
+
+@solution(1)
+def paintings_not_displayed(tables):
+    work = tables["work"]
+    return work.loc[work["museum_id"].isna(), ["name"]].drop_duplicates()
+
+
+@solution(2)
+def museums_without_paintings(tables):
+    museum, work = tables["museum"], tables["work"]
+    # The paintings without a museum don't hide the museums without paintings
+    keep = ~museum["museum_id"].isin(work["museum_id"].dropna())
+    return museum.loc[keep, ["museum_id"]]
+
+
+@solution(3)
+def asking_price_above_regular(tables):
+    ps = tables["product_size"]
+    return ps.loc[ps["sale_price"] > ps["regular_price"], ["work_id"]].drop_duplicates()
+
+
+@solution(4)
+def asking_price_below_half(tables):
+    ps = tables["product_size"]
+    ps = ps.loc[ps["sale_price"] < 0.5 * ps["regular_price"], ["work_id"]]
+    return ps.merge(tables["work"], on="work_id")[["name"]].drop_duplicates()
+
+
+@solution(5)
+def most_expensive_canvas_size(tables):
+    cs = tables["canvas_size"][["size_id"]]
+    ps = tables["product_size"][["size_id", "sale_price"]]
+    # The size ids of product_size are floats
+    joined = cs.assign(key=cs["size_id"].astype("Float64")).merge(
+        ps.rename(columns={"size_id": "key"}), on="key"
+    )
+    return top(joined[["size_id", "sale_price"]].drop_duplicates(), "sale_price", 1)
+
+
+@solution(6)
+def delete_duplicates(tables):
+    from SQLSolutions import queries
+
+    for table in tables_with_duplicates:
+        tables[table] = tables[table].drop_duplicates(ignore_index=True)
+    # One count per statement of the SQL solution: only the INSERT of the
+    # rebuild of each table affects rows
+    inserts = {
+        statement: table
+        for table in tables_with_duplicates
+        for statement in deduplication_statements(table)
+        if statement.startswith("insert")
+    }
+    return pd.DataFrame(
+        {
+            "affected_rows": [
+                len(tables[inserts[s]]) if s in inserts else 0
+                for s in queries[6].statements
+            ]
+        }
+    )
+
+
+@solution(7)
+def museums_with_invalid_city(tables):
+    museum = tables["museum"]
+    invalid = museum["city"].str.fullmatch(r"[0-9]+").fillna(False).astype(bool)
+    return museum.loc[invalid, list(schema.dtypes["museum"])]
+
+
+@solution(8)
+def delete_invalid_hours(tables):
+    hours = tables["museum_hours"]
+    invalid = (
+        hours["open_time"].map(lambda t: t is not None and t >= time(12, 1)).to_numpy()
+    )
+    tables["museum_hours"] = hours[~invalid].reset_index(drop=True)
+    return pd.DataFrame({"affected_rows": [int(invalid.sum())]})
+
+
+@solution(9)
+def top_subjects(tables, n):
+    counts = count_by(tables["subject"], "subject", "subject", "cnt_subject")
+    return top(counts, "cnt_subject", n)
+
+
+@solution(10)
+def museums_open_sunday_and_monday(tables, first_day, second_day):
+    hours = tables["museum_hours"]
+    open_days = (
+        hours["day_of_week"]
+        .isin([first_day, second_day])
+        .astype(int)
+        .rename("open_sunday_monday")
+    )
+    open_days = open_days.groupby(hours["museum_id"]).sum().reset_index()
+    museums = open_days.loc[open_days["open_sunday_monday"] == 2, ["museum_id"]]
+    return museums.merge(tables["museum"], on="museum_id")[["name", "city"]]
+
+
+@solution(11)
+def museums_open_every_day(tables):
+    counts = count_by(tables["museum_hours"], "museum_id", "day_of_week", "cnt_day")
+    return pd.DataFrame({"cnt_open_every_day": [int((counts["cnt_day"] == 7).sum())]})
+
+
+@solution(12)
+def top_museums(tables, n):
+    work = tables["work"]
+    counts = count_by(
+        work[work["museum_id"].notna()], "museum_id", "name", "cnt_paintings"
+    )
+    return top(counts, "cnt_paintings", n).merge(tables["museum"], on="museum_id")[
+        ["museum_id", "cnt_paintings", "name", "city"]
+    ]
+
+
+@solution(13)
+def top_artists(tables, n):
+    counts = count_by(tables["work"], "artist_id", "name", "cnt_paintings")
+    return top(counts, "cnt_paintings", n).merge(tables["artist"], on="artist_id")[
+        ["artist_id", "cnt_paintings", "full_name", "nationality", "style"]
+    ]
+
+
+@solution(14)
+def least_popular_canvas_sizes(tables, n):
+    ps = tables["product_size"]
+    ps = ps[ps["size_id"] == ps["size_id"].round()]
+    counts = count_by(ps, "size_id", "work_id", "cnt_work")
+    counts["rnk"] = counts["cnt_work"].rank(method="dense").astype("int64")
+    return counts[counts["rnk"] <= n]
+
+
+@solution(15)
+def longest_opening_day(tables):
+    hours = tables["museum_hours"]
+    durations = hours["open_duration"].dropna()
+    longest = hours[
+        hours["open_duration"] == (durations.max() if len(durations) else None)
+    ]
+    return longest.merge(tables["museum"], on="museum_id")[
+        ["name", "state", "day", "open", "close", "open_duration"]
+    ].rename(columns={"state": "city", "open_duration": "duration_in_hour (hh mi ss)"})
+
+
+@solution(16)
+def museum_with_most_popular_style(tables):
+    work = tables["work"]
+    style = top(count_by(work, "style", "name"), "cnt", 1)["style"]
+    work = work[work["style"].isin(style.dropna()) & work["museum_id"].notna()]
+    counts = (
+        work.groupby("museum_id")
+        .agg(cnt_most_pop_painting=("style", "size"), style=("style", "min"))
+        .reset_index()
+    )
+    return top(counts, "cnt_most_pop_painting", 1).merge(
+        tables["museum"], on="museum_id"
+    )[["museum_id", "name", "city", "style", "cnt_most_pop_painting"]]
+
+
+@solution(17)
+def artists_in_multiple_countries(tables):
+    joined = tables["museum"][["museum_id", "country"]].merge(
+        tables["work"][["museum_id", "artist_id"]], on="museum_id"
+    )
+    counts = (
+        joined.groupby("artist_id", dropna=False)["country"]
+        .nunique()
+        .rename("cnt_country")
+        .reset_index()
+    )
+    counts = counts[counts["cnt_country"] >= 2].merge(tables["artist"], on="artist_id")
+    return top(counts, "cnt_country", len(counts))[
+        ["artist_id", "cnt_country", "full_name", "nationality", "style"]
+    ]
+
+
+@solution(18)
+def city_and_country_with_most_museums(tables):
+    museum = tables["museum"]
+
+    def most_museums(column):
+        counts = (
+            museum.groupby(column, dropna=False, sort=False)["museum_id"]
+            .nunique()
+            .rename("cnt")
+            .reset_index()
+        )
+        return counts[counts["cnt"] == counts["cnt"].max()]
+
+    # The best cities and countries are cross joined, as in the SQL solution
+    cities, countries = most_museums("city"), most_museums("country")
+    pairs = cities.merge(countries, how="cross", suffixes=("_city", "_country"))
+    return pd.DataFrame(
+        {
+            "cities": [",".join(pairs["city"].dropna())],
+            "cnt_museum_city": [pairs["cnt_city"].max()],
+            "country": [",".join(pairs["country"].dropna() + " ")],
+            "cnt_museum_country": [pairs["cnt_country"].max()],
+        }
+    )
+
+
+@solution(19)
+def least_and_most_expensive(tables):
+    ps = tables["product_size"]
+    prices = ps["sale_price"]
+    extremes = ps.loc[
+        (prices == prices.min()) | (prices == prices.max()),
+        ["work_id", "sale_price", "size_id"],
+    ].drop_duplicates()
+    work = tables["work"][["work_id", "name", "artist_id", "museum_id"]].rename(
+        columns={"name": "painting_name"}
+    )
+    museum = tables["museum"][["museum_id", "name", "city"]].rename(
+        columns={"name": "museum_name"}
+    )
+    canvas = tables["canvas_size"][["size_id", "label"]]
+    canvas = canvas.assign(size_id=canvas["size_id"].astype("Float64"))
+    joined = (
+        extremes.merge(work, on="work_id")
+        .merge(tables["artist"][["artist_id", "full_name"]], on="artist_id")
+        .merge(museum, on="museum_id")
+        .merge(canvas, on="size_id")
+    )
+    return joined[
+        ["painting_name", "sale_price", "full_name", "museum_name", "city", "label"]
+    ]
+
+
+@solution(20)
+def country_with_5th_most_paintings(tables, rank):
+    joined = tables["work"][["museum_id", "name"]].merge(
+        tables["museum"][["museum_id", "country"]], on="museum_id"
+    )
+    counts = count_by(joined, "country", "name", "cnt_painting")
+    counts["rnk"] = (
+        counts["cnt_painting"].rank(method="min", ascending=False).astype("int64")
+    )
+    return counts[counts["rnk"] == rank]
+
+
+@solution(21)
+def most_and_least_popular_styles(tables, n):
+    work = tables["work"]
+    counts = count_by(work[work["style"].notna()], "style", "style", "cnt_style")
+    return pd.concat(
+        [
+            top(counts, "cnt_style", n, ascending=True).assign(
+                popularity="least popular"
+            ),
+            top(counts, "cnt_style", n).assign(popularity="most popular"),
+        ],
+        ignore_index=True,
+    )
+
+
+@solution(22)
+def most_portraits_outside_usa(tables, country, subject):
+    paintings = (
+        tables["artist"][["artist_id", "full_name", "nationality"]]
+        .merge(
+            tables["work"][["work_id", "artist_id", "museum_id", "name"]],
+            on="artist_id",
+        )
+        .merge(tables["subject"], on="work_id")
+        .merge(tables["museum"][["museum_id", "country"]], on="museum_id")
+        .drop_duplicates()
+    )
+    paintings = paintings[
+        (paintings["country"] != country).fillna(False).astype(bool)
+        & (paintings["subject"] == subject).fillna(False).astype(bool)
+    ]
+    counts = paintings.groupby("artist_id")["artist_id"].transform("size")
+    paintings = paintings.assign(most_portrait_painting_outside_usa=counts)
+    best = paintings[counts == counts.max()]
+    return best[
+        ["full_name", "nationality", "most_portrait_painting_outside_usa"]
+    ].drop_duplicates()
+
+
+def comparable(result):
+    """Return the rows of a result as sorted tuples of comparable values"""
+    rows = []
+    for row in result.itertuples(index=False):
+        rows.append(
+            tuple(
+                (
+                    None
+                    if pd.isna(value)
+                    else (
+                        round(float(value), 6)
+                        if isinstance(value, (int, float, np.number))
+                        else str(value)
+                    )
+                )
+                for value in row
+            )
+        )
+    return sorted(rows, key=repr)
+
+
+def same_result(expected, actual):
+    """Check whether two results have the same columns and rows (in any order)"""
+    return list(expected.columns) == list(actual.columns) and comparable(
+        expected
+    ) == comparable(actual)